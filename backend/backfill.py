@@ -0,0 +1,64 @@
+### Re-process archived pages (backfill) ###
+"""
+Rebuild the data of archived snapshots without a single network request.
+Every snapshot runs the normal pipeline (scraping -> combine -> scoring) in its own
+python process with the scraper in "archive" mode, writing to data/backfill/<date>.
+The folder is cleared first: a rebuild (e.g. after a parser change) re-parses every
+page instead of keeping the tables and squads its manifest still considers fresh.
+"""
+# Imports
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+
+# Local imports
+from classes.page_archive import PageArchive
+from functions.logger import get_logger
+from environment.variable import ARCHIVE_PATH, BACKFILL_PATH
+
+logger = get_logger(__name__)
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Function: Output folder of a snapshot
+def snapshot_path(snapshot: date) -> Path:
+    return Path(BACKFILL_PATH, snapshot.isoformat())
+
+# Function: Rebuild one snapshot in a separate process
+def rebuild_snapshot(snapshot: date, archive_path: Path = ARCHIVE_PATH) -> int:
+    target = snapshot_path(snapshot)
+    # Nothing of an earlier rebuild is reused
+    shutil.rmtree(target, ignore_errors=True)
+    target.mkdir(parents=True)
+    env = dict(
+        os.environ,
+        SCRAPER_MODE="archive",
+        ARCHIVE_DATE=snapshot.isoformat(),
+        ARCHIVE_PATH=str(Path(archive_path).resolve()),
+        DATA_PATH=str(target.resolve()),
+    )
+    with open(Path(target, "backfill.log"), "w") as log:
+        result = subprocess.run([sys.executable, str(Path(ROOT, "main.py"))], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    if result.returncode != 0:
+        logger.error("Backfill of %s failed (see %s)", snapshot, Path(target, "backfill.log"))
+    else:
+        logger.info("Backfill of %s done: %s", snapshot, target)
+    return result.returncode
+
+# Function: Rebuild all archived snapshots in [start, end]
+def backfill(start: date | None = None, end: date | None = None, workers: int | None = None) -> dict:
+    snapshots = PageArchive(path=ARCHIVE_PATH).snapshots(start=start, end=end)
+    if not snapshots:
+        logger.info("No archived snapshots between %s and %s", start, end)
+        return {}
+    workers = workers or os.cpu_count() or 1
+    logger.info("Backfill of %d snapshots with %d processes", len(snapshots), workers)
+    # Threads only wait for the python processes doing the work
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        codes = list(pool.map(rebuild_snapshot, snapshots))
+
+    return dict(zip(snapshots, codes))
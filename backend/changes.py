@@ -0,0 +1,199 @@
+### Change feed of the refreshes ###
+"""
+Every refresh compares its players with the snapshot of the previous one and appends
+the players that moved to an append-only feed (one parquet file per refresh and source
+in CHANGE_PATH/feed), so consumers read the deltas instead of diffing the full sheets:
+    - new / removed players
+    - transfers (club changed)
+    - market value changes of at least CHANGE_VALUE_THRESHOLD (relative)
+    - rating changes of at least CHANGE_RATING_THRESHOLD points
+    - stats changes (any feature of the player's position group)
+Players are matched by a 64-bit hash of their identity, unchanged players by a hash of
+their tracked values; only the rows whose hash differs are compared field by field.
+If the club is part of the identity (namesakes are told apart by their club), a player
+who left one club and joined another in the same refresh is reported as a transfer.
+A change below its threshold is not reported and the snapshot keeps the last reported
+value, so slow drifts are reported once they add up.
+"""
+# Imports
+from __future__ import annotations
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Local imports
+from functions.logger import get_logger
+from functions.manifest import record_refresh
+from functions.utils import load_partition, store_partition
+from environment.variable import CHANGE_PATH, CHANGE_VALUE_THRESHOLD, CHANGE_VALUE_FLOOR, CHANGE_RATING_THRESHOLD
+
+logger = get_logger(__name__)
+
+# Class: Tracked fields of one feed source
+@dataclass(frozen=True)
+class ChangeSpec:
+    source: str
+    keys: tuple  # player identity
+    labels: tuple = ()  # carried along for the reader, not compared
+    club: str | None = None
+    value: str | None = None
+    rating: str | None = None
+    stats: str | None = None  # column with the hash of the player's stats
+
+    @property
+    def fields(self) -> list:
+        return [f for f in (self.club, self.value, self.rating, self.stats) if f is not None]
+
+MARKET_FEED = ChangeSpec(source="market", keys=("Player_ID",), labels=("Player",), club="Club", value="Market_Value_EUR")
+RATING_FEED = ChangeSpec(source="ratings", keys=("Player", "Born", "Squad"), labels=("League", "Pos_group"), club="Squad", rating="Rating", stats="Stats_Hash")
+
+# Function: 64-bit hash of every row (stable across processes)
+def row_hash(data: pd.DataFrame) -> np.ndarray:
+    return pd.util.hash_pandas_object(data, index=False).to_numpy()
+
+# Function: Identity hash of every row (namesakes with the same keys are told apart by their order)
+def key_hash(data: pd.DataFrame, keys: tuple) -> np.ndarray:
+    identity = data[list(keys)]
+    occurrence = identity.groupby(list(keys), dropna=False, sort=False).cumcount()
+    return row_hash(identity.assign(__occurrence=occurrence.to_numpy()))
+
+# Function: Mask of the values that differ (missing on both sides is equal)
+def differs(old: pd.Series, new: pd.Series) -> np.ndarray:
+    old, new = old.to_numpy(dtype=object), new.to_numpy(dtype=object)
+    missing_old, missing_new = pd.isna(old), pd.isna(new)
+    return (missing_old != missing_new) | (~missing_old & ~missing_new & (old != new))
+
+# Function: Mask of the numbers that moved by at least the threshold (relative or absolute)
+def moved(old: pd.Series, new: pd.Series, threshold: float, relative: bool = False, floor: float = 0.0) -> np.ndarray:
+    """relative: threshold is a share of the old value, never below floor (a zero base would report any change)."""
+    old, new = old.to_numpy(dtype=np.float64), new.to_numpy(dtype=np.float64)
+    limit = np.maximum(threshold * np.abs(old), floor) if relative else max(threshold, floor)
+    with np.errstate(invalid="ignore"):
+        return (np.isnan(old) != np.isnan(new)) | ((new != old) & (np.abs(new - old) >= limit))
+
+# Function: Pairs of (removed, new) rows of a player who changed the club in the identity
+def club_moves(removed: pd.DataFrame, added: pd.DataFrame, keys: list) -> tuple[pd.Index, pd.Index]:
+    # Only identities (without the club) that left exactly once and joined exactly once
+    left = removed.loc[~removed.duplicated(keys, keep=False), keys].reset_index()
+    joined = added.loc[~added.duplicated(keys, keep=False), keys].reset_index()
+    pairs = left.merge(joined, on=keys, suffixes=("_old", "_new"))
+    return pd.Index(pairs["index_old"]), pd.Index(pairs["index_new"])
+
+# Function: Compare the players with the previous snapshot
+def detect_changes(
+    data: pd.DataFrame,
+    snapshot: pd.DataFrame | None,
+    spec: ChangeSpec,
+    value_threshold: float = CHANGE_VALUE_THRESHOLD,
+    value_floor: float = CHANGE_VALUE_FLOOR,
+    rating_threshold: float = CHANGE_RATING_THRESHOLD,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Returns the changes (one row per player: Change, identity, Old.<field> / New.<field>)
+    and the next snapshot (__key / __row hashes, identity and tracked fields).
+    """
+    columns = list(dict.fromkeys([*spec.keys, *spec.labels, *spec.fields]))
+    current = data[columns].reset_index(drop=True)
+    current.insert(0, "__key", key_hash(current, spec.keys))
+    current.insert(1, "__row", row_hash(current[spec.fields]))
+    current = current.drop_duplicates(subset="__key")
+    if snapshot is None or snapshot.empty:
+        return pd.DataFrame(columns=["Change", *columns]), current
+
+    # Hash join on the identity: only rows with another value hash are compared further
+    previous = snapshot.set_index("__key")
+    previous_row = previous["__row"].reindex(current["__key"]).to_numpy()
+    known = current["__key"].isin(previous.index).to_numpy()
+    changed = current[known & (previous_row != current["__row"].to_numpy())]
+    old = previous.loc[changed["__key"]].reset_index()
+    new = changed.reset_index(drop=True)
+    added = current[~known]
+    removed = snapshot[~snapshot["__key"].isin(current["__key"])]
+    if spec.club in spec.keys:
+        # Left one club and joined another: compared like a known player instead of removed + new
+        left, joined = club_moves(removed=removed, added=added, keys=[k for k in spec.keys if k != spec.club])
+        if len(left):
+            old = pd.concat([old, removed.loc[left]], ignore_index=True)
+            new = pd.concat([new, added.loc[joined]], ignore_index=True)
+            removed, added = removed.drop(index=left), added.drop(index=joined)
+
+    kinds = {}
+    if spec.club:
+        kinds["transfer"] = differs(old[spec.club], new[spec.club])
+    if spec.value:
+        kinds["market_value"] = moved(old[spec.value], new[spec.value], value_threshold, relative=True, floor=value_floor)
+    if spec.rating:
+        kinds["rating"] = moved(old[spec.rating], new[spec.rating], rating_threshold)
+    if spec.stats:
+        kinds["stats"] = differs(old[spec.stats], new[spec.stats])
+    reported = np.logical_or.reduce(list(kinds.values())) if kinds else np.zeros(len(new), dtype=bool)
+    change = [";".join(kind for kind, mask in kinds.items() if mask[i]) for i in np.flatnonzero(reported)]
+    parts = [
+        added[columns].assign(Change="new").rename(columns={f: f"New.{f}" for f in spec.fields}),
+        removed[columns].assign(Change="removed").rename(columns={f: f"Old.{f}" for f in spec.fields}),
+        pd.concat([
+            new.loc[reported, [*spec.keys, *spec.labels]].reset_index(drop=True).assign(Change=change),
+            old.loc[reported, spec.fields].add_prefix("Old.").reset_index(drop=True),
+            new.loc[reported, spec.fields].add_prefix("New.").reset_index(drop=True),
+        ], axis=1),
+    ]
+    ordered = ["Change", *dict.fromkeys([*spec.keys, *spec.labels])] + [f"{side}.{f}" for f in spec.fields for side in ("Old", "New")]
+    changes = pd.concat([part for part in parts if not part.empty] or [pd.DataFrame(columns=ordered)], ignore_index=True)
+
+    # Changes below the threshold stay on the last reported value in the snapshot
+    held = [(kinds[kind], field) for kind, field in (("market_value", spec.value), ("rating", spec.rating)) if kind in kinds]
+    if any((~mask).any() for mask, _ in held):
+        for mask, field in held:
+            new.loc[~mask, field] = old.loc[~mask, field].to_numpy()
+        new["__row"] = row_hash(new[spec.fields])
+        current = pd.concat([current[~current["__key"].isin(new["__key"])], new], ignore_index=True)
+
+    return changes.reindex(columns=ordered), current
+
+# Function: Append the changes of one refresh to the feed
+def append_feed(changes: pd.DataFrame, source: str, run: datetime) -> Path:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    feed = Path(CHANGE_PATH, "feed")
+    feed.mkdir(parents=True, exist_ok=True)
+    path = Path(feed, f"{run:%Y%m%dT%H%M%S%f}_{source}.parquet")
+    temp = path.with_name(f".{path.name}.tmp")
+    table = pa.Table.from_pandas(changes.assign(Run=pd.Timestamp(run), Source=source), preserve_index=False)
+    pq.write_table(table, temp)
+    # Files are never rewritten: a reader sees a refresh completely or not at all
+    os.replace(temp, path)
+    return path
+
+# Function: Update the snapshot of a source and publish its changes
+def record_changes(data: pd.DataFrame, spec: ChangeSpec) -> pd.DataFrame:
+    run = datetime.now()
+    snapshot = load_partition(name="changes/snapshots", partition=spec.source)
+    changes, current = detect_changes(data=data, snapshot=snapshot, spec=spec)
+    if snapshot is None:
+        logger.info("Change feed %s: baseline of %d players", spec.source, len(current), extra={"stage": "changes"})
+    elif not changes.empty:
+        append_feed(changes=changes, source=spec.source, run=run)
+        counts = changes["Change"].str.split(";").explode().value_counts().to_dict()
+        logger.info("Change feed %s: %d players changed %s", spec.source, len(changes), counts, extra={"stage": "changes"})
+    else:
+        logger.info("Change feed %s: no changes", spec.source, extra={"stage": "changes"})
+    store_partition(data=current, name="changes/snapshots", partition=spec.source)
+    record_refresh(name="changes", sheet=spec.source, rows=len(changes))
+
+    return changes
+
+# Function: Read the feed (optionally only refreshes after a point in time / of one source)
+def read_changes(since: datetime | None = None, source: str | None = None) -> pd.DataFrame:
+    feed = Path(CHANGE_PATH, "feed")
+    # File names start with the run time: the cursor filters without opening the files
+    files = sorted(feed.glob(f"*_{source or '*'}.parquet")) if feed.exists() else []
+    if since is not None:
+        files = [path for path in files if path.name.split("_", 1)[0] > f"{since:%Y%m%dT%H%M%S%f}"]
+    if not files:
+        return pd.DataFrame()
+    return pd.concat([pd.read_parquet(path) for path in files], ignore_index=True)
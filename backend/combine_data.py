@@ -6,12 +6,16 @@ import re
 from typing import Optional
 
 # Local imports
-from backend.data_scraping.fbref import scrape_fbref
-from backend.data_scraping.transfermarkt import scrape_transfermarkt, teams_in_league
+from backend.data_scraping.fbref import fetch_fbref, parse_fbref
+from backend.data_scraping.transfermarkt import scrape_transfermarkt, teams_in_league, squad_url
 from functions.logger import get_logger
-from functions.data_related import mapping_two_columns, add_date_column, normalize_data
-from functions.utils import find_country, load_excel, store_excel, update_sheets
-from environment.variable import STATS_NAME, MARKET_SHEET_NAME, SHEETS, DATA_PATH, POSITION_GROUPS, NON_FEATURES
+from backend.changes import MARKET_FEED, record_changes
+from functions.data_related import mapping_two_columns, add_date_column, normalize_data, playing_time_cutoff
+from functions.memory import track_memory
+from functions.manifest import load_manifest, is_expired
+from functions.pipeline import stream_pipeline
+from functions.utils import find_country, export_workbook, store_partition, load_partition, get_best_match
+from environment.variable import STATS_NAME, MARKET_SHEET_NAME, SHEETS, DATA_PATH, POSITION_GROUPS, NON_FEATURES, SHRINK_RATES, TABLE_TTL, DEFAULT_TTL, CLUB_TTL, CLUB_MAX_AGE
 
 # Logger
 logger = get_logger(__name__)
@@ -43,79 +47,148 @@ fbref_tables = {
     "stats_keeper_adv": {"page": "keepersadv", "table_id": "stats_keeper_adv"},
 }
 
+# Function: URL of a fbref table page
+def fbref_url(league: str, table: str) -> str:
+    league_name = fbref_leagues[league]
+    return f'https://fbref.com/en/comps/{league_name["id"]}/{fbref_tables[table]["page"]}/{league_name["name"]}-Stats'
+
+# Function: Fetch stage of a (league, table) job
+def fetch_fbref_job(job: tuple) -> str:
+    league, table = job
+    return fetch_fbref(url=fbref_url(league=league, table=table))
+
+# Function: Parse stage of a (league, table) job (module level, so it can run in a worker process)
+def parse_fbref_job(job: tuple, html: str) -> pd.DataFrame:
+    league, table = job
+    data = parse_fbref(html=html, table_id=fbref_tables[table]["table_id"], url=fbref_url(league=league, table=table))
+    data = data.drop(columns=["Rk"]) 
+
+    # Add League and Table name
+    data["League"] = re.sub(r'[+\- ]', '_', fbref_leagues[league]["name"])
+    data["Table"] = re.sub(r'[+\- ]', '_', table)
+
+    return data
+
+# Function: Scrape one fbref table of a league and keep it as partition
+def fbref_table(league: str, table: str) -> pd.DataFrame:
+    data = parse_fbref_job(job=(league, table), html=fetch_fbref_job(job=(league, table)))
+    store_partition(data=data, name=f"fbref/{league}", partition=table)
+
+    return data
+
+# Function: Tables of a league whose refresh interval is over
+def stale_tables(league: str) -> list:
+    refreshed = load_manifest().get(f"fbref/{league}", {})
+    return [table for table in fbref_tables if is_expired(refreshed.get(table), TABLE_TTL.get(table, DEFAULT_TTL))]
+
+# Function: Merge all tables of a league into one frame
+def merge_league_tables(tables: dict) -> pd.DataFrame:
+    combined_player_stats = pd.DataFrame()
+    count = 0
+    for table_page, data in tables.items():
+        # Initialize the dataframes
+        if count == 0:
+            combined_player_stats = data 
+
+        else:
+          # --- define stable merge keys (only these are shared) ---
+            merge_keys = ["Player", "Nation", "Pos", "Age", "Born", "Squad", "League"]
+            merge_keys = [k for k in merge_keys if k in combined_player_stats.columns and k in data.columns]
+
+            # --- columns you want ONLY ONCE in the final df (no League_x etc) ---
+            single_meta_cols = {"League", "Squad", "Table", "Matches"}  # add/remove as you like
+
+            # drop meta columns from the RIGHT df if they already exist in LEFT and are not keys
+            drop_from_right = [c for c in data.columns
+                            if c in combined_player_stats.columns and c in single_meta_cols and c not in merge_keys]
+            data = data.drop(columns=drop_from_right, errors="ignore")
+
+            # --- avoid collisions for non-key columns by prefixing table name ---
+            feature_cols = [c for c in data.columns if c not in merge_keys]
+            data = data.rename(columns={c: f"{table_page}__{c}" for c in feature_cols})
+
+            combined_player_stats = pd.merge(
+                combined_player_stats,
+                data,
+                on=merge_keys,
+                how="outer",
+            )
+           
+        count = count + 1
+
+    return combined_player_stats
+
+# Function: Merge, map and filter one league (merge stage)
+def process_league(league: str, tables: dict, tm_data: pd.DataFrame, shrink: bool = SHRINK_RATES) -> pd.DataFrame:
+    with track_memory(f"league {league}") as memory:
+        combined_player_stats = merge_league(league=league, tables=tables, tm_data=tm_data, shrink=shrink)
+        memory["result"] = combined_player_stats
+    # Store the league (partition for the combine step and the export)
+    store_partition(data=combined_player_stats, name="leagues", partition=league)
+
+    return combined_player_stats
+
+# Function: Merged, mapped, normalized and filtered frame of one league
+def merge_league(league: str, tables: dict, tm_data: pd.DataFrame, shrink: bool = SHRINK_RATES) -> pd.DataFrame:
+    combined_player_stats = merge_league_tables(tables={table: tables[table] for table in fbref_tables})
+    # Map the correct entries 
+    combined_player_stats = mapping_two_columns(initial_data=combined_player_stats, reference_data=tm_data, column="Player", target="Pos")
+    # fbref names the club "Squad"
+    tm_clubs = tm_data.rename(columns={"Club": "Squad"})
+    combined_player_stats = mapping_two_columns(initial_data=combined_player_stats, reference_data=tm_clubs, column="Squad", target="League_Position")
+    combined_player_stats = mapping_two_columns(initial_data=combined_player_stats, reference_data=tm_clubs, column="Squad", target="Goal_Diff_%")
+    combined_player_stats = mapping_two_columns(initial_data=combined_player_stats, reference_data=tm_clubs, column="Squad", target="Points_%")
+    combined_player_stats["Pos_group"] =  combined_player_stats["Pos"].map(POSITION_GROUPS)
+    combined_player_stats["Date"] = add_date_column(length=combined_player_stats.shape[0])
+
+    # Normalize data 
+    features = [column for column in combined_player_stats.columns if column not in NON_FEATURES]
+    combined_player_stats = normalize_data(data = combined_player_stats, features=features, shrink=shrink)
+    # Take the top 70% in play time (exact, the league is in memory)
+    min_ratio_90 = combined_player_stats["Playing_Time.90s"].astype(float).quantile(playing_time_cutoff(shrink))
+    combined_player_stats = combined_player_stats[combined_player_stats['Playing_Time.90s'] > min_ratio_90]
+
+    return combined_player_stats
+
 # Function: Scrape player data from fbref
-def player_stats_data(update_sheets: list)->pd.DataFrame:
+def player_stats_data(refresh: dict, parse_workers: int = 2, parse_processes: bool = False, shrink: bool = SHRINK_RATES)->pd.DataFrame:
+    """
+    refresh maps a league to the tables that are scraped again.
+    All other tables come from the stored partitions, leagues not in refresh are not touched.
+    Pages stream through fetch (own thread) -> parse (worker pool) -> merge (here), so a
+    league is merged as soon as its last table arrived while the next pages are fetched.
+    shrink: shrunk per-90 rates, with the lower playing time cutoff (see normalize_data).
+    """
     # Load and initialize data
-    tm_data = load_excel(name=STATS_NAME, sheet_name=MARKET_SHEET_NAME)
-    overall_data = pd.DataFrame()
-    update_leagues = {sheet: fbref_leagues[sheet] for sheet in update_sheets if sheet != "All"}
-    # Loop through all leagues
-    for league_id, league_name in update_leagues.items():
-        combined_player_stats = pd.DataFrame()
-        count = 0
-        for table_page, table_name in fbref_tables.items():
-            fbref_url = f'https://fbref.com/en/comps/{league_name["id"]}/{table_name["page"]}/{league_name["name"]}-Stats'
-
-            data = scrape_fbref(url=fbref_url, table_id=table_name["table_id"])
-            data = data.drop(columns=["Rk"]) 
-
-            # Add League and Table name
-            data["League"] = re.sub(r'[+\- ]', '_', league_name["name"])
-            data["Table"] = re.sub(r'[+\- ]', '_', table_page)
-            # Initialize the dataframes
-            if count == 0:
-                combined_player_stats = data 
-
+    tm_data = load_partition(name="transfermarkt", partition="All")
+    if tm_data is None:
+        raise FileNotFoundError("No transfermarkt data stored yet, run the market values first")
+    # Stored tables and the (league, table) jobs to scrape
+    tables = {league: {} for league in refresh}
+    jobs = []
+    for league, refresh_tables in refresh.items():
+        for table in fbref_tables:
+            data = None if table in refresh_tables else load_partition(name=f"fbref/{league}", partition=table)
+            if data is None:
+                jobs.append((league, table))
             else:
-              # --- define stable merge keys (only these are shared) ---
-                merge_keys = ["Player", "Nation", "Pos", "Age", "Born", "Squad", "League"]
-                merge_keys = [k for k in merge_keys if k in combined_player_stats.columns and k in data.columns]
-
-                # --- columns you want ONLY ONCE in the final df (no League_x etc) ---
-                single_meta_cols = {"League", "Squad", "Table", "Matches"}  # add/remove as you like
-
-                # drop meta columns from the RIGHT df if they already exist in LEFT and are not keys
-                drop_from_right = [c for c in data.columns
-                                if c in combined_player_stats.columns and c in single_meta_cols and c not in merge_keys]
-                data = data.drop(columns=drop_from_right, errors="ignore")
-
-                # --- avoid collisions for non-key columns by prefixing table name ---
-                feature_cols = [c for c in data.columns if c not in merge_keys]
-                data = data.rename(columns={c: f"{table_page}__{c}" for c in feature_cols})
-
-                combined_player_stats = pd.merge(
-                    combined_player_stats,
-                    data.copy(),
-                    on=merge_keys,
-                    how="outer",
-                )
-               
-            count = count + 1
-        # Take the top 70% in play time
-        min_ratio_90 = combined_player_stats['Playing_Time.90s'].astype(float).quantile(0.3)
-        combined_player_stats = combined_player_stats[combined_player_stats['Playing_Time.90s'] > min_ratio_90]
-        # Map the correct entries 
-        combined_player_stats = mapping_two_columns(initial_data=combined_player_stats, reference_data=tm_data, column="Player", target="Pos")
-        combined_player_stats = mapping_two_columns(initial_data=combined_player_stats, reference_data=tm_data, column="Club", target="League_Position")
-        combined_player_stats = mapping_two_columns(initial_data=combined_player_stats, reference_data=tm_data, column="Club", target="Goal_Diff_%")
-        combined_player_stats = mapping_two_columns(initial_data=combined_player_stats, reference_data=tm_data, column="Club", target="Points_%")
-        combined_player_stats["Pos_group"] =  combined_player_stats["Pos"].map(POSITION_GROUPS)
-        combined_player_stats["Date"] = add_date_column(length=combined_player_stats.shape[0])
-
-        # Normalize data 
-        features = [column for column in combined_player_stats.columns if column not in NON_FEATURES]
-        combined_player_stats = normalize_data(data = combined_player_stats, features=features)
-        # Concat data          
-        if overall_data.empty:
-            overall_data = combined_player_stats
-        else:
-            overall_data = pd.concat([overall_data, combined_player_stats], ignore_index=True)
-        # Store the data as excel
-        store_excel(data=combined_player_stats, name=STATS_NAME, sheet_name=league_name["name"])
-    if "All" in update_sheets:
-        store_excel(data=overall_data, name=STATS_NAME, sheet_name="All")
+                tables[league][table] = data
+    missing = {league: sum(1 for job in jobs if job[0] == league) for league in refresh}
 
-    return overall_data
+    # Leagues that are complete without scraping
+    for league in [league for league, count in missing.items() if count == 0]:
+        process_league(league=league, tables=tables.pop(league), tm_data=tm_data, shrink=shrink)
+    # Stream the rest, merge a league once all of its tables are in
+    pages = stream_pipeline(items=jobs, fetch=fetch_fbref_job, parse=parse_fbref_job, workers=parse_workers, processes=parse_processes)
+    for (league, table), data in pages:
+        logger.info("Parsed %s %s", league, table, extra={"stage": "parse", "league": league, "table": table, "rate_limit": 10})
+        store_partition(data=data, name=f"fbref/{league}", partition=table)
+        tables[league][table] = data
+        missing[league] -= 1
+        if missing[league] == 0:
+            process_league(league=league, tables=tables.pop(league), tm_data=tm_data, shrink=shrink)
+    # Re-combine: only the refreshed leagues were merged again, the others are read back
+    return combine_leagues()
 
 # --- --- Transfermarkt --- ---
 # Parameters
@@ -127,57 +200,170 @@ tm_leagues = {
     "Ligue-1": {"code": "FR1", "slug": "ligue-1"},
 }
 
+# Function: League overview (clubs, position, goal difference) kept as partition
+def league_clubs(league: str, refresh: bool = False) -> pd.DataFrame:
+    clubs = None if refresh else load_partition(name="transfermarkt/leagues", partition=league)
+    if clubs is None:
+        clubs = teams_in_league(league=league.lower(), competition=tm_leagues[league]["code"], season_id=2025)
+        store_partition(data=clubs, name="transfermarkt/leagues", partition=league)
+    return clubs
+
+# Function: Squad of one club kept as partition
+def club_squad(club: pd.Series) -> pd.DataFrame:
+    tm_url = squad_url(slug=club["Slug"], club_id=club["ID"])
+    logger.info("Transfermarkt: %s", club["Club"], extra={"stage": "fetch", "club": club["Club"], "rate_limit": 10})
+    data = scrape_transfermarkt(url=tm_url, club=club["Club"], use_cloudscraper_fallback=True)
+    store_partition(data=data, name="transfermarkt/clubs", partition=str(club["ID"]), signal=club_signal(club))
+    return data
+
+# Function: Change signal of a squad page (squad size and total value on the league overview)
+def club_signal(club: pd.Series) -> dict | None:
+    squad, value = club.get("Squad_Size"), club.get("Total_Value_EUR")
+    if squad is None or value is None or pd.isna(squad) or pd.isna(value):
+        return None
+    return {"squad": int(squad), "value": float(value)}
+
+# Function: Check if a squad must be scraped again (summary changed or older than CLUB_MAX_AGE)
+def squad_changed(club: pd.Series, entry: dict | None) -> bool:
+    if not entry:
+        return True
+    signal = club_signal(club)
+    if signal is None:
+        # No summary on the overview: plain refresh interval
+        return is_expired(entry, CLUB_TTL)
+    return entry.get("signal") != signal or is_expired(entry, CLUB_MAX_AGE)
+
+# Function: Clubs of all leagues (expired league overviews are scraped again if refresh_expired)
+def all_league_clubs(refresh_expired: bool = True) -> pd.DataFrame:
+    refreshed = load_manifest().get("transfermarkt/leagues", {})
+    clubs = [
+        league_clubs(league=league, refresh=refresh_expired and is_expired(refreshed.get(league), CLUB_TTL))
+        for league in tm_leagues
+    ]
+    return pd.concat(clubs, ignore_index=True)
+
+# Function: IDs of the clubs to scrape again (selected by name, else changed since the last scrape)
+def clubs_to_refresh(all_clubs: pd.DataFrame, clubs: list | None = None) -> set:
+    if clubs is None:
+        entries = load_manifest().get("transfermarkt/clubs", {})
+        refresh_ids = {club["ID"] for _, club in all_clubs.iterrows() if squad_changed(club, entries.get(str(club["ID"])))}
+        logger.info("Transfermarkt: %d of %d squads changed", len(refresh_ids), len(all_clubs), extra={"stage": "plan"})
+        return refresh_ids
+    names = tuple(all_clubs["Club"])
+    matches = {club: get_best_match(club, names) for club in clubs}
+    for club, match in matches.items():
+        if match is None:
+            raise ValueError(f"Unknown club: {club!r}")
+    return set(all_clubs.loc[all_clubs["Club"].isin(matches.values()), "ID"])
+
+# Function: Leagues of the selected clubs (fuzzy matched names)
+def club_leagues(clubs: list) -> list:
+    league_names = {league: league_clubs(league=league)["Club"].tolist() for league in tm_leagues}
+    names = tuple(name for names_of_league in league_names.values() for name in names_of_league)
+    leagues = []
+    for club in clubs:
+        match = get_best_match(club, names)
+        if match is None:
+            raise ValueError(f"Unknown club: {club!r}")
+        leagues += [league for league, names_of_league in league_names.items() if match in names_of_league]
+    return list(dict.fromkeys(leagues))
+
 # Function: Scrape the market values of the players
-def market_values_data() -> pd.DataFrame:
-    tm_all = pd.DataFrame()
-    
-    # Determine all clubs
-    all_clubs = pd.DataFrame()
-    for leagues in tm_leagues.keys():
-        code = tm_leagues[leagues]["code"]
-        clubs = teams_in_league(league=leagues.lower(),competition=code, season_id=2025)
-        if all_clubs.empty:
-            all_clubs = clubs
-        else:
-            all_clubs = pd.concat([all_clubs, clubs], ignore_index=True)
+def market_values_data(clubs: list | None = None) -> pd.DataFrame:
+    """
+    clubs: only these clubs are scraped again (fuzzy matched names).
+    Without selection every club whose refresh interval is over is scraped again.
+    """
+    # Determine all clubs (league overviews only refreshed on a full run)
+    all_clubs = all_league_clubs(refresh_expired=clubs is None)
+    # Clubs to scrape again
+    refresh_ids = clubs_to_refresh(all_clubs=all_clubs, clubs=clubs)
     # Mapping for multiple infos
     goal_map = dict(zip(all_clubs["Club"], all_clubs["GoalDiff_%"]))
     points_map = dict(zip(all_clubs["Club"], all_clubs["Points_%"]))
     position_map = dict(zip(all_clubs["Club"], all_clubs["League_Position"]))
     all_maps = {"Goal_Diff_%": goal_map, "Points_%": points_map, "League_Position": position_map}
-    # Loop through all clubs
-    for i, club in all_clubs.iterrows():
-        # club_id = find_club_id(club_name=club["club"])
-        tm_url = f'https://www.transfermarkt.com/{club["Slug"]}/startseite/verein/{club["ID"]}'
-        logger.info("Transfermarkt: %s", club["Club"])
-        data = scrape_transfermarkt(url=tm_url, club=club["Club"], use_cloudscraper_fallback=True)
-
-        # Check if data is already loaded
-        if i == 0:
-            tm_all = data
-        else:
-            tm_all = pd.concat([tm_all, data], ignore_index=True)
+    # Loop through all clubs (squads are collected and concatenated once)
+    squads = []
+    for _, club in all_clubs.iterrows():
+        data = None if club["ID"] in refresh_ids else load_partition(name="transfermarkt/clubs", partition=str(club["ID"]))
+        if data is None:
+            data = club_squad(club=club)
+        squads.append(data)
 
-    # Short form of countries
-    tm_all["Nation"] = find_country(countries=tm_all.Nation, alpha=3)
-    tm_all["Date"] = add_date_column(length=tm_all.shape[0])
-    # Map team info
-    for column, mapping in all_maps.items():
-        tm_all[column] = tm_all["Club"].map(mapping)
+    with track_memory("market_values") as memory:
+        tm_all = pd.concat(squads, ignore_index=True)
+        # Short form of countries
+        tm_all["Nation"] = find_country(countries=tm_all.Nation, alpha=3)
+        tm_all["Date"] = add_date_column(length=tm_all.shape[0])
+        # Map team info
+        for column, mapping in all_maps.items():
+            tm_all[column] = tm_all["Club"].map(mapping)
+        memory["result"] = tm_all
 
     # --- Store ---
-    store_excel(data=tm_all, name=STATS_NAME, sheet_name=MARKET_SHEET_NAME)
+    store_partition(data=tm_all, name="transfermarkt", partition="All")
+    record_changes(data=tm_all, spec=MARKET_FEED)
 
     return tm_all
 
+# Function: Validate the selectors and plan the fbref refresh (league -> tables)
+def fbref_refresh(leagues: list | None = None, tables: list | None = None, clubs: list | None = None) -> dict:
+    for league in leagues or []:
+        if league not in fbref_leagues:
+            raise ValueError(f"Unknown league: {league!r}, choose from {list(fbref_leagues)}")
+    for table in tables or []:
+        if table not in fbref_tables:
+            raise ValueError(f"Unknown table: {table!r}, choose from {list(fbref_tables)}")
+
+    if leagues or tables or clubs:
+        refresh = {league: tables or list(fbref_tables) for league in leagues or (fbref_leagues if tables else [])}
+        # Leagues of the selected clubs are merged again from their stored tables (new market values)
+        for league in club_leagues(clubs) if clubs else []:
+            refresh.setdefault(league, [])
+        return refresh
+    refresh = {league: stale_tables(league) for league in fbref_leagues}
+    return {league: refresh_tables for league, refresh_tables in refresh.items() if refresh_tables}
+
 # Function: Combine all data
-def data_table():
-    # Determine updates
-    update_list = update_sheets(offset_date=0)
-    fbref_list = [sheet for sheet in update_list if sheet != MARKET_SHEET_NAME]
+def data_table(leagues: list | None = None, tables: list | None = None, clubs: list | None = None):
+    """
+    Without selectors every (league, table) and club whose refresh interval (TTL) is over is scraped.
+    With selectors only the selection is scraped, e.g. leagues=["Bundesliga"], tables=["stats_shooting"]
+    or clubs=["Bayern Munich"]; the affected leagues are merged again.
+    """
+    refresh = fbref_refresh(leagues=leagues, tables=tables, clubs=clubs)
+    if clubs or not (leagues or tables):
+        market_values_data(clubs=clubs)
     # Run the scraping
-    if MARKET_SHEET_NAME in update_list:
-        market_values = market_values_data()
-    if len(fbref_list) > 0:
-        data_stats = player_stats_data(fbref_list)
-    
\ No newline at end of file
+    if len(refresh) > 0:
+        player_stats_data(refresh)
+    else:
+        logger.info("All fbref tables are up to date")
+    # Workbook for the stakeholders, written once from the partitions
+    export_stats_workbook()
+
+# Function: Combine the stored league partitions (no scraping)
+def combine_leagues() -> pd.DataFrame:
+    with track_memory("combine") as memory:
+        leagues = [load_partition(name="leagues", partition=league) for league in fbref_leagues]
+        leagues = [data for data in leagues if data is not None]
+        # No league merged yet
+        overall_data = pd.concat(leagues, ignore_index=True) if leagues else pd.DataFrame()
+        memory["result"] = overall_data
+
+    return overall_data
+
+# Function: Export the Player_Stats workbook (all sheets in one pass)
+def export_stats_workbook() -> None:
+    sheets = {}
+    market_values = load_partition(name="transfermarkt", partition="All")
+    if market_values is not None:
+        sheets[MARKET_SHEET_NAME] = market_values
+    leagues = {league_name["name"]: load_partition(name="leagues", partition=league) for league, league_name in fbref_leagues.items()}
+    leagues = {sheet: data for sheet, data in leagues.items() if data is not None}
+    sheets.update(leagues)
+    if leagues:
+        sheets["All"] = pd.concat(leagues.values(), ignore_index=True)
+    if sheets:
+        export_workbook(sheets=sheets, name=STATS_NAME)
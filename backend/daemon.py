@@ -0,0 +1,173 @@
+### Long running refresh daemon ###
+"""
+Keeps one warm process: modules, HTTP sessions, fuzzy match / country caches and the
+loaded partitions stay in memory between refreshes. Every dataset (the Transfermarkt
+squads and each fbref league) is refreshed when its TTL is over, followed by the
+workbook export and the scoring on the in-memory frames.
+The control socket (python main.py ctl status / refresh / stop) triggers refreshes
+and reports the schedule.
+"""
+# Imports
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Local imports
+from backend import combine_data
+from backend.metric_analyzation.scoring import prepare_scoring
+from functions.control import serve_commands
+from functions.logger import get_logger
+from functions.manifest import load_manifest, due_date
+from functions.utils import enable_partition_cache
+from environment.variable import DAEMON_SOCKET, DAEMON_TICK, TABLE_TTL, DEFAULT_TTL, CLUB_TTL
+
+logger = get_logger(__name__)
+
+MARKET = "transfermarkt"
+
+# Class: Refresh daemon
+class Daemon:
+
+    def __init__(self, socket_path: Path = DAEMON_SOCKET, tick: float = DAEMON_TICK) -> None:
+        self.socket_path = Path(socket_path)
+        self.tick = tick
+        self.commands = queue.Queue()
+        self.started = datetime.now()
+        self.busy = None
+        self.runs = {}  # dataset -> result of the last refresh
+        self.retry_at = {}  # dataset -> earliest retry after a failed scheduled refresh
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def datasets(self) -> list:
+        return [MARKET] + [f"fbref/{league}" for league in combine_data.fbref_leagues]
+
+    def due(self) -> dict:
+        """Next scheduled refresh per dataset (TTLs are in days, due at midnight)."""
+        manifest = load_manifest()
+        overviews = manifest.get("transfermarkt/leagues", {})
+        due = {MARKET: min(due_date(overviews.get(league), CLUB_TTL) for league in combine_data.tm_leagues)}
+        for league in combine_data.fbref_leagues:
+            entries = manifest.get(f"fbref/{league}", {})
+            due[f"fbref/{league}"] = min(
+                due_date(entries.get(table), TABLE_TTL.get(table, DEFAULT_TTL)) for table in combine_data.fbref_tables
+            )
+        due = {name: datetime.combine(day, datetime.min.time()) for name, day in due.items()}
+        for name, retry in self.retry_at.items():
+            due[name] = max(due[name], retry)
+        return due
+
+    def refresh(self, requests: dict, scheduled: bool = False) -> None:
+        """
+        requests maps a dataset to the fbref tables to refresh (None: stale tables when
+        scheduled, all tables when triggered). Transfermarkt runs first, the fbref
+        leagues are merged with its data.
+        """
+        changed = False
+        for name in sorted(requests, key=lambda name: name != MARKET):
+            started = time.perf_counter()
+            with self._lock:
+                self.busy = name
+            try:
+                if name == MARKET:
+                    combine_data.market_values_data()
+                else:
+                    league = name.split("/", 1)[1]
+                    tables = requests[name] or (combine_data.stale_tables(league) if scheduled else list(combine_data.fbref_tables))
+                    combine_data.player_stats_data(refresh={league: tables})
+            except Exception as e:
+                logger.exception("Refresh of %s failed", name)
+                result = {"error": f"{type(e).__name__}: {e}"}
+                if scheduled:
+                    self.retry_at[name] = datetime.fromtimestamp(time.time() + self.tick)
+            else:
+                result = {"error": None}
+                self.retry_at.pop(name, None)
+                changed = True
+            result.update(finished=datetime.now().isoformat(timespec="seconds"), duration=round(time.perf_counter() - started, 2))
+            logger.info("Refresh of %s done in %.1f s", name, result["duration"], extra={"stage": "daemon"})
+            with self._lock:
+                self.runs[name] = result
+                self.busy = None
+        if changed:
+            self.publish()
+
+    def publish(self) -> None:
+        """Export the workbook and score again (frames come from the in-memory partitions)."""
+        with self._lock:
+            self.busy = "scoring"
+        try:
+            combine_data.export_stats_workbook()
+            prepare_scoring(stats_data=combine_data.combine_leagues())
+        except Exception:
+            logger.exception("Export / scoring failed")
+        finally:
+            with self._lock:
+                self.busy = None
+
+    def handle(self, request: dict) -> dict:
+        """Answer of the control socket (runs on the socket thread)."""
+        command = request.get("command")
+        if command == "ping":
+            return {"ok": True}
+        if command == "status":
+            due = self.due()
+            with self._lock:
+                return {
+                    "started": self.started.isoformat(timespec="seconds"),
+                    "busy": self.busy,
+                    "queued": self.commands.qsize(),
+                    "datasets": {name: {"due": due[name].isoformat(timespec="seconds"), **self.runs.get(name, {})} for name in self.datasets()},
+                }
+        if command == "refresh":
+            names = request.get("datasets") or ["all"]
+            names = self.datasets() if "all" in names else names
+            unknown = [name for name in names if name not in self.datasets()]
+            if unknown:
+                return {"error": f"Unknown datasets {unknown}, choose from {self.datasets()}"}
+            self.commands.put({name: request.get("tables") for name in names})
+            return {"queued": names}
+        if command == "stop":
+            self.stop()
+            return {"stopping": True}
+        return {"error": f"Unknown command: {command!r}"}
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.commands.put(None)
+
+    def run(self) -> None:
+        enable_partition_cache()
+        server = serve_commands(handler=self.handle, path=self.socket_path)
+        logger.info("Daemon listening on %s", self.socket_path)
+        try:
+            while not self._stop.is_set():
+                now = datetime.now()
+                due = self.due()
+                ready = [name for name, when in due.items() if when <= now]
+                if ready:
+                    self.refresh(requests={name: None for name in ready}, scheduled=True)
+                    continue
+                # Sleep until the next dataset is due or a command arrives (re-check the manifest every tick)
+                wait = min([(when - now).total_seconds() for when in due.values()] + [self.tick])
+                try:
+                    command = self.commands.get(timeout=max(wait, 1.0))
+                except queue.Empty:
+                    continue
+                # Merge all waiting triggers into one refresh
+                requests = {}
+                while command is not None:
+                    requests.update(command)
+                    try:
+                        command = self.commands.get_nowait()
+                    except queue.Empty:
+                        break
+                if requests and not self._stop.is_set():
+                    self.refresh(requests=requests)
+        finally:
+            server.shutdown()
+            server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+            logger.info("Daemon stopped")
@@ -0,0 +1,129 @@
+### Async library API ###
+"""
+Awaitable versions of the scrapers for asyncio services, returning Arrow tables
+(as_pandas=True: pandas frames):
+    table = await fetch_fbref_table("Bundesliga", "stats_shooting")
+    clubs = await fetch_league_clubs("Bundesliga")
+    squad = await fetch_club_squad(slug="fc-bayern-munchen", club_id=27, club="Bayern Munich")
+All calls of a loop share one AsyncScraper (pass client= for an own one), so any number
+of concurrent callers stay within the rate of the shared RateController. Parsing is CPU
+work and runs in an executor (default: the thread pool of the loop).
+The shared client closes its session when the loop shuts down its async generators
+(asyncio.run does); long running services on an own loop await close_default_client().
+"""
+# Imports
+from __future__ import annotations
+import asyncio
+import weakref
+from concurrent.futures import Executor
+from functools import partial
+
+import pandas as pd
+
+# Local imports
+from backend.data_scraping.transfermarkt import league_url, squad_url, parse_league_overview, parse_squad
+from backend.combine_data import fbref_leagues, fbref_tables, fbref_url, parse_fbref_job, tm_leagues
+from classes.async_scraping import AsyncScraper
+
+# Shared client per event loop (client, its lifetime generator)
+_clients = weakref.WeakKeyDictionary()
+
+# Function: Lifetime of a shared client, finalized by the shutdown_asyncgens of its loop
+async def _client_lifetime(client: AsyncScraper):
+    try:
+        yield
+    finally:
+        await client.close()
+
+# Function: Client shared by all callers of the running loop
+def default_client() -> AsyncScraper:
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        client = AsyncScraper()
+        lifetime = _client_lifetime(client)
+        # Started generators are tracked by the loop (weakly, the reference is kept here)
+        loop.create_task(anext(lifetime))
+        _clients[loop] = (client, lifetime)
+    return _clients[loop][0]
+
+# Function: Close the shared client of the running loop
+async def close_default_client() -> None:
+    entry = _clients.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        client, lifetime = entry
+        await client.close()
+        await lifetime.aclose()
+
+# Function: Parse off the event loop and convert the result
+async def _parse(parse, *args, as_pandas: bool = False, executor: Executor | None = None, **kwargs):
+    data = await asyncio.get_running_loop().run_in_executor(executor, partial(parse, *args, **kwargs))
+    if as_pandas:
+        return data
+    import pyarrow as pa
+
+    return pa.Table.from_pandas(data, preserve_index=False)
+
+# Function: One fbref table of a league
+async def fetch_fbref_table(
+    league: str,
+    table: str,
+    client: AsyncScraper | None = None,
+    as_pandas: bool = False,
+    executor: Executor | None = None,
+):
+    """league: key of fbref_leagues (e.g. "Bundesliga"), table: key of fbref_tables (e.g. "stats_shooting")."""
+    if league not in fbref_leagues:
+        raise ValueError(f"Unknown league: {league!r}, choose from {list(fbref_leagues)}")
+    if table not in fbref_tables:
+        raise ValueError(f"Unknown table: {table!r}, choose from {list(fbref_tables)}")
+    html = await (client or default_client()).fetch_html(fbref_url(league=league, table=table), referer="https://fbref.com/")
+    return await _parse(parse_fbref_job, (league, table), html, as_pandas=as_pandas, executor=executor)
+
+# Function: Clubs of a league (position, goal difference, points, squad size and value)
+async def fetch_league_clubs(
+    league: str,
+    season_id: int = 2025,
+    client: AsyncScraper | None = None,
+    as_pandas: bool = False,
+    executor: Executor | None = None,
+):
+    """league: key of tm_leagues (e.g. "Bundesliga")."""
+    if league not in tm_leagues:
+        raise ValueError(f"Unknown league: {league!r}, choose from {list(tm_leagues)}")
+    url = league_url(league=league.lower(), competition=tm_leagues[league]["code"], season_id=season_id)
+    html = await (client or default_client()).fetch_html(url, referer="https://www.transfermarkt.com/")
+    return await _parse(parse_league_overview, html, as_pandas=as_pandas, executor=executor)
+
+# Function: Players and market values of a squad
+async def fetch_club_squad(
+    slug: str,
+    club_id: int | str,
+    club: str,
+    client: AsyncScraper | None = None,
+    as_pandas: bool = False,
+    executor: Executor | None = None,
+):
+    """slug / club_id / club: Slug, ID and Club of a row of fetch_league_clubs."""
+    html = await (client or default_client()).fetch_html(squad_url(slug=slug, club_id=club_id), referer="https://fbref.com/")
+    return await _parse(parse_squad, html=html, club=club, as_pandas=as_pandas, executor=executor)
+
+# Function: Squads of all clubs of a league (concurrent, throttled by the shared client)
+async def fetch_league_squads(
+    league: str,
+    season_id: int = 2025,
+    client: AsyncScraper | None = None,
+    as_pandas: bool = False,
+    executor: Executor | None = None,
+):
+    client = client or default_client()
+    clubs = await fetch_league_clubs(league=league, season_id=season_id, client=client, as_pandas=True, executor=executor)
+    squads = await asyncio.gather(*[
+        fetch_club_squad(slug=row.Slug, club_id=row.ID, club=row.Club, client=client, as_pandas=True, executor=executor)
+        for row in clubs.itertuples()
+    ])
+    data = pd.concat(squads, ignore_index=True)
+    if as_pandas:
+        return data
+    import pyarrow as pa
+
+    return pa.Table.from_pandas(data, preserve_index=False)
@@ -20,30 +20,29 @@ from classes.scraping import Scraper
 
 # Logger 
 logger = get_logger(__name__)
-# Function: Scrape the data from fbref
-def scrape_fbref(
-    url: str,
-    table_id: str,
-) -> pd.DataFrame:
+# Function: Extract the table
+def parse_table(table_html: str) -> pd.DataFrame:
+    df = pd.read_html(StringIO(table_html), flavor="lxml")[0]
+    df = flatten_columns(df)
+    # Resolve Nation problem
+    if "Nation" in df.columns:
+        df["Nation"] = df["Nation"].astype(str).str.split().str[-1]
+    return df
+
+# Function: Fetch the raw page from fbref
+def fetch_fbref(url: str) -> str:
     scraper = Scraper()
 
     try:
         # Use the 'impersonate' method directly as it handles the 403 and the timing
-        html = scraper.fetch_html(url, referer="https://fbref.com/")
+        return scraper.fetch_html(url, referer="https://fbref.com/")
     except Exception as e:
         logger.error(f"Critical failure fetching {url}: {e}")
         raise 
 
+# Function: Parse a table out of a fbref page (CPU only, safe to run in a worker)
+def parse_fbref(html: str, table_id: str, url: str = "") -> pd.DataFrame:
     soup = BeautifulSoup(html, "lxml")
-    
-    # Function: Extract the table
-    def parse_table(table_html: str) -> pd.DataFrame:
-        df = pd.read_html(StringIO(table_html), flavor="lxml")[0]
-        df = flatten_columns(df)
-        # Resolve Nation problem
-        if "Nation" in df.columns:
-            df["Nation"] = df["Nation"].astype(str).str.split().str[-1]
-        return df
 
     # Normal  
     t = soup.find("table", id=table_id)
@@ -66,3 +65,11 @@ def scrape_fbref(
         return parse_table(c_str)
 
     raise ValueError(f"Table id '{table_id}' not found on page: {url}")
+
+# Function: Scrape the data from fbref
+def scrape_fbref(
+    url: str,
+    table_id: str,
+) -> pd.DataFrame:
+    html = fetch_fbref(url)
+    return parse_fbref(html=html, table_id=table_id, url=url)
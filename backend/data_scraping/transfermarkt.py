@@ -21,10 +21,21 @@ from environment.variable import POSITION_MAP
 
 # Logger 
 logger = get_logger(__name__)
+# Function: URL of a league overview
+def league_url(league: str, competition: str, season_id: int) -> str:
+    return f"https://www.transfermarkt.com/{league}/startseite/wettbewerb/{competition}/saison_id/{season_id}"
+
+# Function: URL of a squad page
+def squad_url(slug: str, club_id: int | str) -> str:
+    return f"https://www.transfermarkt.com/{slug}/startseite/verein/{club_id}"
+
 # Function: Teams in the league
 def teams_in_league(league: str, competition: str, season_id: int) -> pd.DataFrame:
-    url = f"https://www.transfermarkt.com/{league}/startseite/wettbewerb/{competition}/saison_id/{season_id}"
-    html = Scraper().fetch_html(url, referer="https://www.transfermarkt.com/")
+    html = Scraper().fetch_html(league_url(league, competition, season_id), referer="https://www.transfermarkt.com/")
+    return parse_league_overview(html)
+
+# Function: Parse the league table of a league overview page
+def parse_league_overview(html: str) -> pd.DataFrame:
     soup = BeautifulSoup(html, "lxml")
     # Extract table 
     table = soup.select_one("div#yw2 table.items")
@@ -53,7 +64,34 @@ def teams_in_league(league: str, competition: str, season_id: int) -> pd.DataFra
             "Points_%": int(tds[5].get_text(strip=True)) / int(tds[3].get_text(strip=True)),
         })
 
-    return pd.DataFrame(rows)
+    # Squad size and total value per club (change signal of the squad pages)
+    summary = club_summaries(soup)
+    data = pd.DataFrame(rows)
+    data["Squad_Size"] = data["ID"].map(lambda i: summary.get(i, {}).get("Squad_Size"))
+    data["Total_Value_EUR"] = data["ID"].map(lambda i: summary.get(i, {}).get("Total_Value_EUR"))
+    return data
+
+# Function: Squad size and total market value per club ID from the clubs table of the league overview
+def club_summaries(soup: BeautifulSoup) -> dict:
+    table = soup.select_one("div#yw1 table.items")
+    if table is None:
+        logger.warning("League overview without clubs table, squads fall back to their refresh interval")
+        return {}
+    summary = {}
+    for tr in table.select("tbody tr"):
+        club_a = tr.select_one('td.hauptlink a[href*="/verein/"]')
+        m = re.search(r"/verein/(\d+)", club_a["href"]) if club_a else None
+        # Squad size: first centered integer cell (the logo cell is centered too)
+        squads = [td.get_text(strip=True) for td in tr.select("td.zentriert")]
+        squad = next((int(text) for text in squads if text.isdigit()), None)
+        value_tds = tr.select("td.rechts")
+        if not m or not value_tds:
+            continue
+        summary[int(m.group(1))] = {
+            "Squad_Size": squad,
+            "Total_Value_EUR": numeric_values_adaption(value_tds[-1].get_text(strip=True)),
+        }
+    return summary
 # Function: Find the ID of the team name
 # def table_with_league()
 
@@ -72,6 +110,10 @@ def scrape_transfermarkt(
         logger.error(f"Critical failure fetching {url}: {e}")
         raise 
 
+    return parse_squad(html=html, club=club)
+
+# Function: Parse the players of a squad page
+def parse_squad(html: str, club: str) -> pd.DataFrame:
     soup = BeautifulSoup(html, "lxml")
 
     table = soup.find("table", class_="items")
@@ -129,3 +171,46 @@ def scrape_transfermarkt(
         )
 
     return pd.DataFrame(rows)
+
+# Labels of the profile info table -> column
+PROFILE_FIELDS = {
+    "Height": "Height_m",
+    "Foot": "Foot",
+    "Player agent": "Agent",
+    "Joined": "Joined",
+    "Contract expires": "Contract_Expires",
+}
+
+# Function: Parse the info table of a player profile page
+def parse_profile(html: str) -> dict:
+    soup = BeautifulSoup(html, "lxml")
+    profile = {column: None for column in PROFILE_FIELDS.values()}
+    for label in soup.select("span.info-table__content--regular"):
+        column = PROFILE_FIELDS.get(label.get_text(strip=True).rstrip(":"))
+        value = label.find_next_sibling("span", class_="info-table__content--bold")
+        if column is None or value is None:
+            continue
+        text = value.get_text(" ", strip=True)
+        profile[column] = None if text in {"", "-"} else text
+
+    # Height "1,83 m" -> 1.83
+    if profile["Height_m"]:
+        m = re.search(r"(\d+[.,]\d+)", profile["Height_m"])
+        profile["Height_m"] = float(m.group(1).replace(",", ".")) if m else None
+    for column in ("Joined", "Contract_Expires"):
+        profile[column] = pd.to_datetime(profile[column], errors="coerce", format="mixed") if profile[column] else pd.NaT
+    return profile
+
+# Function: Parse the market value history (JSON of the value development graph)
+def parse_value_history(text: str, player_id: str) -> pd.DataFrame:
+    import json
+
+    points = json.loads(text).get("list") or []
+    return pd.DataFrame(
+        {
+            "Player_ID": player_id,
+            "Date": pd.to_datetime([point.get("x") for point in points], unit="ms"),
+            "Value_EUR": [point.get("y") for point in points],
+            "Club": [point.get("verein") for point in points],
+        }
+    )
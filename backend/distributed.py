@@ -0,0 +1,164 @@
+### Distributed crawl over the job queue ###
+"""
+The coordinator (python main.py scrape --distributed) enqueues one job per fbref table
+and per Transfermarkt league, workers (python main.py worker, processes on the host of
+the data folder, see JobQueue) run them and store the partitions. A league job enqueues the
+squad jobs of its expired clubs. Once the queue of the run is drained the coordinator
+merges the stored partitions into the sheets, without network requests.
+"""
+# Imports
+import os
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import pandas as pd
+
+# Local imports
+from backend import combine_data
+from classes.job_queue import JobQueue, SharedRateController, worker_identity
+from classes.rate_control import CircuitOpenError, set_rate_controller
+from functions.logger import get_logger
+from environment.variable import JOB_MAX_ATTEMPTS
+
+logger = get_logger(__name__)
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Host of the jobs of each kind (rate limits and breakers are per host)
+JOB_HOSTS = {
+    "fbref_table": "fbref.com",
+    "tm_league": "www.transfermarkt.com",
+    "tm_club": "www.transfermarkt.com",
+}
+
+# Function: Enqueue the crawl jobs of a run
+def enqueue_crawl(queue: JobQueue, run_id: str, refresh: dict, clubs: list | None = None) -> int:
+    jobs = [("fbref_table", {"league": league, "table": table}) for league, tables in refresh.items() for table in tables]
+    if clubs:
+        # Selected clubs are known up front, no league overview needed
+        all_clubs = combine_data.all_league_clubs(refresh_expired=False)
+        refresh_ids = combine_data.clubs_to_refresh(all_clubs=all_clubs, clubs=clubs)
+        jobs += [("tm_club", club_payload(club)) for _, club in all_clubs.iterrows() if club["ID"] in refresh_ids]
+    elif clubs is None:
+        jobs += [("tm_league", {"league": league}) for league in combine_data.tm_leagues]
+    for kind, payload in jobs:
+        queue.enqueue(run_id=run_id, kind=kind, payload=payload, host=JOB_HOSTS[kind])
+    logger.info("Run %s: %d jobs enqueued", run_id, len(jobs))
+    return len(jobs)
+
+# Function: JSON payload of a club job
+def club_payload(club: pd.Series) -> dict:
+    payload = {"Club": club["Club"], "Slug": club["Slug"], "ID": str(club["ID"])}
+    # The change signal is stored with the squad
+    signal = combine_data.club_signal(club)
+    if signal is not None:
+        payload.update(Squad_Size=signal["squad"], Total_Value_EUR=signal["value"])
+    return payload
+
+# Function: Run one job
+def run_job(queue: JobQueue, job: dict) -> None:
+    kind, payload = job["kind"], job["payload"]
+    if kind == "fbref_table":
+        combine_data.fbref_table(league=payload["league"], table=payload["table"])
+    elif kind == "tm_league":
+        clubs = combine_data.league_clubs(league=payload["league"], refresh=True)
+        # Squads whose refresh interval is over become jobs of the same run
+        for _, club in clubs[clubs["ID"].isin(combine_data.clubs_to_refresh(all_clubs=clubs))].iterrows():
+            queue.enqueue(run_id=job["run_id"], kind="tm_club", payload=club_payload(club), host=JOB_HOSTS["tm_club"])
+    elif kind == "tm_club":
+        combine_data.club_squad(club=pd.Series(payload))
+    else:
+        raise ValueError(f"Unknown job kind: {kind!r}")
+
+# Function: Worker loop (lease -> run -> complete / fail)
+def run_worker(idle_exit: float | None = None, poll: float = 2.0) -> int:
+    """
+    Runs jobs until no job was available for idle_exit seconds (None: forever).
+    The rate state is shared with all workers of the same egress through the queue.
+    """
+    queue = JobQueue()
+    worker, egress = worker_identity()
+    set_rate_controller(SharedRateController(queue=queue, egress=egress))
+    logger.info("Worker %s started (egress %s)", worker, egress)
+    done = 0
+    idle_since = time.monotonic()
+    while True:
+        job = queue.lease(worker=worker, egress=egress)
+        if job is None:
+            if idle_exit is not None and time.monotonic() - idle_since >= idle_exit:
+                break
+            time.sleep(poll)
+            continue
+        try:
+            run_job(queue=queue, job=job)
+        except CircuitOpenError as e:
+            # Host paused for this egress: the job waits until the breaker closes, it did not fail
+            logger.warning("Job %s paused: %s", job["id"], e)
+            queue.requeue(job_id=job["id"], worker=worker, not_before=e.until, error=str(e))
+        except Exception as e:
+            logger.exception("Job %s (%s %s) failed", job["id"], job["kind"], job["payload"])
+            queue.fail(job_id=job["id"], worker=worker, error=f"{type(e).__name__}: {e}", retry=True, max_attempts=JOB_MAX_ATTEMPTS)
+        else:
+            done += queue.complete(job_id=job["id"], worker=worker)
+        idle_since = time.monotonic()
+    logger.info("Worker %s done: %d jobs", worker, done)
+    return done
+
+# Function: Start local worker processes
+def start_workers(count: int, idle_exit: float) -> list:
+    command = [sys.executable, str(Path(ROOT, "main.py")), "worker", "--idle-exit", str(idle_exit)]
+    return [subprocess.Popen(command, cwd=ROOT, env=dict(os.environ)) for _ in range(count)]
+
+# Function: Wait until all jobs of a run are done or failed
+def wait_for_run(queue: JobQueue, run_id: str, poll: float = 2.0, processes: list | None = None) -> dict:
+    while True:
+        counts = queue.counts(run_id=run_id)
+        if not counts.get("pending") and not counts.get("leased"):
+            return counts
+        if processes and all(process.poll() is not None for process in processes):
+            raise RuntimeError(f"All local workers exited with open jobs: {counts}")
+        logger.info("Run %s: %s", run_id, counts, extra={"stage": "queue", "rate_limit": 30})
+        time.sleep(poll)
+
+# Function: Crawl through the queue, then merge
+def distributed_crawl(
+    leagues: list | None = None,
+    tables: list | None = None,
+    clubs: list | None = None,
+    local_workers: int = 0,
+    poll: float = 2.0,
+) -> None:
+    """
+    local_workers: worker processes started here (0: only external workers).
+    Raises if any job of the run failed for good, nothing is merged in that case.
+    """
+    refresh = combine_data.fbref_refresh(leagues=leagues, tables=tables, clubs=clubs)
+    # Transfermarkt is crawled on a full run or for selected clubs (as in data_table)
+    market = bool(clubs) or not (leagues or tables)
+    queue = JobQueue()
+    run_id = uuid.uuid4().hex[:12]
+    enqueue_crawl(queue=queue, run_id=run_id, refresh=refresh, clubs=clubs if market else [])
+
+    processes = start_workers(count=local_workers, idle_exit=max(10.0, 5 * poll)) if local_workers else None
+    try:
+        counts = wait_for_run(queue=queue, run_id=run_id, poll=poll, processes=processes)
+    finally:
+        for process in processes or []:
+            process.wait()
+    failed = queue.failed(run_id=run_id)
+    if failed:
+        for job in failed:
+            logger.error("Failed job %s %s: %s", job["kind"], job["payload"], job["error"])
+        raise RuntimeError(f"Run {run_id}: {len(failed)} jobs failed")
+    logger.info("Run %s crawled: %s", run_id, counts)
+
+    # Merge (all partitions are stored, nothing is scraped again)
+    if market:
+        combine_data.market_values_data(clubs=[])
+    # No league crawled (e.g. a market-only run): nothing to merge into the leagues
+    if refresh:
+        combine_data.player_stats_data(refresh={league: [] for league in refresh})
+    combine_data.export_stats_workbook()
@@ -0,0 +1,88 @@
+### Rating engine: category sub-scores and overall rating ###
+"""
+Compile FEATURES_SCHEMA into a category-weight matrix per position group.
+All sub-scores of a group come out of one matrix multiply over the standardized
+features, the overall rating out of a vectorized percentile ranking.
+"""
+# Imports
+from __future__ import annotations
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+# Local imports
+from environment.variable import FEATURES_SCHEMA, LOWER_IS_BETTER, NON_FEATURES, RATING_RANGE
+
+# Class: Compiled weights of one position group
+@dataclass(frozen=True)
+class CategoryMatrix:
+    group: str
+    features: list
+    categories: list
+    weights: np.ndarray  # shape (n_features, n_categories)
+
+# Function: Compile the feature schema into weight matrices
+def compile_schema(schema: dict = FEATURES_SCHEMA, lower_is_better: list = LOWER_IS_BETTER) -> dict:
+    """
+    Every category is the mean of its features. A feature listed in
+    lower_is_better enters with a negative sign, so a high sub-score is always good.
+    The matrices are tiny (~15 x 5), a dense array with zeros beats a sparse format here.
+    """
+    flipped = set(lower_is_better)
+    compiled = {}
+    for group, categories in schema.items():
+        features = list(dict.fromkeys(f for v in categories.values() for f in v))
+        index = {feature: i for i, feature in enumerate(features)}
+        weights = np.zeros((len(features), len(categories)), dtype=np.float64)
+        for j, category_features in enumerate(categories.values()):
+            for feature in category_features:
+                sign = -1.0 if feature in flipped else 1.0
+                weights[index[feature], j] = sign / len(category_features)
+        compiled[group] = CategoryMatrix(group=group, features=features, categories=list(categories), weights=weights)
+
+    return compiled
+
+# Function: Sub-scores of a standardized feature matrix
+def category_scores(values: np.ndarray, matrix: CategoryMatrix) -> np.ndarray:
+    # Missing features are left out of the category mean instead of poisoning it
+    available = ~np.isnan(values)
+    scores = np.where(available, values, 0.0) @ matrix.weights
+    coverage = available @ np.abs(matrix.weights)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return scores / coverage
+
+# Function: Map percentiles onto the rating scale
+def percentile_to_rating(percentiles: pd.DataFrame | pd.Series) -> pd.DataFrame | pd.Series:
+    low, high = RATING_RANGE
+    return (low + (high - low) * percentiles).round()
+
+# Function: Rate the players of one position group
+def rate_group(data: pd.DataFrame, matrix: CategoryMatrix, basis: str | None = "Pos_group") -> pd.DataFrame:
+    columns = [f"{basis}.{f}" if basis else f for f in matrix.features]
+    values = data.reindex(columns=columns).to_numpy(dtype=np.float64, na_value=np.nan)
+
+    scores = pd.DataFrame(
+        category_scores(values=values, matrix=matrix),
+        columns=[f"Score.{c}" for c in matrix.categories],
+        index=data.index,
+    )
+    scores["Score.Overall"] = scores.mean(axis=1, skipna=True)
+    # Percentile rank within the group (vectorized over all columns)
+    percentiles = scores.rank(pct=True)
+    percentiles.columns = [c.replace("Score.", "Percentile.", 1) for c in scores.columns]
+
+    meta = data[[c for c in NON_FEATURES if c in data.columns]]
+    rated = pd.concat([meta, scores, percentiles], axis=1)
+    rated["Rating"] = percentile_to_rating(percentiles["Percentile.Overall"])
+
+    return rated
+
+# Function: Rate the players of all position groups
+def rate_players(data: pd.DataFrame, basis: str | None = "Pos_group", schema: dict = FEATURES_SCHEMA) -> pd.DataFrame:
+    compiled = compile_schema(schema=schema)
+    ratings = [
+        rate_group(data=data[data["Pos_group"] == group], matrix=matrix, basis=basis)
+        for group, matrix in compiled.items()
+    ]
+
+    return pd.concat(ratings, ignore_index=True)
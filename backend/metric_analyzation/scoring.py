@@ -10,50 +10,60 @@ Besides that we want maybe sub-scores in various categories but that is secondar
 Furthermore based on soft and hard factors a transfer market value is approximated and compared to its real value
 """
 # Imports
+import numpy as np
 import pandas as pd
 
 # Local imports
-from functions.utils import load_excel, store_excel, update_sheets
-from functions.data_related import standardize_data
-from environment.variable import STATS_NAME, MARKET_SHEET_NAME, SHEETS, POSITION_NAME, FEATURES_SCHEMA, NON_FEATURES, POSITION_GROUPS
+from functions.utils import load_excel, export_workbook, update_sheets, store_feature_matrix
+from functions.data_related import standardize_data, age_band
+from functions.memory import track_memory
+from backend.metric_analyzation.rating import rate_players
+from backend.metric_analyzation.uncertainty import bootstrap_intervals
+from backend.changes import RATING_FEED, record_changes, row_hash
+from environment.variable import STATS_NAME, SHEETS, POSITION_NAME, RATING_NAME, FEATURES_SCHEMA, NON_FEATURES, AGE_BANDS
 # Function: Build up the scoring
-def prepare_scoring():
-    # Data
-    tm_data = load_excel(name=STATS_NAME, sheet_name=MARKET_SHEET_NAME)
-    stats_data = load_excel(name=STATS_NAME, sheet_name="All")
-    # Group mapping
-    group_dict = {
-        "League": stats_data.League.unique().tolist(),
-        "Age": [range(0,19), range(19,23), range(23, 30), range(30,101)],
-        "Pos_group": stats_data.Pos_group.unique().tolist() 
-    }
-    pos_groups = set(POSITION_GROUPS.values())
-    # Standardize the data
-    all_data = pd.DataFrame()
-    overall_data = pd.DataFrame()
-    for position_group, features in FEATURES_SCHEMA.items():
-        # Filter data for the current position
-        temp_pos_data = stats_data[stats_data["Pos_group"] == position_group]
-        features = list(f for v in features.values() for f in v)
-        feature_data = pd.DataFrame()
-        # Loop through the different categories
-        for column, group in group_dict.items():
-            data = standardize_data(data=temp_pos_data, columns_interest=features, grouping=group, column=column)
-            if feature_data.empty:
-                feature_data = data
-            else:
-               feature_data = pd.merge(feature_data, data, on=NON_FEATURES)
+def prepare_scoring(stats_data: pd.DataFrame | None = None):
+    # Data (a warm process passes the combined frame instead of reading the workbook again)
+    if stats_data is None:
+        stats_data = load_excel(name=STATS_NAME, sheet_name="All")
+    with track_memory("standardize") as memory:
+        # Group key per row for every comparison (fbref ages are "years-days", grouped into AGE_BANDS)
+        group_keys = {
+            "League": stats_data["League"],
+            "Age": age_band(stats_data["Age"], bands=AGE_BANDS),
+            "Pos_group": stats_data["Pos_group"],
+        }
+        # Standardize the data (one frame per position group, concatenated once)
+        sheets, stats_hashes = {}, []
+        for position_group, features in FEATURES_SCHEMA.items():
+            # Filter data for the current position
+            mask = stats_data["Pos_group"] == position_group
+            temp_pos_data = stats_data[mask]
+            features = list(dict.fromkeys(f for v in features.values() for f in v))
+            # All comparisons share the row index: side by side instead of merged
+            parts = [temp_pos_data[NON_FEATURES]] + [
+                standardize_data(data=temp_pos_data, columns_interest=features, column=column, groups=keys[mask])
+                for column, keys in group_keys.items()
+            ]
+            feature_data = pd.concat(parts, axis=1).reset_index(drop=True)
+            # Hash of the player's own (not standardized) stats for the change feed
+            stats_hashes.append(row_hash(temp_pos_data[features]))
+            # Store 
+            sheets[position_group] = feature_data
+            store_feature_matrix(data=feature_data, name=position_group, features=[c for c in feature_data.columns if c not in NON_FEATURES])
 
-        # Concat data
-        if overall_data.empty:
-            overall_data = feature_data
-        else:
-           overall_data = pd.concat([overall_data, feature_data])
-        # Store 
-        store_excel(data=feature_data, name=POSITION_NAME, sheet_name=position_group)
+        # Store (all sheets in one pass)
+        overall_data = pd.concat(list(sheets.values()), ignore_index=True)
+        memory["result"] = overall_data
+        sheets["All"] = overall_data
+    export_workbook(sheets=sheets, name=POSITION_NAME)
 
-    # Store 
-    store_excel(data=overall_data, name=POSITION_NAME, sheet_name="All")
+    # Sub-scores and overall rating, with bootstrap intervals (same row order)
+    ratings = rate_players(data=overall_data)
+    intervals = bootstrap_intervals(data=stats_data)
+    export_workbook(sheets={"All": ratings, "Intervals": intervals}, name=RATING_NAME)
+    # Players whose stats, club or rating moved (ratings keep the row order of overall_data)
+    record_changes(data=ratings.assign(Stats_Hash=np.concatenate(stats_hashes)), spec=RATING_FEED)
 
 
 
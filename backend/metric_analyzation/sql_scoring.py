@@ -0,0 +1,238 @@
+### SQL scoring engine (DuckDB over the parquet partitions) ###
+"""
+Same results as prepare_scoring / rate_players, expressed as SQL window aggregates:
+    - per-90 normalization of normalize_data (for sources that are not normalized yet),
+      with the empirical-Bayes shrinkage of shrink_rates if shrink is on
+    - z-scores by League / Age band / Pos_group within every position group
+    - category sub-scores, percentile ranks and the rating
+DuckDB reads the parquet files lazily, runs on all cores, spills to disk above
+SQL_MEMORY_LIMIT and writes the results straight to parquet (COPY ... TO), so no
+frame is materialized in Python. Results go to SCORING_PATH/<group>.parquet and
+SCORING_PATH/Ratings.parquet.
+"""
+# Imports
+from __future__ import annotations
+import os
+from pathlib import Path
+
+# Local imports
+from backend.metric_analyzation.rating import compile_schema
+from functions.data_related import is_count_feature, is_event_count
+from functions.logger import get_logger
+from functions.manifest import record_refresh
+from environment.variable import (
+    DATA_PATH, FEATURES_SCHEMA, NON_FEATURES, AGE_BANDS, RATING_RANGE,
+    SQL_MEMORY_LIMIT, SQL_THREADS, SCORING_PATH, SHRINK_RATES, SHRINK_PRIOR,
+)
+
+logger = get_logger(__name__)
+
+# Function: Quote an identifier (feature names hold dots, spaces and %)
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+# Function: Quote a string literal
+def literal(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+# Function: Age band of a row (same labels as data_related.age_band)
+def age_band_sql(column: str = "Age", bands: list = AGE_BANDS) -> str:
+    years = f"TRY_CAST(split_part(CAST({quote(column)} AS VARCHAR), '-', 1) AS DOUBLE)"
+    cases = " ".join(f"WHEN {years} >= {low} AND {years} < {high} THEN '{low}-{high - 1}'" for low, high in bands)
+    return f"CASE {cases} END"
+
+# Function: Per-90 expression of a feature (same rule as data_related.normalize_data)
+def per_90_sql(feature: str) -> str:
+    if not is_count_feature(feature):
+        return quote(feature)
+    return f"CAST({quote(feature)} AS DOUBLE) / {quote('Playing_Time.90s')}"
+
+# Function: Per-90 rates shrunk toward their prior group (same model as data_related.shrink_rates)
+def shrink_sql(source: str, names: list, counts: list, prior: list, totals: list = ()) -> str:
+    """
+    source: relation with the raw counts, names: its columns, counts: the event counts to
+    shrink, prior: the group keys, totals: columns only divided by the 90s played.
+    Window aggregates in three steps: exposure and rate, pooled rate of the group, spread
+    of the rates around it.
+    """
+    played = f"CAST({quote('Playing_Time.90s')} AS DOUBLE)"
+    window = f"WINDOW w AS (PARTITION BY {', '.join(quote(column) for column in prior)})"
+    base, pooled, spread, shrunk = [], [], [], {}
+    for i, feature in enumerate(counts):
+        count = f"CAST({quote(feature)} AS DOUBLE)"
+        e, r, t, m, p, v = (quote(f"__{part}{i}") for part in "ertmpv")
+        base.append(f"CASE WHEN {count} IS NOT NULL AND {played} > 0 THEN {played} ELSE 0 END AS {e}, {count} / {played} AS {r}")
+        pooled.append(
+            f"sum({e}) OVER w AS {t}, sum(CASE WHEN {e} > 0 THEN {count} END) OVER w / sum({e}) OVER w AS {m}, "
+            f"count(CASE WHEN {e} > 0 THEN 1 END) OVER w AS {p}"
+        )
+        spread.append(f"sum(CASE WHEN {e} > 0 THEN {e} * ({r} - {m}) ** 2 END) OVER w / {t} - {m} * {p} / {t} AS {v}")
+        # Prior variance clipped at zero; no variation at all (0 / 0) keeps the rate
+        variance = f"CASE WHEN {v} < 0 THEN 0.0 ELSE {v} END"
+        weight = f"{variance} / ({variance} + {m} / {played})"
+        weight = f"CASE WHEN {weight} IS NULL OR isnan({weight}) THEN 1.0 ELSE {weight} END"
+        shrunk[feature] = f"CASE WHEN {e} > 0 THEN {m} + {weight} * ({r} - {m}) ELSE {r} END"
+    shrunk.update({total: per_90_sql(total) for total in totals})
+    columns = [f"{shrunk[name]} AS {quote(name)}" if name in shrunk else quote(name) for name in names]
+    return (
+        f"WITH base AS (SELECT *, {', '.join(base)} FROM {source}), "
+        f"pooled AS (SELECT *, {', '.join(pooled)} FROM base {window}), "
+        f"spread AS (SELECT *, {', '.join(spread)} FROM pooled {window}) "
+        f"SELECT {', '.join(columns)} FROM spread"
+    )
+
+# Function: Per-90 normalization of a relation (same rule as data_related.normalize_data)
+def normalize_sql(source: str, names: list, features: list, shrink: bool = SHRINK_RATES, prior: list = SHRINK_PRIOR) -> str:
+    counts = [name for name in features if is_count_feature(name)]
+    events = [name for name in counts if is_event_count(name)]
+    if shrink and events:
+        # Totals that are no event counts are not shrunk
+        return shrink_sql(source=source, names=names, counts=events, prior=prior, totals=[name for name in counts if name not in events])
+    selected = [per_90_sql(name) + f" AS {quote(name)}" if name in features else quote(name) for name in names]
+    return f"SELECT {', '.join(selected)} FROM {source}"
+
+# Function: Features of a position group (schema order, each once)
+def group_features(categories: dict) -> list:
+    return list(dict.fromkeys(f for v in categories.values() for f in v))
+
+# Function: Identifying columns kept with the scores (NON_FEATURES and the by keys)
+def meta_columns(by: list) -> list:
+    return NON_FEATURES + [column for column in by if column not in NON_FEATURES]
+
+# Function: Standardized features of one position group
+def standardize_sql(source: str, group: str, features: list, by: list) -> str:
+    """z-scores by League, Age band and Pos_group (and the extra keys in by, e.g. a season)."""
+    keys = {"League": quote("League"), "Age": quote("__age_band"), "Pos_group": quote("Pos_group")}
+    extra = [quote(column) for column in by]
+    windows, columns = [], [quote(column) for column in meta_columns(by)]
+    for basis, key in keys.items():
+        window = f"w_{basis.lower()}"
+        windows.append(f"{window} AS (PARTITION BY {', '.join(extra + [key])})")
+        for feature in features:
+            value = f"CAST({quote(feature)} AS DOUBLE)"
+            # Rows without a group key are not standardized (as pandas groupby drops them)
+            columns.append(
+                f"CASE WHEN {key} IS NOT NULL THEN ({value} - avg({value}) OVER {window}) / stddev_samp({value}) OVER {window} END "
+                f"AS {quote(f'{basis}.{feature}')}"
+            )
+    return (
+        f"SELECT {', '.join(columns)} "
+        f"FROM (SELECT *, {age_band_sql()} AS __age_band FROM {source} WHERE {quote('Pos_group')} = {literal(group)}) "
+        f"WINDOW {', '.join(windows)}"
+    )
+
+# Function: Average percentile rank within the table, per by key (pandas rank(pct=True))
+def percentile_sql(column: str, by: list | None = None) -> str:
+    column = quote(column)
+    keys = [quote(key) for key in by or []]
+    partition = f"PARTITION BY {', '.join(keys)} " if keys else ""
+    return (
+        f"CASE WHEN {column} IS NOT NULL THEN "
+        f"(rank() OVER ({partition}ORDER BY {column}) + (count(*) OVER (PARTITION BY {', '.join(keys + [column])}) - 1) / 2.0) "
+        f"/ count({column}) OVER ({partition.strip()}) END"
+    )
+
+# Function: Sub-scores, percentiles and rating of one position group (as rating.rate_group, per by key)
+def rating_sql(source: str, matrix, basis: str = "Pos_group", by: list | None = None) -> str:
+    scores = []
+    for j, category in enumerate(matrix.categories):
+        terms, coverage = [], []
+        for i, feature in enumerate(matrix.features):
+            weight = float(matrix.weights[i, j])
+            if weight == 0.0:
+                continue
+            z = quote(f"{basis}.{feature}" if basis else feature)
+            terms.append(f"{weight!r} * coalesce({z}, 0)")
+            coverage.append(f"{abs(weight)!r} * CAST({z} IS NOT NULL AS INTEGER)")
+        scores.append(f"({' + '.join(terms)}) / nullif({' + '.join(coverage)}, 0) AS {quote(f'Score.{category}')}")
+    categories = [quote(f"Score.{c}") for c in matrix.categories]
+    overall = (
+        f"({' + '.join(f'coalesce({c}, 0)' for c in categories)}) / "
+        f"nullif({' + '.join(f'CAST({c} IS NOT NULL AS INTEGER)' for c in categories)}, 0)"
+    )
+    names = [f"Score.{c}" for c in matrix.categories] + ["Score.Overall"]
+    percentiles = [f"{percentile_sql(name, by=by)} AS {quote('Percentile.' + name[len('Score.'):])}" for name in names]
+    low, high = RATING_RANGE
+    meta = ", ".join(quote(column) for column in meta_columns(by or []))
+    return (
+        f"WITH scores AS (SELECT {meta}, {', '.join(scores)} FROM {source}), "
+        f"overall AS (SELECT *, {overall} AS {quote('Score.Overall')} FROM scores), "
+        f"ranked AS (SELECT *, {', '.join(percentiles)} FROM overall) "
+        f"SELECT *, round_even({low} + {high - low} * {quote('Percentile.Overall')}, 0) AS {quote('Rating')} FROM ranked"
+    )
+
+# Function: Open DuckDB with the out-of-core settings
+def connect(memory_limit: str = SQL_MEMORY_LIMIT, threads: int | None = SQL_THREADS):
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("The SQL scoring engine needs duckdb (pip install duckdb)") from e
+
+    con = duckdb.connect()
+    spill = Path(DATA_PATH, "duckdb_tmp")
+    spill.mkdir(parents=True, exist_ok=True)
+    con.execute(f"SET memory_limit = {literal(memory_limit)}")
+    con.execute(f"SET temp_directory = {literal(spill)}")
+    con.execute(f"SET threads = {int(threads or os.cpu_count() or 1)}")
+    # Row order is not needed, lets the COPY stream in parallel
+    con.execute("SET preserve_insertion_order = false")
+    return con
+
+# Function: Run the scoring in SQL
+def sql_scoring(
+    source: str | None = None,
+    normalize: bool = False,
+    by: list | None = None,
+    output: Path = SCORING_PATH,
+    schema: dict = FEATURES_SCHEMA,
+    shrink: bool = SHRINK_RATES,
+    prior: list = SHRINK_PRIOR,
+) -> dict:
+    """
+    source: parquet file(s) / glob, default all league partitions (data/leagues/*.parquet);
+    several seasons e.g. "data/backfill/*/leagues/*.parquet" with by=["Date"] (z-scores,
+    shrinkage and percentile ranks then stay within each season).
+    normalize: apply the per-90 normalization first (source not normalized yet); with shrink
+    the rates are shrunk toward their prior group (per by key) as in normalize_data.
+    Returns the number of rows written per output file.
+    """
+    source = source or str(Path(DATA_PATH, "leagues", "*.parquet"))
+    by = by or []
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    con = connect()
+    compiled = compile_schema(schema=schema)
+
+    # Lazy view over the parquet files (nothing is read yet)
+    columns = con.execute(f"DESCRIBE SELECT * FROM read_parquet({literal(source)}, union_by_name = true)").fetchall()
+    names = [column[0] for column in columns]
+    parquet = f"read_parquet({literal(source)}, union_by_name = true)"
+    features = [name for name in names if name not in NON_FEATURES and name not in by]
+    if normalize:
+        con.execute(f"CREATE VIEW source AS {normalize_sql(source=parquet, names=names, features=features, shrink=shrink, prior=by + list(prior))}")
+    else:
+        con.execute(f"CREATE VIEW source AS SELECT * FROM {parquet}")
+
+    written = {}
+    for group, categories in schema.items():
+        features = group_features(categories)
+        # Features no source file has stay empty
+        missing = [f"CAST(NULL AS DOUBLE) AS {quote(feature)}" for feature in features if feature not in names]
+        view = f"(SELECT *, {', '.join(missing)} FROM source)" if missing else "source"
+        path = Path(output, f"{group}.parquet")
+        query = standardize_sql(source=view, group=group, features=features, by=by)
+        written[group] = con.execute(f"COPY ({query}) TO {literal(path)} (FORMAT PARQUET)").fetchone()[0]
+        record_refresh(name="scoring", sheet=group, rows=written[group])
+
+    # Ratings of all groups in one file (columns matched by name)
+    ratings = " UNION ALL BY NAME ".join(
+        "(" + rating_sql(source=f"read_parquet({literal(Path(output, group + '.parquet'))})", matrix=matrix, by=by) + ")"
+        for group, matrix in compiled.items()
+    )
+    path = Path(output, "Ratings.parquet")
+    written["Ratings"] = con.execute(f"COPY ({ratings}) TO {literal(path)} (FORMAT PARQUET)").fetchone()[0]
+    record_refresh(name="scoring", sheet="Ratings", rows=written["Ratings"])
+    con.close()
+    logger.info("SQL scoring written to %s: %s", output, written)
+
+    return written
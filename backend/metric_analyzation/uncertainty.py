@@ -0,0 +1,122 @@
+### Bootstrap confidence intervals of the scores ###
+"""
+Parametric bootstrap of the per-90 features: a rate r over n 90s stems from a count
+of about r * n events, resampled with Poisson noise (normal approximation, clipped at
+zero), so a player with 5 x 90s gets a much wider band than one with 35 x 90s.
+Only counted events are resampled (is_event_count, without NON_COUNT_TOTALS); shares,
+averages and ratios (RATIO_FEATURES), distances, expected goals and the playing time
+are kept fixed.
+Every resample is standardized with the statistics of the position group and pushed
+through the category matrix, batched as (players, resamples, features) arrays.
+All players share one bank of standard normal draws per group (common random
+numbers): the interval of each player is exact, only the draws are reused.
+"""
+# Imports
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+
+# Local imports
+from backend.metric_analyzation.rating import CategoryMatrix, compile_schema
+from functions.data_related import is_event_count
+from functions.logger import get_logger
+from environment.variable import FEATURES_SCHEMA, NON_FEATURES, BOOTSTRAP_RESAMPLES, BOOTSTRAP_LEVEL, BOOTSTRAP_SEED, BOOTSTRAP_CHUNK
+
+logger = get_logger(__name__)
+
+# Function: Mask of the features resampled as event rates
+def noisy_features(features: list) -> np.ndarray:
+    return np.array([is_event_count(feature) for feature in features], dtype=bool)
+
+# Function: Bootstrap intervals of the features and sub-scores of one position group
+def bootstrap_group(
+    data: pd.DataFrame,
+    matrix: CategoryMatrix,
+    rng: np.random.Generator,
+    resamples: int = BOOTSTRAP_RESAMPLES,
+    level: float = BOOTSTRAP_LEVEL,
+    chunk: int = BOOTSTRAP_CHUNK,
+    basis: str = "Pos_group",
+) -> pd.DataFrame:
+    # float32: the resample arrays dominate time and memory, their precision is plenty
+    values = data.reindex(columns=matrix.features).to_numpy(dtype=np.float32, na_value=np.nan)
+    played = data["Playing_Time.90s"].to_numpy(dtype=np.float32)
+    available = ~np.isnan(values)
+    mean = np.nanmean(values, axis=0)
+    std = np.nanstd(values, axis=0, ddof=1)
+    noisy = noisy_features(matrix.features)
+    # Standard error of a rate: sqrt(count) / 90s = sqrt(rate / 90s)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scale = np.where(available & noisy & (played[:, None] > 0), np.sqrt(np.clip(values, 0, None) / played[:, None]), 0.0)
+        # Standardized resample = center + spread * draw, clipped where the count would turn negative
+        center = np.where(available, (values - mean) / std, 0.0).astype(np.float32)
+        spread = np.nan_to_num(scale / std).astype(np.float32)
+        floor = np.where(noisy, -mean / std, -np.inf).astype(np.float32)
+    bank = rng.standard_normal((resamples, len(matrix.features)), dtype=np.float32)
+    quantiles = np.array([(1 - level) / 2, (1 + level) / 2])
+
+    # Features are monotone in their draw: the quantiles of the bank map onto exact bounds
+    feature_bounds = [
+        np.where(available, np.maximum(center + spread * q, floor), np.nan) for q in np.quantile(bank, quantiles, axis=0)
+    ]
+
+    # Sub-scores as in category_scores: missing features are left out of the category mean.
+    # The coverage does not change between resamples, so it is folded into per-player weights
+    coverage = available @ np.abs(matrix.weights)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weights = np.where(coverage[:, None, :] > 0, matrix.weights[None, :, :] / coverage[:, None, :], 0.0)
+        covered = coverage > 0
+        # Overall = mean of the available sub-scores
+        overall = weights.sum(axis=2, keepdims=True) / covered.sum(axis=1)[:, None, None]
+    weights = np.concatenate([weights, overall], axis=2).astype(np.float32)
+    covered = np.concatenate([covered, covered.any(axis=1, keepdims=True)], axis=1)
+
+    # Evaluate every resample, batched over players; quantiles from the sorted resamples (linear interpolation)
+    position = quantiles * (resamples - 1)
+    below = np.floor(position).astype(int)
+    above = np.minimum(below + 1, resamples - 1)
+    fraction = (position - below).astype(np.float32)[:, None, None]
+    score_bounds = np.empty((2, len(data), weights.shape[2]), dtype=np.float32)
+    for start in range(0, len(data), chunk):
+        rows = slice(start, start + chunk)
+        z = spread[rows, None, :] * bank
+        z += center[rows, None, :]
+        np.maximum(z, floor, out=z)
+        scores = np.sort(np.matmul(z, weights[rows]), axis=1)
+        low, high = scores[:, below, :].transpose(1, 0, 2), scores[:, above, :].transpose(1, 0, 2)
+        score_bounds[:, rows, :] = low + fraction * (high - low)
+    score_bounds = np.where(covered, score_bounds, np.nan)
+
+    features = [f"{basis}.{f}" if basis else f for f in matrix.features]
+    scores = [f"Score.{c}" for c in matrix.categories] + ["Score.Overall"]
+    columns = {}
+    for name, (low, high) in zip(features + scores, zip(
+        np.concatenate([feature_bounds[0], score_bounds[0]], axis=1).T,
+        np.concatenate([feature_bounds[1], score_bounds[1]], axis=1).T,
+    )):
+        columns[f"CI_low.{name}"] = low
+        columns[f"CI_high.{name}"] = high
+    meta = data[[c for c in NON_FEATURES if c in data.columns]].reset_index(drop=True)
+
+    return pd.concat([meta, pd.DataFrame(columns)], axis=1)
+
+# Function: Bootstrap intervals of all players (per position group)
+def bootstrap_intervals(
+    data: pd.DataFrame,
+    resamples: int = BOOTSTRAP_RESAMPLES,
+    level: float = BOOTSTRAP_LEVEL,
+    seed: int | None = BOOTSTRAP_SEED,
+    schema: dict = FEATURES_SCHEMA,
+) -> pd.DataFrame:
+    """
+    data: per-90 features (not standardized) with "Playing_Time.90s" and "Pos_group".
+    Returns CI_low./CI_high. columns for every standardized feature and sub-score.
+    """
+    rng = np.random.default_rng(seed)
+    intervals = [
+        bootstrap_group(data=data[data["Pos_group"] == group], matrix=matrix, rng=rng, resamples=resamples, level=level)
+        for group, matrix in compile_schema(schema=schema).items()
+    ]
+    logger.info("Bootstrap intervals: %d players, %d resamples, level %.2f", len(data), resamples, level)
+
+    return pd.concat(intervals, ignore_index=True)
@@ -0,0 +1,153 @@
+### Player profile enrichment ###
+"""
+Crawls the Transfermarkt profile pages (contract, foot, height, agent) and the market
+value history of the player pool. Only profiles whose list-level market value or club
+changed since they were fetched (or older than PROFILE_MAX_AGE days) are fetched again.
+Results are stored by Player_ID in the partitions transfermarkt/profiles and
+transfermarkt/value_history: every PROFILE_FLUSH players go to a chunk file of their
+own, merged into the partition once at the end (or by the next run after a crash).
+"""
+# Imports
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+# Local imports
+from backend.data_scraping.transfermarkt import parse_profile, parse_value_history
+from classes.rate_control import CircuitOpenError
+from classes.scraping import Scraper
+from functions.logger import get_logger
+from functions.utils import load_partition, store_partition
+from environment.variable import DATA_PATH, PROFILE_WORKERS, PROFILE_FLUSH, PROFILE_MAX_AGE, PROFILE_HISTORY
+
+logger = get_logger(__name__)
+
+# Function: URL of the market value history of a player
+def history_url(player_id: str) -> str:
+    return f"https://www.transfermarkt.com/ceapi/marketValueDevelopment/graph/{player_id}"
+
+# Function: Fetch and parse one profile (and its value history)
+def fetch_profile(player: dict) -> tuple:
+    scraper = Scraper()
+    html = scraper.fetch_html(player["TM_URL"], referer="https://www.transfermarkt.com/")
+    profile = {
+        "Player_ID": player["Player_ID"],
+        **parse_profile(html),
+        # List-level values at fetch time (change detection)
+        "List_Value_EUR": player["Market_Value_EUR"],
+        "List_Club": player["Club"],
+        "Fetched": pd.Timestamp.now().floor("s"),
+    }
+    history = None
+    if PROFILE_HISTORY:
+        history = parse_value_history(scraper.fetch_html(history_url(player["Player_ID"]), referer=player["TM_URL"]), player_id=player["Player_ID"])
+    return profile, history
+
+# Function: Players whose profile is missing, changed on the squad list or too old
+def profiles_to_refresh(players: pd.DataFrame, profiles: pd.DataFrame | None, max_age: int = PROFILE_MAX_AGE) -> pd.DataFrame:
+    if profiles is None or profiles.empty:
+        return players
+    known = players.merge(profiles[["Player_ID", "List_Value_EUR", "List_Club", "Fetched"]], on="Player_ID", how="left")
+    value, list_value = known["Market_Value_EUR"], known["List_Value_EUR"]
+    value_changed = (value != list_value) & ~(value.isna() & list_value.isna())
+    club_changed = known["Club"] != known["List_Club"]
+    expired = known["Fetched"].isna() | (known["Fetched"] < pd.Timestamp(datetime.now() - timedelta(days=max_age)))
+    return players[(value_changed | club_changed | expired).to_numpy()]
+
+# Function: Replace the rows of the given keys in a partition
+def upsert_partition(data: pd.DataFrame, name: str, partition: str = "All", key: str = "Player_ID") -> pd.DataFrame:
+    stored = load_partition(name=name, partition=partition)
+    if stored is not None and not stored.empty:
+        data = pd.concat([stored[~stored[key].isin(data[key])], data], ignore_index=True)
+    store_partition(data=data, name=name, partition=partition)
+    return data
+
+# Function: Folder of the chunks of a partition not merged yet
+def chunk_folder(name: str) -> Path:
+    return Path(DATA_PATH, name, "chunks")
+
+# Function: Store a chunk of rows as a file of its own (progress of a long crawl)
+def store_chunk(data: pd.DataFrame, name: str) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    folder = chunk_folder(name)
+    folder.mkdir(parents=True, exist_ok=True)
+    # Names sort by write time; written atomically, a half written chunk is never merged
+    path = folder / f"{time.time_ns():020d}-{os.getpid()}.parquet"
+    temp = path.with_suffix(".tmp")
+    pq.write_table(pa.Table.from_pandas(data, preserve_index=False), temp)
+    os.replace(temp, path)
+
+# Function: Merge all chunks into the partition in one write
+def merge_chunks(name: str, partition: str = "All", key: str = "Player_ID") -> pd.DataFrame | None:
+    import pyarrow.parquet as pq
+
+    chunks = sorted(chunk_folder(name).glob("*.parquet"))
+    if not chunks:
+        return load_partition(name=name, partition=partition)
+    data = pd.concat([pq.read_table(path).to_pandas().assign(_chunk=i) for i, path in enumerate(chunks)], ignore_index=True)
+    # The rows of a key come from its latest chunk (a history has several rows per player)
+    data = data[data["_chunk"] == data.groupby(key)["_chunk"].transform("max")].drop(columns="_chunk")
+    merged = upsert_partition(data=data, name=name, partition=partition, key=key)
+    for path in chunks:
+        path.unlink()
+    return merged
+
+# Function: Enrich the player pool with the profile data
+def enrich_profiles(workers: int = PROFILE_WORKERS, limit: int | None = None) -> pd.DataFrame:
+    """
+    workers: parallel fetches (the rate controller still spaces the requests per host).
+    limit: fetch at most this many profiles (first ones of the queue).
+    A paused host (403 breaker) stops the crawl after the running chunk was stored.
+    """
+    players = load_partition(name="transfermarkt", partition="All")
+    if players is None:
+        raise FileNotFoundError("No transfermarkt data stored yet, run the market values first")
+    players = players.dropna(subset=["Player_ID", "TM_URL"]).drop_duplicates(subset="Player_ID")
+    # Chunks left by an interrupted run count as fetched
+    merge_chunks(name="transfermarkt/value_history")
+    todo = profiles_to_refresh(players=players, profiles=merge_chunks(name="transfermarkt/profiles"))
+    if limit is not None:
+        todo = todo.head(limit)
+    logger.info("Profiles: %d of %d players changed", len(todo), len(players), extra={"stage": "plan"})
+
+    records = todo[["Player_ID", "TM_URL", "Market_Value_EUR", "Club"]].to_dict("records")
+    fetched = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for start in range(0, len(records), PROFILE_FLUSH):
+                chunk = records[start:start + PROFILE_FLUSH]
+                futures = [(player, pool.submit(fetch_profile, player)) for player in chunk]
+                profiles, histories, paused = [], [], None
+                for player, future in futures:
+                    try:
+                        profile, history = future.result()
+                    except CircuitOpenError as e:
+                        paused = e
+                        continue
+                    except Exception as e:
+                        logger.warning("Profile of %s failed: %s", player["Player_ID"], e, extra={"url": player["TM_URL"]})
+                        continue
+                    profiles.append(profile)
+                    if history is not None:
+                        histories.append(history)
+                # Store the chunk before going on (a long crawl keeps its progress)
+                if profiles:
+                    store_chunk(data=pd.DataFrame(profiles), name="transfermarkt/profiles")
+                    fetched += len(profiles)
+                if histories:
+                    store_chunk(data=pd.concat(histories, ignore_index=True), name="transfermarkt/value_history")
+                logger.info("Profiles: %d of %d fetched", fetched, len(records), extra={"stage": "enrich"})
+                if paused is not None:
+                    raise paused
+    finally:
+        # One merge per partition, also when the crawl was paused
+        merge_chunks(name="transfermarkt/value_history")
+        profiles = merge_chunks(name="transfermarkt/profiles")
+
+    return profiles
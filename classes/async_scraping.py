@@ -0,0 +1,95 @@
+### Async scraper for asyncio services ###
+"""
+Async counterpart of Scraper with the same throttle and retry policy: the request
+slots come from the shared RateController (one per process, also used by the
+blocking Scraper), the waits are awaited instead of slept, so the event loop never
+blocks during a backoff. One client is meant to be shared by all callers of a loop;
+max_connections bounds the connections of its session.
+"""
+# Imports
+from __future__ import annotations
+import asyncio
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+# Local imports
+from functions.logger import get_logger
+from classes.rate_control import RateController
+from classes.scraping import FetchPolicy
+from environment.variable import ASYNC_MAX_CONNECTIONS
+
+logger = get_logger(__name__)
+
+# Class: Async scraping
+class AsyncScraper(FetchPolicy):
+
+    def __init__(
+        self,
+        timeout: int = 30,
+        max_tries_429: int = 6,
+        base_backoff_s: float = 2.0,
+        headers: Optional[dict] = None,
+        mode: Optional[str] = None,
+        min_delay: Optional[float] = None,
+        rates: Optional[RateController] = None,
+        max_connections: int = ASYNC_MAX_CONNECTIONS,
+    ) -> None:
+        super().__init__(
+            timeout=timeout, max_tries_429=max_tries_429, base_backoff_s=base_backoff_s,
+            headers=headers, mode=mode, min_delay=min_delay, rates=rates,
+        )
+        self.max_connections = max_connections
+        # Created on first use, inside the running loop
+        self._session = None
+
+    async def __aenter__(self) -> "AsyncScraper":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _client(self):
+        if self._session is None:
+            from curl_cffi.requests import AsyncSession
+
+            self._session = AsyncSession(impersonate="firefox", max_clients=self.max_connections)
+        return self._session
+
+    async def _smart_delay(self, host: str) -> None:
+        """Waits for the next request slot of the host without blocking the loop."""
+        wait = self.rates.reserve(host)
+        if wait > 0:
+            logger.debug("Throttling %s for %.2fs", host, wait, extra={"stage": "throttle", "duration": round(wait, 3)})
+            await asyncio.sleep(wait)
+
+    async def fetch_html(self, url: str, referer: Optional[str] = None) -> str:
+        if self.mode == "archive":
+            return await asyncio.to_thread(self.archived, url)
+        logger.info("Fetching: %s", url, extra={"stage": "fetch", "url": url})
+        started = time.perf_counter()
+        host = urlparse(url).netloc
+        session = self._client()
+        request = self.request(url, referer=referer)
+        for attempt in range(self.max_tries_429):
+            # Time delay (raises CircuitOpenError while the host is paused)
+            await self._smart_delay(host)
+            try:
+                resp = await session.get(**request)
+            except Exception as e:
+                await asyncio.sleep(self.backoff(attempt, e))
+                continue
+            # Same decisions as Scraper; the controller and archive writes run off the loop
+            wait = await asyncio.to_thread(self.outcome, url, resp, attempt)
+            if wait is None:
+                logger.debug("Fetched: %s", url, extra={"stage": "fetch", "url": url, "status": resp.status_code, "duration": round(time.perf_counter() - started, 3)})
+                return resp.text
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        raise RuntimeError(f"Failed to fetch {url} after retries.")
@@ -0,0 +1,247 @@
+### Durable crawl job queue ###
+"""
+SQLite backed queue of crawl jobs. The coordinator enqueues, workers (processes on
+the host holding the data folder) lease, run and complete jobs. A lease expires, so
+jobs of a crashed worker are picked up again; only the holder of a lease can
+complete or fail its job.
+The per-host rate state lives in the same database, shared by all workers
+with the same egress (IP), see SharedRateController.
+The queue is limited to one host: SQLite and the fcntl locks of the manifest and the
+page archive need local file locking, which network filesystems (NFS, SMB) do not
+provide reliably, so a data folder on such a filesystem is refused.
+"""
+# Imports
+from __future__ import annotations
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+# Local imports
+from classes.rate_control import RateController, CircuitOpenError
+from functions.logger import get_logger
+from environment.variable import QUEUE_PATH, JOB_LEASE, JOB_MAX_ATTEMPTS
+
+logger = get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    host TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0,
+    worker TEXT,
+    error TEXT,
+    updated REAL NOT NULL,
+    UNIQUE (run_id, kind, payload)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_until);
+CREATE TABLE IF NOT EXISTS rates (
+    host TEXT NOT NULL,
+    egress TEXT NOT NULL,
+    delay REAL NOT NULL,
+    next REAL NOT NULL,
+    forbidden INTEGER NOT NULL,
+    open_until REAL NOT NULL,
+    PRIMARY KEY (host, egress)
+);
+"""
+
+# Filesystems without reliable POSIX locks (/proc/mounts types)
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "afs"}
+
+# Function: Filesystem type of a path (None if unknown, e.g. not on linux)
+def filesystem_type(path: Path) -> Optional[str]:
+    try:
+        with open("/proc/mounts") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    path = str(Path(path).resolve())
+    # Longest mount point containing the path
+    matches = [(point, kind) for point, kind in mounts if path == point or path.startswith(point.rstrip("/") + "/")]
+    return max(matches, key=lambda match: len(match[0]))[1] if matches else None
+
+# Class: Job queue
+class JobQueue:
+
+    def __init__(self, path: Path = QUEUE_PATH) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        kind = filesystem_type(self.path.parent)
+        if kind in NETWORK_FILESYSTEMS:
+            raise RuntimeError(f"Job queue on a {kind} filesystem ({self.path}): workers must run on the host of the data folder")
+        # executescript commits on its own, so no explicit transaction here
+        db = sqlite3.connect(self.path, timeout=60)
+        try:
+            # Rollback journal: no shared memory file, only file locks
+            db.execute("PRAGMA journal_mode=DELETE")
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self):
+        # One short lived connection per call: safe across threads and processes
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def enqueue(self, run_id: str, kind: str, payload: dict, host: str) -> None:
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR IGNORE INTO jobs (run_id, kind, payload, host, updated) VALUES (?, ?, ?, ?, ?)",
+                (run_id, kind, json.dumps(payload, sort_keys=True), host, time.time()),
+            )
+
+    def lease(self, worker: str, egress: str, lease_s: float = JOB_LEASE, max_attempts: int = JOB_MAX_ATTEMPTS) -> Optional[dict]:
+        """
+        Lease the next runnable job (pending and due, or lease expired; host not paused
+        for this egress). A pending job is due once lease_until (its not-before time) passed.
+        An expired lease with max_attempts used fails the job (its worker keeps crashing).
+        """
+        now = time.time()
+        with self._transaction() as db:
+            while True:
+                row = db.execute(
+                    """
+                    SELECT * FROM jobs
+                    WHERE ((state = 'pending' AND lease_until <= ?) OR (state = 'leased' AND lease_until < ?))
+                      AND host NOT IN (SELECT host FROM rates WHERE egress = ? AND open_until > ?)
+                    ORDER BY id LIMIT 1
+                    """,
+                    (now, now, egress, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row["state"] == "pending" or row["attempts"] < max_attempts:
+                    break
+                logger.error("Job %s failed: lease expired after %d attempts", row["id"], row["attempts"])
+                db.execute(
+                    "UPDATE jobs SET state = 'failed', error = ?, updated = ? WHERE id = ?",
+                    (f"Lease expired after {row['attempts']} attempts (worker {row['worker']})", now, row["id"]),
+                )
+            db.execute(
+                "UPDATE jobs SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker, now + lease_s, now, row["id"]),
+            )
+        job = dict(row, worker=worker, attempts=row["attempts"] + 1)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def _release(self, db, job_id: int, worker: str, state: str, error: Optional[str], not_before: float = 0.0, attempt: int = 0) -> bool:
+        # Only the current holder of the lease may release the job (an expired lease may be taken over)
+        updated = db.execute(
+            "UPDATE jobs SET state = ?, error = ?, lease_until = ?, attempts = attempts + ?, updated = ? WHERE id = ? AND state = 'leased' AND worker = ?",
+            (state, error, not_before, attempt, time.time(), job_id, worker),
+        )
+        if updated.rowcount == 0:
+            logger.warning("Job %s is not leased by %s anymore, result dropped", job_id, worker)
+        return updated.rowcount > 0
+
+    def complete(self, job_id: int, worker: str) -> bool:
+        with self._transaction() as db:
+            return self._release(db, job_id=job_id, worker=worker, state="done", error=None)
+
+    def fail(self, job_id: int, worker: str, error: str, retry: bool = True, max_attempts: int = JOB_MAX_ATTEMPTS) -> bool:
+        with self._transaction() as db:
+            row = db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            state = "pending" if retry and row is not None and row["attempts"] < max_attempts else "failed"
+            return self._release(db, job_id=job_id, worker=worker, state=state, error=error)
+
+    def requeue(self, job_id: int, worker: str, not_before: float, error: Optional[str] = None) -> bool:
+        """Back to pending, not runnable before not_before; the lease does not count as an attempt."""
+        with self._transaction() as db:
+            return self._release(db, job_id=job_id, worker=worker, state="pending", error=error, not_before=not_before, attempt=-1)
+
+    def counts(self, run_id: Optional[str] = None) -> dict:
+        with self._transaction() as db:
+            query = "SELECT state, COUNT(*) AS n FROM jobs" + (" WHERE run_id = ?" if run_id else "") + " GROUP BY state"
+            return {row["state"]: row["n"] for row in db.execute(query, (run_id,) if run_id else ())}
+
+    def failed(self, run_id: str) -> list:
+        with self._transaction() as db:
+            rows = db.execute("SELECT kind, payload, error FROM jobs WHERE run_id = ? AND state = 'failed'", (run_id,))
+            return [dict(row) for row in rows]
+
+# Function: Identity of a worker / of its egress (override with WORKER_EGRESS, e.g. for workers behind different proxies)
+def worker_identity() -> tuple[str, str]:
+    egress = os.getenv("WORKER_EGRESS", socket.gethostname())
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}", egress
+
+# Class: Rate controller whose state is shared through the queue database
+class SharedRateController(RateController):
+
+    def __init__(self, queue: JobQueue, egress: str, **kwargs) -> None:
+        super().__init__(path=None, **kwargs)
+        self.queue = queue
+        self.egress = egress
+        self._local = threading.local()
+
+    @contextmanager
+    def _shared(self, host: str):
+        # Re-entrant: on_forbidden calls on_throttle
+        depth = getattr(self._local, "depth", 0)
+        if depth:
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth = depth
+            return
+        with self.queue._transaction() as db:
+            row = db.execute("SELECT * FROM rates WHERE host = ? AND egress = ?", (host, self.egress)).fetchone()
+            with self._lock:
+                state = self._host(host)
+                if row is not None:
+                    state.update(delay=row["delay"], next=row["next"], forbidden=row["forbidden"], open_until=row["open_until"])
+            self._local.depth = 1
+            error = None
+            try:
+                yield
+            except CircuitOpenError as e:
+                # A tripped breaker must be committed for the other workers
+                error = e
+            finally:
+                self._local.depth = 0
+                state = self.hosts[host]
+                db.execute(
+                    "INSERT OR REPLACE INTO rates (host, egress, delay, next, forbidden, open_until) VALUES (?, ?, ?, ?, ?, ?)",
+                    (host, self.egress, state["delay"], state["next"], state["forbidden"], state["open_until"]),
+                )
+        if error is not None:
+            raise error
+
+    def reserve(self, host: str) -> float:
+        with self._shared(host):
+            return super().reserve(host)
+
+    def on_success(self, host: str) -> None:
+        with self._shared(host):
+            super().on_success(host)
+
+    def on_throttle(self, host: str, retry_after: Optional[float] = None, status: int = 429) -> float:
+        with self._shared(host):
+            return super().on_throttle(host, retry_after=retry_after, status=status)
+
+    def on_forbidden(self, host: str) -> None:
+        with self._shared(host):
+            super().on_forbidden(host)
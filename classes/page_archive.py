@@ -0,0 +1,140 @@
+### Archive of raw crawled pages ###
+"""
+Append-only pack file of compressed pages (zstd, zlib if zstandard is not installed)
+plus an append-only JSON-lines index by URL and fetch time.
+Parsing, combining and scoring can be re-run over any archived snapshot without network.
+"""
+# Imports
+from __future__ import annotations
+import json
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib is the fallback codec
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # windows: single writer process only
+    fcntl = None
+
+# Local imports
+from functions.logger import get_logger
+from environment.variable import ARCHIVE_PATH
+
+logger = get_logger(__name__)
+
+# Function: Compress with the best available codec
+def _compress(body: bytes) -> tuple[bytes, str]:
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(body), "zstd"
+    return zlib.compress(body, 6), "zlib"
+
+# Function: Decompress an archived page
+def _decompress(payload: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Archive holds zstd pages, install zstandard to read them")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return zlib.decompress(payload)
+
+# Class: Page archive
+class PageArchive:
+
+    def __init__(self, path: Path = ARCHIVE_PATH) -> None:
+        self.path = Path(path)
+        self.pack_path = Path(self.path, "pages.pack")
+        self.index_path = Path(self.path, "pages.index.jsonl")
+        self._lock = threading.Lock()
+        self._index = None  # url -> entries sorted by fetch time
+        self._index_size = 0
+
+    @contextmanager
+    def _file_lock(self):
+        # Several processes (workers) may append to the same archive
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(Path(self.path, "pages.lock"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _refresh_index(self) -> dict:
+        """Read index lines appended since the last call (also by other processes)."""
+        if self._index is None:
+            self._index = {}
+        if not self.index_path.exists():
+            return self._index
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_size)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partially written line, picked up next time
+                entry = json.loads(line)
+                self._index.setdefault(entry["url"], []).append(entry)
+                self._index_size += len(line)
+        for entries in self._index.values():
+            entries.sort(key=lambda e: e["fetched"])
+        return self._index
+
+    def put(self, url: str, body: str, status: int = 200, fetched: Optional[datetime] = None) -> dict:
+        payload, codec = _compress(body.encode("utf-8"))
+        with self._file_lock():
+            with open(self.pack_path, "ab") as pack:
+                offset = pack.seek(0, 2)
+                pack.write(payload)
+            entry = {
+                "url": url,
+                "fetched": (fetched or datetime.now()).isoformat(timespec="seconds"),
+                "offset": offset,
+                "length": len(payload),
+                "status": status,
+                "codec": codec,
+            }
+            with open(self.index_path, "ab") as index:
+                index.write((json.dumps(entry) + "\n").encode("utf-8"))
+        return entry
+
+    def entries(self, url: str) -> list:
+        with self._lock:
+            return list(self._refresh_index().get(url, []))
+
+    def get(self, url: str, at: Optional[date] = None) -> Optional[str]:
+        """Latest archived page of a URL fetched on or before the date `at` (None: latest)."""
+        entries = self.entries(url)
+        if at is not None:
+            entries = [e for e in entries if e["fetched"][:10] <= at.isoformat()]
+        if not entries:
+            return None
+        entry = entries[-1]
+        with open(self.pack_path, "rb") as pack:
+            pack.seek(entry["offset"])
+            payload = pack.read(entry["length"])
+        return _decompress(payload, entry["codec"]).decode("utf-8")
+
+    def snapshots(self, start: Optional[date] = None, end: Optional[date] = None) -> list:
+        """Distinct fetch dates in the archive (within [start, end])."""
+        with self._lock:
+            index = self._refresh_index()
+            dates = {date.fromisoformat(e["fetched"][:10]) for entries in index.values() for e in entries}
+        return sorted(d for d in dates if (start is None or d >= start) and (end is None or d <= end))
+
+# Shared archive per path
+_archives = {}
+_archives_lock = threading.Lock()
+
+# Function: Archive shared by all scrapers of this process
+def get_page_archive(path: Path = ARCHIVE_PATH) -> PageArchive:
+    with _archives_lock:
+        if path not in _archives:
+            _archives[path] = PageArchive(path=path)
+        return _archives[path]
@@ -0,0 +1,241 @@
+### Adaptive request rate per host ###
+"""
+AIMD rate controller shared by all Scraper instances:
+    - healthy response -> additive increase of the request rate
+    - 429              -> multiplicative decrease, honoring Retry-After
+    - repeated 403     -> circuit breaker, the host is paused
+The learned delay and open breakers are persisted between runs (at most every
+save_interval seconds, a tripped breaker and the exit of the process always write).
+"""
+# Imports
+from __future__ import annotations
+import atexit
+import json
+import os
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+
+# Local imports
+from functions.logger import get_logger
+from environment.variable import (
+    RATE_STATE_PATH, RATE_INITIAL_DELAY, RATE_MIN_DELAY, RATE_MAX_DELAY, RATE_INCREASE,
+    RATE_BACKOFF, RATE_JITTER, BREAKER_403_LIMIT, BREAKER_PAUSE, RATE_SAVE_INTERVAL,
+)
+
+logger = get_logger(__name__)
+
+# Class: Raised while the breaker of a host is open
+class CircuitOpenError(RuntimeError):
+
+    def __init__(self, host: str, until: float) -> None:
+        self.host = host
+        self.until = until
+        super().__init__(f"Circuit open for {host} until {datetime.fromtimestamp(until):%Y-%m-%d %H:%M:%S} (repeated 403)")
+
+# Class: Raised when a wait is interrupted by the stop event of its thread
+class WaitInterrupted(RuntimeError):
+    pass
+
+# Stop event of the current thread (e.g. the fetch stage of a pipeline)
+_waits = threading.local()
+
+# Function: Waits of the current thread end early once stop is set
+@contextmanager
+def interruptible(stop: threading.Event):
+    previous = getattr(_waits, "stop", None)
+    _waits.stop = stop
+    try:
+        yield
+    finally:
+        _waits.stop = previous
+
+# Function: Sleep, raises WaitInterrupted if the stop event of the thread is set meanwhile
+def pause(seconds: float) -> None:
+    stop = getattr(_waits, "stop", None)
+    if stop is None:
+        time.sleep(seconds)
+    elif stop.wait(seconds):
+        raise WaitInterrupted("Wait interrupted, the stage was stopped")
+
+# Function: Seconds to wait from a Retry-After header (seconds or HTTP date)
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+# Class: Rate controller (thread safe)
+class RateController:
+
+    def __init__(
+        self,
+        path: Optional[Path] = RATE_STATE_PATH,
+        initial_delay: float = RATE_INITIAL_DELAY,
+        min_delay: float = RATE_MIN_DELAY,
+        max_delay: float = RATE_MAX_DELAY,
+        increase: float = RATE_INCREASE,
+        backoff: float = RATE_BACKOFF,
+        jitter: float = RATE_JITTER,
+        breaker_limit: int = BREAKER_403_LIMIT,
+        breaker_pause: float = BREAKER_PAUSE,
+        save_interval: float = RATE_SAVE_INTERVAL,
+    ) -> None:
+        self.path = Path(path) if path else None
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.increase = increase
+        self.backoff = backoff
+        self.jitter = jitter
+        self.breaker_limit = breaker_limit
+        self.breaker_pause = breaker_pause
+        self.save_interval = save_interval
+        # host -> {"delay", "next", "forbidden", "open_until"}; times are wall clock (persisted)
+        self.hosts = {}
+        self._lock = threading.Lock()
+        self._saved = float("-inf")
+        self._dirty = False
+        self._load()
+        if self.path is not None:
+            _persisted.add(self)
+
+    def _host(self, host: str) -> dict:
+        return self.hosts.setdefault(host, {"delay": self.initial_delay, "next": 0.0, "forbidden": 0, "open_until": 0.0})
+
+    def _load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        with open(self.path) as f:
+            stored = json.load(f)
+        for host, state in stored.items():
+            self._host(host).update(delay=state["delay"], open_until=state.get("open_until", 0.0))
+
+    def save(self) -> None:
+        """Writes the state now."""
+        if self.path is None:
+            return
+        with self._lock:
+            self._write()
+
+    def flush(self) -> None:
+        """Writes pending changes (called at exit)."""
+        if self.path is None:
+            return
+        with self._lock:
+            if self._dirty:
+                self._write()
+
+    def _write(self) -> None:
+        # Lock held; own temp file per process and thread, workers may share the state file
+        stored = {host: {"delay": round(s["delay"], 3), "open_until": s["open_until"]} for host, s in self.hosts.items()}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp, "w") as f:
+            json.dump(stored, f, indent=2)
+        os.replace(temp, self.path)
+        self._saved = time.monotonic()
+        self._dirty = False
+
+    def _changed(self) -> None:
+        # Lock held; persists at most every save_interval seconds
+        self._dirty = True
+        if self.path is not None and time.monotonic() - self._saved >= self.save_interval:
+            self._write()
+
+    def reserve(self, host: str) -> float:
+        """Reserve the next request slot of a host, returns the seconds to wait for it."""
+        with self._lock:
+            state = self._host(host)
+            now = time.time()
+            if state["open_until"] > now:
+                raise CircuitOpenError(host, state["open_until"])
+            gap = state["delay"] + (random.uniform(0, self.jitter) if state["delay"] > 0 else 0.0)
+            slot = max(now, state["next"])
+            state["next"] = slot + gap
+            return slot - now
+
+    def acquire(self, host: str) -> None:
+        wait = self.reserve(host)
+        if wait > 0:
+            logger.info("Throttling %s for %.2fs", host, wait, extra={"stage": "throttle", "duration": round(wait, 3), "rate_limit": 30})
+            pause(wait)
+
+    def on_success(self, host: str) -> None:
+        with self._lock:
+            state = self._host(host)
+            state["forbidden"] = 0
+            # Additive increase of the rate (requests per second)
+            rate = 1.0 / state["delay"] if state["delay"] > 0 else float("inf")
+            state["delay"] = max(self.min_delay, 1.0 / (rate + self.increase)) if rate != float("inf") else self.min_delay
+            self._changed()
+
+    def on_throttle(self, host: str, retry_after: Optional[float] = None, status: int = 429) -> float:
+        """429: multiplicative decrease; the next slot is not before Retry-After. Returns the wait."""
+        with self._lock:
+            state = self._host(host)
+            state["delay"] = min(self.max_delay, max(state["delay"] * self.backoff, self.min_delay, 0.1))
+            wait = retry_after if retry_after is not None else state["delay"]
+            state["next"] = max(state["next"], time.time() + wait)
+            delay = state["delay"]
+            self._changed()
+        logger.warning("%d from %s: delay now %.1fs, next request in %.1fs", status, host, delay, wait)
+        return wait
+
+    def on_forbidden(self, host: str) -> None:
+        """403: back off like a 429, trip the breaker after breaker_limit in a row."""
+        with self._lock:
+            state = self._host(host)
+            state["forbidden"] += 1
+            tripped = state["forbidden"] >= self.breaker_limit
+            if tripped:
+                state["open_until"] = time.time() + self.breaker_pause
+                state["forbidden"] = 0
+                if self.path is not None:
+                    self._write()
+        if tripped:
+            logger.error("403 Forbidden %d times from %s, pausing the host for %.0fs", self.breaker_limit, host, self.breaker_pause)
+            raise CircuitOpenError(host, self.hosts[host]["open_until"])
+        logger.error("403 Forbidden from %s. Possible IP flag or TLS mismatch.", host)
+        self.on_throttle(host, status=403)
+
+# Controllers with a state file, written at exit
+_persisted = weakref.WeakSet()
+
+# Function: Write the pending changes of all controllers
+def flush_rate_state() -> None:
+    for controller in list(_persisted):
+        controller.flush()
+
+atexit.register(flush_rate_state)
+
+# Shared controllers (one per persisted state file)
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+# Function: Replace the default controller of this process (e.g. by a queue worker's shared one)
+def set_rate_controller(controller: Optional[RateController]) -> None:
+    with _controllers_lock:
+        _controllers["default"] = controller
+
+# Function: Controller shared by all scrapers of this process
+def get_rate_controller(path: Optional[Path] = RATE_STATE_PATH, **kwargs) -> RateController:
+    key = (path, tuple(sorted(kwargs.items())))
+    with _controllers_lock:
+        if path == RATE_STATE_PATH and not kwargs and _controllers.get("default") is not None:
+            return _controllers["default"]
+        if key not in _controllers:
+            _controllers[key] = RateController(path=path, **kwargs)
+        return _controllers[key]
@@ -0,0 +1,168 @@
+### Record / replay of crawled pages ###
+"""
+Record: Scraper.fetch_html archives every response (status, headers, body) per URL.
+Replay: a local HTTP stand-in server answers with the archived responses, so the
+pipeline runs offline at full speed. Latency, 429 bursts (with Retry-After) and
+403s can be injected deterministically to load-test throttling and retries.
+"""
+# Imports
+from __future__ import annotations
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, urlparse
+
+# Local imports
+from functions.logger import get_logger
+from environment.variable import RECORDING_PATH, REPLAY_HOST, REPLAY_PORT
+
+logger = get_logger(__name__)
+
+# Headers that do not match the archived (decoded) body anymore
+SKIP_HEADERS = {"content-length", "content-encoding", "transfer-encoding", "connection"}
+
+# Function: File of a recorded URL
+def recording_path(url: str, path: Path = RECORDING_PATH) -> Path:
+    return Path(path, hashlib.sha1(url.encode()).hexdigest() + ".json")
+
+# Function: Archive one response
+def record_response(url: str, status: int, headers: dict, body: str, path: Path = RECORDING_PATH) -> None:
+    target = recording_path(url, path=path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp = target.with_name(target.name + ".tmp")
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump({"url": url, "status": status, "headers": dict(headers), "body": body, "recorded": time.time()}, f)
+    os.replace(temp, target)
+
+# Function: Load one archived response (None if the URL was never recorded)
+def load_recording(url: str, path: Path = RECORDING_PATH) -> dict | None:
+    source = recording_path(url, path=path)
+    if not source.exists():
+        return None
+    with open(source, encoding="utf-8") as f:
+        return json.load(f)
+
+# Function: URL of a page on the stand-in server
+def replay_url(url: str, host: str = REPLAY_HOST, port: int = REPLAY_PORT) -> str:
+    return f"http://{host}:{port}/replay?url={quote(url, safe='')}"
+
+# Class: Faults injected by the stand-in server
+@dataclass
+class FaultProfile:
+    latency_s: float = 0.0          # fixed delay per response
+    latency_jitter_s: float = 0.0   # + uniform(0, jitter)
+    burst_every: int = 0            # every n-th request starts a 429 burst (0 = never)
+    burst_length: int = 1           # number of 429 answers per burst
+    retry_after_s: float = 1.0      # Retry-After header of a 429
+    forbidden_rate: float = 0.0     # probability of a 403
+    seed: int = 0
+
+# Class: Local stand-in server
+class ReplayServer:
+
+    def __init__(
+        self,
+        path: Path = RECORDING_PATH,
+        host: str = REPLAY_HOST,
+        port: int = REPLAY_PORT,
+        faults: FaultProfile | None = None,
+    ) -> None:
+        self.path = Path(path)
+        self.faults = faults or FaultProfile()
+        self.stats = {}
+        self._rng = random.Random(self.faults.seed)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._burst_left = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def _decide(self) -> tuple[int | None, float]:
+        """Fault decision for the next request: (forced status or None, latency)."""
+        faults = self.faults
+        with self._lock:
+            self._requests += 1
+            latency = faults.latency_s + self._rng.uniform(0, faults.latency_jitter_s)
+            if faults.burst_every and self._requests % faults.burst_every == 0:
+                self._burst_left = faults.burst_length
+            if self._burst_left > 0:
+                self._burst_left -= 1
+                return 429, latency
+            if faults.forbidden_rate and self._rng.random() < faults.forbidden_rate:
+                return 403, latency
+        return None, latency
+
+    def _count(self, status: int) -> None:
+        with self._lock:
+            self.stats[status] = self.stats.get(status, 0) + 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                url = parse_qs(urlparse(self.path).query).get("url", [None])[0]
+                status, latency = server._decide()
+                if latency > 0:
+                    time.sleep(latency)
+
+                if status == 429:
+                    return self._send(429, {"Retry-After": f"{server.faults.retry_after_s:g}"}, "Too Many Requests")
+                if status == 403:
+                    return self._send(403, {}, "Forbidden")
+
+                recorded = load_recording(url, path=server.path) if url else None
+                if recorded is None:
+                    return self._send(404, {}, f"Not recorded: {url}")
+                headers = {k: v for k, v in recorded["headers"].items() if k.lower() not in SKIP_HEADERS}
+                return self._send(recorded["status"], headers, recorded["body"])
+
+            def _send(self, status: int, headers: dict, body: str):
+                payload = body.encode("utf-8")
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                server._count(status)
+
+            def log_message(self, format, *args):
+                logger.debug("Replay: " + format, *args)
+
+        return Handler
+
+    def start(self) -> "ReplayServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info("Replay server on http://%s:%d (%s)", self.host, self.port, self.path)
+        return self
+
+    def serve_forever(self) -> None:
+        logger.info("Replay server on http://%s:%d (%s)", self.host, self.port, self.path)
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "ReplayServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -1,17 +1,77 @@
 ### Scraper for website info ### 
 
 # Imports
+import os
+import threading
 import time
-import random
+from datetime import date
 from typing import Optional
+from urllib.parse import urlparse
 from curl_cffi import requests as cur_requests 
 
 from functions.logger import get_logger
-from environment.variable import OS_USAGE, OS_PROFILES
+from classes.rate_control import RateController, CircuitOpenError, get_rate_controller, parse_retry_after, pause
+from classes.page_archive import get_page_archive
+from classes.replay_server import record_response, replay_url
+from environment.variable import OS_USAGE, OS_PROFILES, REPLAY_HOST, REPLAY_PORT, ARCHIVE_PAGES
 
 logger = get_logger(__name__)
-# Class: Scraping
-class Scraper:
+
+# HTTP sessions (connection reuse) per thread, shared by all scrapers of the thread
+_sessions = threading.local()
+
+# Function: Session of the current thread
+def _session() -> cur_requests.Session:
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = cur_requests.Session(impersonate="firefox")
+        _sessions.session = session
+    return session
+
+# Function: Browser headers of every request (Chrome 122 across all fields)
+def default_headers() -> dict:
+    return {
+        "User-Agent": OS_PROFILES[OS_USAGE]["ua"], # This is Chrome/122.0.0.0
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+        "Connection": "keep-alive",
+        "Upgrade-Insecure-Requests": "1",
+        # MUST MATCH Chrome 122 in the User-Agent string
+        "Sec-Ch-Ua": '"Chromium";v="122", "Not(A:Brand";v="24", "Google Chrome";v="122"',
+        "Sec-Ch-Ua-Mobile": "?0",
+        "Sec-Ch-Ua-Platform": OS_PROFILES[OS_USAGE]["platform"],
+        "Sec-Fetch-Dest": "document",
+        "Sec-Fetch-Mode": "navigate",
+        "Sec-Fetch-Site": "none",
+        "Sec-Fetch-User": "?1",
+        "TE": "trailers"
+    }
+
+# Function: Scraper mode (argument or SCRAPER_MODE)
+def scraper_mode(mode: Optional[str] = None) -> str:
+    # "live", "record" (archive every response), "replay" (local stand-in server) or "archive" (page archive)
+    mode = mode or os.getenv("SCRAPER_MODE", "live")
+    if mode not in {"live", "record", "replay", "archive"}:
+        raise ValueError(f"Unknown scraper mode: {mode!r}")
+    return mode
+
+# Function: Rate controller of a mode
+def mode_rate_controller(mode: str, min_delay: Optional[float] = None) -> RateController:
+    # Request gaps are shared per host across all scrapers of the process (adaptive, persisted).
+    # Replay runs at full speed with its own, not persisted state unless a delay is given explicitly
+    if mode in {"replay", "archive"}:
+        delay = min_delay or 0.0
+        return get_rate_controller(path=None, initial_delay=delay, min_delay=delay, jitter=0.0)
+    return get_rate_controller()
+
+# Function: Proxies from the environment
+def env_proxies() -> Optional[dict]:
+    http_p = os.getenv("HTTP_PROXY")
+    https_p = os.getenv("HTTPS_PROXY")
+    return {"http": http_p, "https": https_p} if http_p or https_p else None
+
+# Class: Settings, status and retry decisions shared by Scraper and AsyncScraper
+class FetchPolicy:
 
     def __init__(
         self,
@@ -19,91 +79,107 @@ class Scraper:
         max_tries_429: int = 6,
         base_backoff_s: float = 2.0,
         headers: Optional[dict] = None,
+        mode: Optional[str] = None,
+        min_delay: Optional[float] = None,
+        rates: Optional[RateController] = None,
     ) -> None:
         self.timeout = timeout
         self.max_tries_429 = max_tries_429
         self.base_backoff_s = base_backoff_s
-        
-        # --- MISSING ATTRIBUTES ADDED HERE ---
-        self.last_request_time = 0.0
-        self.min_delay = 3.1 
-        
-        if headers is None:
-            # Match Chrome 122 across all fields
-            self.headers = {
-                "User-Agent": OS_PROFILES[OS_USAGE]["ua"], # This is Chrome/122.0.0.0
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Connection": "keep-alive",
-                "Upgrade-Insecure-Requests": "1",
-                # MUST MATCH Chrome 122 in the User-Agent string
-                "Sec-Ch-Ua": '"Chromium";v="122", "Not(A:Brand";v="24", "Google Chrome";v="122"',
-                "Sec-Ch-Ua-Mobile": "?0",
-                "Sec-Ch-Ua-Platform": OS_PROFILES[OS_USAGE]["platform"],
-                "Sec-Fetch-Dest": "document",
-                "Sec-Fetch-Mode": "navigate",
-                "Sec-Fetch-Site": "none",
-                "Sec-Fetch-User": "?1",
-                "TE": "trailers"
-            }
-        else:
-            self.headers = headers
+        self.mode = scraper_mode(mode)
+        # Raw pages of live crawls are archived; the archive mode reads the snapshot of ARCHIVE_DATE
+        self.archive = get_page_archive() if ARCHIVE_PAGES or self.mode == "archive" else None
+        snapshot = os.getenv("ARCHIVE_DATE")
+        self.archive_date = date.fromisoformat(snapshot) if snapshot else None
+        self.replay_host = os.getenv("REPLAY_HOST", REPLAY_HOST)
+        self.replay_port = int(os.getenv("REPLAY_PORT", REPLAY_PORT))
+        self.rates = rates if rates is not None else mode_rate_controller(self.mode, min_delay=min_delay)
+        self.headers = default_headers() if headers is None else headers
 
     def _env_proxies(self) -> Optional[dict]:
-        import os
-        http_p = os.getenv("HTTP_PROXY")
-        https_p = os.getenv("HTTPS_PROXY")
-        return {"http": http_p, "https": https_p} if http_p or https_p else None
-
-    def _smart_delay(self):
-        """Ensures at least 3.1s + small jitter between calls."""
-        elapsed = time.time() - self.last_request_time
-        # Add a tiny bit of random jitter to the base delay
-        required_gap = self.min_delay + random.uniform(0, 1.0)
-        
-        if elapsed < required_gap:
-            wait_time = required_gap - elapsed
-            self.logger.info(f"Throttling for {wait_time:.2f}s to respect FBRef rules")
-            time.sleep(wait_time)
-        
-        self.last_request_time = time.time()
+        return env_proxies()
 
-    def fetch_html(self, url: str, referer: Optional[str] = None) -> str:
-        # Time delay
-        self._smart_delay()
-        
-        logger.info("Fetching: %s", url)
-        
+    def archived(self, url: str) -> str:
+        html = self.archive.get(url, at=self.archive_date)
+        if html is None:
+            raise LookupError(f"{url} is not archived (snapshot {self.archive_date or 'latest'})")
+        return html
+
+    def request(self, url: str, referer: Optional[str] = None) -> dict:
+        """Target and keyword arguments of the GET request of a page."""
         headers = dict(self.headers)
         if referer:
             headers["Referer"] = referer
+        replay = self.mode == "replay"
+        return {
+            "url": replay_url(url, host=self.replay_host, port=self.replay_port) if replay else url,
+            "headers": headers,
+            "timeout": self.timeout,
+            "impersonate": "firefox",
+            "proxies": None if replay else self._env_proxies(),
+        }
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Wait before the next attempt after a failed request, raises the error on the last attempt."""
+        if attempt == self.max_tries_429 - 1:
+            raise error
+        logger.warning("Attempt %d failed: %s. Retrying...", attempt + 1, str(error))
+        return self.base_backoff_s * (2 ** attempt)
+
+    def outcome(self, url: str, resp, attempt: int) -> Optional[float]:
+        """
+        Feeds the response to the rate controller. Returns None if it is the page (then it
+        is recorded and archived), else the wait before the next attempt. Blocking (state
+        and archive files): the async client runs it in a thread.
+        """
+        host = urlparse(url).netloc
+        if resp.status_code == 429:
+            self.rates.on_throttle(host, retry_after=parse_retry_after(resp.headers.get("Retry-After")))
+            return 0.0
+        if resp.status_code == 403:
+            # Raises CircuitOpenError once the breaker trips
+            self.rates.on_forbidden(host)
+            return 0.0
+        try:
+            resp.raise_for_status()
+        except Exception as e:
+            return self.backoff(attempt, e)
+        self.rates.on_success(host)
+        # Only the returned response is recorded (a throttled retry never replaces a good recording)
+        if self.mode == "record":
+            record_response(url=url, status=resp.status_code, headers=dict(resp.headers), body=resp.text)
+        if self.archive is not None and self.mode != "replay":
+            self.archive.put(url=url, body=resp.text, status=resp.status_code)
+        return None
+
+# Class: Scraping
+class Scraper(FetchPolicy):
+
+    def _smart_delay(self, host: str):
+        """Waits for the next request slot of the host (adaptive, see RateController)."""
+        self.rates.acquire(host)
+
+    def fetch_html(self, url: str, referer: Optional[str] = None) -> str:
+        if self.mode == "archive":
+            return self.archived(url)
+        logger.info("Fetching: %s", url, extra={"stage": "fetch", "url": url})
+        started = time.perf_counter()
+        host = urlparse(url).netloc
+        request = self.request(url, referer=referer)
         # Try to scrape the data
         for attempt in range(self.max_tries_429):
+            # Time delay (raises CircuitOpenError while the host is paused)
+            self._smart_delay(host)
             try:
-                resp = cur_requests.get(
-                    url, 
-                    headers=headers, 
-                    timeout=self.timeout, 
-                    impersonate="firefox", 
-                    proxies=self._env_proxies()
-                )
-
-                if resp.status_code == 429:
-                    sleep_s = min(120.0, (self.base_backoff_s * (2 ** attempt)) + random.uniform(0, 1.5))
-                    logger.warning("429 Too Many Requests. Sleeping %.1fs", sleep_s)
-                    time.sleep(sleep_s)
-                    continue
-
-                if resp.status_code == 403:
-                   logger.error("403 Forbidden. Possible IP flag or TLS mismatch.")
-                
-                resp.raise_for_status()
-                return resp.text
-
+                resp = _session().get(**request)
             except Exception as e:
-                if attempt == self.max_tries_429 - 1:
-                    raise e
-                logger.warning("Attempt %d failed: %s. Retrying...", attempt + 1, str(e))
-                time.sleep(self.base_backoff_s * (2 ** attempt))
+                pause(self.backoff(attempt, e))
+                continue
+            wait = self.outcome(url, resp, attempt)
+            if wait is None:
+                logger.debug("Fetched: %s", url, extra={"stage": "fetch", "url": url, "status": resp.status_code, "duration": round(time.perf_counter() - started, 3)})
+                return resp.text
+            if wait > 0:
+                pause(wait)
 
-        raise RuntimeError(f"Failed to fetch {url} after retries.")
\ No newline at end of file
+        raise RuntimeError(f"Failed to fetch {url} after retries.")
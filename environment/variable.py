@@ -1,14 +1,11 @@
 ### Set fixed variables ###
 
 # Import
-import pandas as pd
 import os
 from pathlib import Path
 
-# Local imports
-from functions.system import detect_os_profile
 # Paths
-DATA_PATH = Path(os.getcwd(), "data")
+DATA_PATH = Path(os.getenv("DATA_PATH", Path(os.getcwd(), "data")))
 
 # System data
 OS_OVERRIDE =  None # Set the system manually
@@ -42,7 +39,42 @@ OS_PROFILES = {
         
     },
 }
-OS_USAGE = detect_os_profile(OS_OVERRIDE)
+# Crawl mode (environment SCRAPER_MODE): "live", "record" (live + archive responses), "replay" (local stand-in server)
+# or "archive" (pages of the snapshot ARCHIVE_DATE from the page archive, no network)
+RECORDING_PATH = Path(DATA_PATH, "recordings")
+REPLAY_HOST = "127.0.0.1"
+REPLAY_PORT = 8765
+
+# Raw pages are kept in a compressed pack file (re-processing without re-scraping)
+ARCHIVE_PAGES = True
+ARCHIVE_PATH = Path(os.getenv("ARCHIVE_PATH", Path(DATA_PATH, "archive")))
+BACKFILL_PATH = Path(DATA_PATH, "backfill")
+
+# Adaptive rate per host (delays in seconds, increase in requests per second)
+RATE_STATE_PATH = Path(DATA_PATH, "Rate_State.json")
+RATE_INITIAL_DELAY = 3.1
+RATE_MIN_DELAY = 1.0
+RATE_MAX_DELAY = 120.0
+RATE_INCREASE = 0.01
+RATE_BACKOFF = 2.0
+RATE_JITTER = 1.0
+BREAKER_403_LIMIT = 3
+BREAKER_PAUSE = 1800.0
+# Seconds between writes of the rate state (an open breaker and the exit always write)
+RATE_SAVE_INTERVAL = 30.0
+
+# Distributed crawl (job queue shared by the workers, lease time in seconds)
+QUEUE_PATH = Path(DATA_PATH, "Jobs.sqlite")
+JOB_LEASE = 600.0
+JOB_MAX_ATTEMPTS = 3
+
+# OS_USAGE is resolved on first access (see __getattr__), not on import
+def __getattr__(name: str):
+    if name == "OS_USAGE":
+        from functions.system import detect_os_profile
+        globals()["OS_USAGE"] = detect_os_profile(OS_OVERRIDE)
+        return globals()["OS_USAGE"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Table names
 MARKET_SHEET_NAME = "Transfermarkt_Market_Values"
@@ -50,6 +82,41 @@ SHEETS = ["Premier-League", "Bundesliga", "La-Liga", "Serie-A", "Ligue-1", "All"
 STATS_NAME = "Player_Stats"
 NON_FEATURES = ["Player", "Born", "Nation", "Date", "Table", "Matches", "Squad", "Pos", "Age", "Pos_group", "League"]
 POSITION_NAME = "Position_Data"
+RATING_NAME = "Player_Ratings"
+MANIFEST_NAME = "Manifest"
+# Choice sets (e.g. player / club name lists) whose fuzzy matches are kept
+MATCH_CHOICE_SETS = 8
+# Rows converted at a time when a sheet is exported
+EXCEL_CHUNK_ROWS = 10_000
+MATRIX_PATH = Path(DATA_PATH, "matrix")
+PLAYER_KEYS = ["Player", "Born", "Squad", "League"]
+# Age bands [low, high) used for the group comparison
+AGE_BANDS = [(0, 19), (19, 23), (23, 30), (30, 101)]
+# Refresh intervals in days (fbref tables, transfermarkt clubs and league overviews)
+TABLE_TTL = {"stats_keeper": 7, "stats_keeper_adv": 7}
+DEFAULT_TTL = 1
+CLUB_TTL = 1
+# Player profiles: parallel fetches, profiles per stored chunk, maximum age (days) of an unchanged profile
+PROFILE_WORKERS = 2
+PROFILE_FLUSH = 100
+PROFILE_MAX_AGE = 30
+# Also fetch the market value history of a profile (second request per player)
+PROFILE_HISTORY = True
+# Async API: connections per client session
+ASYNC_MAX_CONNECTIONS = 10
+# Daemon: control socket and longest sleep between schedule checks (seconds)
+DAEMON_SOCKET = Path(DATA_PATH, "daemon.sock")
+DAEMON_TICK = 300
+# Maximum age (days) of a squad whose overview summary (squad size, total value) did not change
+CLUB_MAX_AGE = 7
+# Features that are already rates, shares or playing time (not divided by the 90s played)
+RATE_MARKERS = ("Per_90", "/90", "90s", "%", "Playing_Time")
+# Shrink the per-90 rates toward their League / Pos_group rate (empirical Bayes, by minutes)
+SHRINK_RATES = False
+SHRINK_PRIOR = ["League", "Pos_group"]
+# Share of players (by 90s played) dropped per league; lower with shrunk rates (low-minute players stay usable)
+PLAYING_TIME_CUTOFF = 0.3
+SHRUNK_PLAYING_TIME_CUTOFF = 0.1
 # Position based information
 POSITION_MAP = {
     # Goalkeeper
@@ -250,3 +317,44 @@ FEATURES_SCHEMA = {
         ],
     },
 }
+
+# Features where a lower value is the better performance (sign is flipped in the rating)
+LOWER_IS_BETTER = [
+    "stats_keeper__Performance.GA90",
+    "stats_defense__Err",
+    "stats_misc__Performance.CrdY",
+    "stats_misc__Performance.CrdR",
+    "stats_misc__Performance.Fls",
+]
+# Schema features that are averages or ratios: neither divided by the 90s played nor resampled in the bootstrap
+RATIO_FEATURES = [
+    "stats_keeper__Performance.GA90",
+    "stats_keeper_adv__Expected.PSxG/SoT",
+    "stats_keeper_adv__Sweeper.AvgDist",
+    "stats_keeper_adv__Passes.AvgLen",
+    "stats_shooting__Standard.G/Sh",
+    "stats_gca__SCA.SCA90",
+]
+# Schema totals that are not counts of events (divided by the 90s played, neither shrunk nor resampled in the bootstrap)
+NON_COUNT_TOTALS = [
+    "stats_passing__Total.PrgDist",
+    "stats_possession__Carries.PrgDist",
+    "stats_passing__xAG",
+]
+# Rating scale (like Fifa)
+RATING_RANGE = (40, 99)
+# Bootstrap confidence intervals of the scores: resamples, interval level, seed (None: random), players per batch
+BOOTSTRAP_RESAMPLES = 1000
+BOOTSTRAP_LEVEL = 0.9
+BOOTSTRAP_SEED = 0
+BOOTSTRAP_CHUNK = 500
+# SQL scoring engine (DuckDB): memory limit before spilling to disk, threads (None: all cores)
+SQL_MEMORY_LIMIT = "2GB"
+SQL_THREADS = None
+SCORING_PATH = Path(DATA_PATH, "scoring")
+# Change feed: folder (snapshots and feed files), reported market value change (relative) and rating change (points)
+CHANGE_PATH = Path(DATA_PATH, "changes")
+CHANGE_VALUE_THRESHOLD = 0.1
+# Smallest reported market value change in EUR (the smallest transfermarkt step, also the limit from a zero value)
+CHANGE_VALUE_FLOOR = 25_000
+CHANGE_RATING_THRESHOLD = 3
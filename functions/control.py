@@ -0,0 +1,49 @@
+### Local control socket ###
+"""
+One JSON request per connection over a unix socket, answered with one JSON line.
+Standard library only, so the control commands start without pandas.
+"""
+# Imports
+import json
+import os
+import socket
+import socketserver
+import threading
+from pathlib import Path
+from typing import Callable
+
+# Function: Send one request to the control socket and return the answer
+def send_command(request: dict, path: Path, timeout: float = 30.0) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(str(path))
+        client.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        answer = client.makefile("rb").readline()
+    if not answer:
+        raise ConnectionError(f"No answer from {path}")
+    return json.loads(answer)
+
+# Function: Serve handler(request) -> answer on the control socket (background thread)
+def serve_commands(handler: Callable[[dict], dict], path: Path) -> socketserver.BaseServer:
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            try:
+                answer = handler(json.loads(self.rfile.readline()))
+            except Exception as e:
+                answer = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(answer, default=str) + "\n").encode("utf-8"))
+
+    path = Path(path)
+    if path.exists():
+        # Left over from a daemon that did not shut down cleanly
+        try:
+            send_command({"command": "ping"}, path=path, timeout=2.0)
+        except OSError:
+            path.unlink()
+        else:
+            raise RuntimeError(f"A daemon is already listening on {path}")
+    server = socketserver.ThreadingUnixStreamServer(str(path), Handler)
+    server.daemon_threads = True
+    os.chmod(path, 0o600)
+    threading.Thread(target=server.serve_forever, name="control-socket", daemon=True).start()
+    return server
@@ -1,14 +1,16 @@
 ### Function for data manipulation ###
 # Imports
+import os
 import pandas as pd
 import numpy as np
 import re
 from datetime import datetime
+from functools import lru_cache
 
 # Local imports
 from functions.logger import get_logger
 from functions.utils import load_excel, get_best_match
-from environment.variable import NON_FEATURES
+from environment.variable import AGE_BANDS, RATE_MARKERS, RATIO_FEATURES, NON_COUNT_TOTALS, SHRINK_RATES, SHRINK_PRIOR, PLAYING_TIME_CUTOFF, SHRUNK_PLAYING_TIME_CUTOFF
 
 # Logger
 logger = get_logger(__name__)
@@ -21,12 +23,8 @@ def flatten_columns(data: pd.DataFrame):
     """
     # Make column names free of irritating signs
     data = data.rename(columns=lambda x: re.sub(r'[+\- ]', '_', x))
-    # Check if multi-indices even exist
-    if not isinstance(data.columns, pd.MultiIndex):
-        data = data
-    else:
-        data = data.copy()
-
+    # Check if multi-indices even exist (rename returned a new frame, the columns can be set in place)
+    if isinstance(data.columns, pd.MultiIndex):
         data.columns = [
             ".".join(
                 [
@@ -51,11 +49,10 @@ import pandas as pd
 
 # Function: Make numeric columns
 def numeric_columns(data: pd.DataFrame) -> pd.DataFrame:
-    data = data.copy()
-
+    numeric = []
     for col in data.columns:
         # Only check object / string-like columns
-        if data[col].dtype == object:
+        if data[col].dtype == object or pd.api.types.is_string_dtype(data[col]):
             string = data[col].dropna().astype(str)
 
             # Skip empty columns
@@ -64,9 +61,10 @@ def numeric_columns(data: pd.DataFrame) -> pd.DataFrame:
 
             # If ALL values are numeric (digits, decimal, sign)
             if string.str.match(r'^[+-]?\d+(\.\d+)?$').all():
-                data[col] = data[col].astype(float)
+                numeric.append(col)
 
-    return data
+    # New frame, the other columns are shared with the input (no copy)
+    return data.astype({col: float for col in numeric}) if numeric else data
 
 # Function: Adapt market values
 def numeric_values_adaption(value_str: str) -> int | None:
@@ -78,19 +76,21 @@ def numeric_values_adaption(value_str: str) -> int | None:
         return None
 
     # Normalize German formats
-    s = s.replace("Mio.", "m").replace("Tsd.", "k")
+    s = s.replace("Mrd.", "bn").replace("Mio.", "m").replace("Tsd.", "k")
     s = s.replace(".", "").replace(",", ".") 
 
     # Remove currency and spaces
     s = s.replace("€", "").replace(" ", "").lower()
 
-    m = re.search(r"([0-9]+(?:\.[0-9]+)?)(m|k)?", s)
+    m = re.search(r"([0-9]+(?:\.[0-9]+)?)(bn|m|k)?", s)
     if not m:
         return None
 
     num = int(m.group(1)) / 100
     unit = m.group(2)
 
+    if unit == "bn":
+        return num * 1_000_000_000
     if unit == "m":
         return num * 1_000_000
     if unit == "k":
@@ -104,7 +104,7 @@ def mapping_two_columns(initial_data: pd.DataFrame, reference_data: pd.DataFrame
     # Get rid off weird letters
     # initial_data[column] = initial_data[column].apply(lambda x: "".join(c for c in unicodedata.normalize('NFD', x) if not unicodedata.combining(c)))
     missing = initial_data[column].unique()
-    choices = unique_reference[column].tolist()
+    choices = tuple(unique_reference[column].tolist())
 
     # Create and apply mappings
     name_map = {name: get_best_match(name, choices) for name in missing}
@@ -117,52 +117,97 @@ def mapping_two_columns(initial_data: pd.DataFrame, reference_data: pd.DataFrame
 
 # Function: Add a column that adds the scrapped date
 def add_date_column(length: int) -> pd.Series:
-    date = pd.Timestamp.now().normalize()
+    # Rebuilding an archived snapshot (backfill) keeps the date of the snapshot
+    date = pd.Timestamp(os.getenv("ARCHIVE_DATE") or pd.Timestamp.now()).normalize()
     date_series = pd.Series([date], dtype="datetime64[ns]")
 
     return date_series.repeat(length).reset_index(drop=True)
 
-# Function: Normalize data by various rules
-def normalize_data(data: pd.DataFrame, features: list) -> pd.DataFrame:
-    # Go through all features
-    for i, feature in enumerate(features):
-        # Check varios cases
-        if ("Per_90" in feature) or ("/90" in feature) or ("90s" in feature) or ("%" in feature) or ("Playing_time" in feature):
-            continue
-        else:
-            data[feature] = data[feature].astype(float) / data['Playing_Time.90s']
+# Function: Label the age band of each player
+def age_band(age: pd.Series, bands: list = AGE_BANDS) -> pd.Series:
+    # fbref ages come as "years-days", transfermarkt as plain years
+    years = pd.to_numeric(age.astype(str).str.split("-").str[0], errors="coerce")
+    edges = [low for low, _ in bands] + [bands[-1][1]]
+    labels = [f"{low}-{high - 1}" for low, high in bands]
+    return pd.cut(years, bins=edges, right=False, labels=labels).astype(object)
+
+# Function: Check if a feature is a season total (not a rate, share, average or playing time yet)
+def is_count_feature(feature: str) -> bool:
+    return feature not in RATIO_FEATURES and not any(marker in feature for marker in RATE_MARKERS)
+
+# Function: Check if a count feature counts events (Poisson model of shrink_rates and the bootstrap)
+def is_event_count(feature: str) -> bool:
+    return is_count_feature(feature) and feature not in NON_COUNT_TOTALS
+
+# Function: Count features of a column set (classified once per set of columns)
+@lru_cache(maxsize=64)
+def count_features(features: tuple) -> list:
+    return [feature for feature in features if is_count_feature(feature)]
+
+# Function: Sum of every column within the groups (shape: groups x columns)
+def group_sum(values: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    return pd.DataFrame(values).groupby(codes, sort=True).sum().to_numpy()
+
+# Function: Shrink per-90 rates toward the rate of their group (empirical Bayes)
+def shrink_rates(counts: np.ndarray, played: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """
+    Gamma-Poisson model per group and feature: the prior mean m is the pooled rate
+    (events / 90s), the prior variance t2 the minutes-weighted variance of the rates
+    minus the Poisson part (method of moments). A rate over n 90s is pulled toward m
+    with the weight t2 / (t2 + m / n): few minutes, strong pull.
+    counts: (players, features) counts, played: 90s per player, codes: group per player (0..k-1).
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = counts / played[:, None]
+        exposure = np.where(~np.isnan(counts) & (played[:, None] > 0), played[:, None], 0.0)
+        total = group_sum(exposure, codes)
+        prior = group_sum(np.where(exposure > 0, counts, 0.0), codes) / total
+        players = group_sum((exposure > 0).astype(np.float64), codes)
+        spread = group_sum(np.where(exposure > 0, exposure * (rates - prior[codes]) ** 2, 0.0), codes) / total
+        variance = np.clip(spread - prior * players / total, 0.0, None)[codes]
+        # Groups without any variation (all rates equal) keep the rate
+        weight = np.nan_to_num(variance / (variance + prior[codes] / played[:, None]), nan=1.0)
+        shrunk = prior[codes] + weight * (rates - prior[codes])
+
+    # Players without minutes keep the plain rate
+    return np.where(exposure > 0, shrunk, rates)
+
+# Function: Normalize the counts to per-90 rates (optionally shrunk toward their group)
+def normalize_data(data: pd.DataFrame, features: list, shrink: bool = SHRINK_RATES, prior: list = SHRINK_PRIOR) -> pd.DataFrame:
+    """
+    Counts are divided by the 90s played in one matrix operation, rates, shares and the
+    playing time are kept. With shrink the event rates are pulled toward the rate of their
+    prior group (League / Pos_group) by minutes, see shrink_rates; totals that are no event
+    counts (NON_COUNT_TOTALS) stay plain per-90 values.
+    """
+    counts = count_features(tuple(features))
+    if not counts:
+        return data
+    values = data[counts].to_numpy(dtype=np.float64, na_value=np.nan)
+    played = data["Playing_Time.90s"].to_numpy(dtype=np.float64, na_value=np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = values / played[:, None]
+    events = np.array([is_event_count(feature) for feature in counts], dtype=bool)
+    if shrink and events.any():
+        codes = data.groupby(list(prior), dropna=False, sort=False).ngroup().to_numpy()
+        rates[:, events] = shrink_rates(counts=values[:, events], played=played, codes=codes)
+    data[counts] = rates
 
     return data
 
-# Function: Standardize data (fixed, select only needed columns)
-def standardize_data(data: pd.DataFrame, columns_interest: list, grouping: list, column: str) -> pd.DataFrame:
-    # Ensure inputs are lists
-    if not isinstance(columns_interest, list):
-        columns_interest = list(columns_interest)
-    if not isinstance(grouping, list):
-        grouping = list(grouping)
-
-    overall_data = pd.DataFrame()
-
-    for i, group in enumerate(grouping):
-        # Select columns of interest and not more
-        temp_data = data.loc[data[column] == group, NON_FEATURES + columns_interest].copy()
-
-        # Standardize all columns
-        for col in columns_interest:
-            mean = temp_data[col].astype(float).mean()
-            std = temp_data[col].astype(float).std()
-            temp_data[col] = (temp_data[col].astype(float) - mean) / std
-
-        # Rename columns once for this group
-        temp_data.rename(columns={col: f"{column}.{col}" for col in columns_interest}, inplace=True)
-
-        # Concat group data
-        if i == 0:
-            overall_data = temp_data
-        else:
-            overall_data = pd.concat([overall_data, temp_data], axis=0)
-
-    # Reset index
-    overall_data.reset_index(drop=True, inplace=True)
-    return overall_data
+# Function: Share of players (by 90s played) dropped per league for the normalization used
+def playing_time_cutoff(shrink: bool = SHRINK_RATES) -> float:
+    return SHRUNK_PLAYING_TIME_CUTOFF if shrink else PLAYING_TIME_CUTOFF
+
+# Function: Standardize the features within the groups of a column
+def standardize_data(data: pd.DataFrame, columns_interest: list, column: str, groups: pd.Series | None = None) -> pd.DataFrame:
+    """
+    Z-score of every feature within its group (groups: group key per row, default data[column]).
+    Returns only the standardized columns, named "{column}.{feature}", on the index of data;
+    rows without a group are NaN.
+    """
+    values = data[list(columns_interest)].astype(float)
+    grouped = values.groupby(data[column] if groups is None else groups, sort=False)
+    standardized = (values - grouped.transform("mean")) / grouped.transform("std")
+
+    return standardized.add_prefix(f"{column}.")
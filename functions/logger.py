@@ -1,6 +1,130 @@
 ### Log important events ###
+"""
+Loggers only put records on a queue; one background listener thread does the
+(blocking) writing to the console and log files.
+Records are emitted as JSON lines (LOG_FORMAT="json") with structured fields
+passed via `extra`, e.g. extra={"stage": "fetch", "url": url, "duration": 1.2}.
+Noisy loops can throttle a message with extra={"rate_limit": seconds} or
+extra={"sample": fraction}.
+"""
+import atexit
+import copy
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Structured fields copied into the JSON record when present
+STRUCTURED_FIELDS = ("stage", "league", "table", "club", "url", "status", "duration", "suppressed", "peak_mb", "result_mb")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+
+# Class: JSON lines formatter
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+# Class: Queue handler that keeps the traceback apart from the message
+class TracebackQueueHandler(QueueHandler):
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The base class formats the traceback into msg; here it stays in exc_text for the formatter
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            # No traceback objects (frames) on the queue
+            record.exc_info = None
+        return record
+
+# Class: Rate limit / sampling per message template (runs on the caller thread, no I/O)
+class RateLimitFilter(logging.Filter):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._last = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample = getattr(record, "sample", None)
+        if sample is not None and random.random() >= sample:
+            return False
+        interval = getattr(record, "rate_limit", None)
+        if interval is None:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last.get(key, -interval) < interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+            self._last[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+# Shared queue and background listener of the process
+_queue = queue.SimpleQueue()
+_listener = None
+_handlers = {}
+_lock = threading.Lock()
+
+# Function: Formatter of the configured format
+def _formatter() -> logging.Formatter:
+    if LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter("[%(asctime)s] [%(levelname)s] %(name)s: %(message)s")
+
+# Function: (Re)start the listener with all output handlers
+def _start_listener(log_file: str | None) -> None:
+    global _listener
+    with _lock:
+        if "stream" in _handlers and (log_file is None or log_file in _handlers):
+            return
+        if "stream" not in _handlers:
+            _handlers["stream"] = logging.StreamHandler()
+        if log_file and log_file not in _handlers:
+            _handlers[log_file] = RotatingFileHandler(log_file, maxBytes=5_000_000, backupCount=3)
+        for handler in _handlers.values():
+            handler.setFormatter(_formatter())
+        if _listener is not None:
+            _listener.stop()
+        _listener = QueueListener(_queue, *_handlers.values(), respect_handler_level=True)
+        _listener.start()
+
+# Function: Flush and stop the listener (at exit), a later get_logger starts a new one
+def shutdown_logging() -> None:
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        for handler in _handlers.values():
+            handler.close()
+        _handlers.clear()
+
+atexit.register(shutdown_logging)
 
 # Function: Logger information
 def get_logger(
@@ -18,28 +142,18 @@ def get_logger(
     level : int
         Logging level (e.g. logging.INFO)
     log_file : str | None
-        Optional log file path
+        Optional log file path (written by the listener thread)
     """
 
     logger = logging.getLogger(name)
     logger.setLevel(level)
+    _start_listener(log_file)
 
     if logger.handlers:
         return logger  # avoid duplicate handlers
 
-    formatter = logging.Formatter(
-        "[%(asctime)s] [%(levelname)s] %(name)s: %(message)s"
-    )
-
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(formatter)
-    logger.addHandler(stream_handler)
-
-    if log_file:
-        file_handler = RotatingFileHandler(
-            log_file, maxBytes=5_000_000, backupCount=3
-        )
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+    queue_handler = TracebackQueueHandler(_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    logger.addHandler(queue_handler)
 
-    return logger
\ No newline at end of file
+    return logger
@@ -0,0 +1,69 @@
+### Refresh manifest ###
+"""
+Small JSON record of when each workbook sheet was last written.
+Standard library only, so cheap commands (status) can read it without pandas.
+"""
+# Imports
+import json
+import os
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # windows: single writer process only
+    fcntl = None
+
+# Local imports
+from environment.variable import DATA_PATH, MANIFEST_NAME
+
+# Function: Path of the manifest
+def manifest_path() -> Path:
+    return Path(DATA_PATH, f"{MANIFEST_NAME}.json")
+
+# Function: Load the manifest
+def load_manifest() -> dict:
+    path = manifest_path()
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+# Function: Record that a sheet was (re)written
+def record_refresh(name: str, sheet: str | None, rows: int | None = None, signal: dict | None = None) -> None:
+    path = manifest_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Several worker processes may record at the same time: lock the read-modify-write
+    with open(path.with_name(path.name + ".lock"), "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = load_manifest()
+        manifest.setdefault(name, {})[sheet or name] = {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "rows": rows,
+        }
+        if signal is not None:
+            # Summary of the source at refresh time, compared to detect changes
+            manifest[name][sheet or name]["signal"] = signal
+        # Write atomically, readers never see a half written file
+        temp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(temp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp, path)
+
+# Function: Check if an entry is older than the allowed offset (same rule as date_update_check)
+def is_stale(entry: dict | None, offset_days: int = 0) -> bool:
+    if not entry:
+        return True
+    refreshed = datetime.fromisoformat(entry["date"]).date()
+    return refreshed < date.today() - timedelta(days=offset_days)
+
+# Function: Day on which a refresh interval (in days) is over (date.min if never refreshed)
+def due_date(entry: dict | None, ttl_days: int) -> date:
+    if not entry:
+        return date.min
+    return datetime.fromisoformat(entry["date"]).date() + timedelta(days=ttl_days)
+
+# Function: Check if a refresh interval (in days) is over
+def is_expired(entry: dict | None, ttl_days: int) -> bool:
+    return due_date(entry, ttl_days) <= date.today()
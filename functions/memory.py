@@ -0,0 +1,59 @@
+### Peak memory per stage ###
+"""
+tracemalloc based peak memory of a stage, logged when TRACE_MEMORY=1
+(tracing slows allocations down, so it is off by default).
+numpy / pandas buffers are traced, arrow buffers are not. Stages may nest,
+an outer stage still reports the peak of its inner stages.
+"""
+# Imports
+import os
+import tracemalloc
+from contextlib import contextmanager
+
+# Local imports
+from functions.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Peaks seen by the active stages (outermost first)
+_stack = []
+
+# Function: Check if memory tracing is switched on
+def tracing_enabled() -> bool:
+    return os.getenv("TRACE_MEMORY", "0") == "1"
+
+# Function: Track the peak memory of a stage, report["result"] may hold the produced frame
+@contextmanager
+def track_memory(stage: str):
+    report = {}
+    if not tracing_enabled():
+        yield report
+        return
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    # reset_peak would lose the peak of the outer stages, keep it first
+    current, peak = tracemalloc.get_traced_memory()
+    for entry in _stack:
+        entry["peak"] = max(entry["peak"], peak)
+    tracemalloc.reset_peak()
+    entry = {"base": current, "peak": current}
+    _stack.append(entry)
+    try:
+        yield report
+    finally:
+        _stack.pop()
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(entry["peak"], peak)
+        for outer in _stack:
+            outer["peak"] = max(outer["peak"], peak)
+        result = report.get("result")
+        result_mb = result.memory_usage(index=True, deep=False).sum() / 2**20 if result is not None else None
+        peak_mb = (peak - entry["base"]) / 2**20
+        logger.info(
+            "Memory of %s: peak %.1f MB%s", stage, peak_mb,
+            f", result {result_mb:.1f} MB ({peak_mb / result_mb:.1f}x)" if result_mb else "",
+            extra={"stage": stage, "peak_mb": round(peak_mb, 2), "result_mb": round(result_mb, 2) if result_mb is not None else None},
+        )
+        if started:
+            tracemalloc.stop()
@@ -0,0 +1,76 @@
+### Streaming fetch -> parse -> merge pipeline ###
+"""
+The fetch stage runs in its own thread (network + throttle waits), the parse
+stage in a worker pool, the merge stage is the caller iterating the results.
+Buffers between the stages are bounded, so parsing page N overlaps with the
+wait for page N+1 without piling up pages in memory, and a parsed page reaches
+the merge stage without waiting for the next fetch.
+"""
+# Imports
+from __future__ import annotations
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+# Local imports
+from functions.logger import get_logger
+from classes.rate_control import interruptible
+
+logger = get_logger(__name__)
+
+_DONE = object()
+
+# Function: Stream items through fetch -> parse, yield (item, parsed) in input order
+def stream_pipeline(
+    items: Iterable,
+    fetch: Callable,
+    parse: Callable,
+    buffer: int = 2,
+    workers: int = 2,
+    processes: bool = False,
+) -> Iterator[tuple]:
+    """
+    fetch(item) -> payload runs sequentially in the fetch thread, which submits every
+    payload to parse(item, payload) in a thread pool (processes=True: process pool,
+    parse must then be a module level function) right away.
+    An exception in any stage stops the fetch thread and is raised to the caller.
+    """
+    fetched = queue.Queue(maxsize=buffer)
+    stop = threading.Event()
+    pool = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=workers)
+
+    def fetch_stage():
+        try:
+            # Throttle and retry waits end as soon as the caller stops
+            with interruptible(stop):
+                for item in items:
+                    if stop.is_set():
+                        return
+                    payload = fetch(item)
+                    fetched.put((item, pool.submit(parse, item, payload)))
+        except BaseException as error:
+            fetched.put((_DONE, error))
+            return
+        fetched.put((_DONE, None))
+
+    fetcher = threading.Thread(target=fetch_stage, name="fetch-stage", daemon=True)
+    fetcher.start()
+    try:
+        while True:
+            item, parsing = fetched.get()
+            if item is _DONE:
+                if parsing is not None:
+                    raise parsing
+                break
+            # Pages are parsed while the next ones are fetched: only the oldest page is waited for
+            yield item, parsing.result()
+    finally:
+        stop.set()
+        # Unblock the fetch thread if it waits on a full buffer
+        while fetcher.is_alive():
+            try:
+                fetched.get_nowait()
+            except queue.Empty:
+                fetcher.join(timeout=0.1)
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -1,17 +1,21 @@
 ### Further functions ###
 # Imports
-import pandas as pd
-import pycountry
+from __future__ import annotations
+import os
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Literal
 from pathlib import Path
-import pyarrow as pa
-import pyarrow.parquet as pq
 from datetime import datetime, timedelta
-from rapidfuzz import process, utils
 
 # Local imports
-from environment.variable import DATA_PATH, STATS_NAME, SHEETS
+from environment.variable import DATA_PATH, STATS_NAME, SHEETS, MATRIX_PATH, PLAYER_KEYS, EXCEL_CHUNK_ROWS, MATCH_CHOICE_SETS
 from functions.logger import get_logger
+from functions.manifest import record_refresh
+# Heavy / rarely needed modules (pandas, numpy, pycountry, pyarrow, rapidfuzz) are imported inside the functions using them
 
 # Logger
 logger = get_logger(__name__)
@@ -25,19 +29,24 @@ def find_country(countries: pd.Series, alpha: Literal[2, 3, "name"] = "name") ->
     else:
         param = "name"
 
-    def lookup(x):
-        if pd.isna(x):
-            return None
-        try:
-            c = pycountry.countries.lookup(str(x))
-            return getattr(c, param)
-        except LookupError:
-            return None
+    # Look up every distinct country once (cached across calls)
+    mapping = {country: _country_code(str(country), param) for country in countries.dropna().unique()}
+    return countries.map(mapping)
+
+# Function: Code of one country (None if unknown)
+@lru_cache(maxsize=1024)
+def _country_code(country: str, param: str) -> str | None:
+    import pycountry
 
-    return countries.apply(lookup)
+    try:
+        return getattr(pycountry.countries.lookup(country), param)
+    except LookupError:
+        return None
 
 # Function: Store data as an Excel file
 def store_excel(data: pd.DataFrame, name: str, sheet_name: str | None = None):
+    import pandas as pd
+
     excel_path = Path(DATA_PATH, f"{name}.xlsx")
 
     if sheet_name is None:
@@ -67,11 +76,70 @@ def store_excel(data: pd.DataFrame, name: str, sheet_name: str | None = None):
         ) as writer:
             data.to_excel(writer, sheet_name=sheet_name, index=False)
 
+    record_refresh(name=name, sheet=sheet_name, rows=len(data))
     append_msg = f" (append: {sheet_name})" if sheet_name else ""
     logger.info(f"DataFrame is uploaded to: {name}{append_msg}")
 
+# Function: Rows of a frame as plain python values (missing -> None = empty cell)
+def _excel_rows(data: pd.DataFrame, chunk: int = EXCEL_CHUNK_ROWS):
+    yield list(map(str, data.columns))
+    # Converted chunk by chunk: only one chunk is held as python objects
+    for start in range(0, len(data), chunk):
+        part = data.iloc[start:start + chunk]
+        yield from part.astype(object).where(part.notna(), None).itertuples(index=False, name=None)
+
+# Function: openpyxl cell of a value (strings starting with "=" stay text instead of formulas)
+def _text_cell(worksheet, value, cell_type):
+    if not (isinstance(value, str) and value.startswith("=")):
+        return value
+    cell = cell_type(worksheet, value=value)
+    cell.data_type = "s"
+    return cell
+
+# Function: Write all sheets of a workbook in one pass (streaming, constant memory)
+def export_workbook(sheets: dict, name: str) -> Path:
+    """
+    sheets maps the sheet name to its frame. The workbook is written once with a
+    streaming writer (xlsxwriter constant_memory, openpyxl write_only as fallback)
+    into a temp file that replaces the old workbook atomically.
+    """
+    excel_path = Path(DATA_PATH, f"{name}.xlsx")
+    temp_path = Path(DATA_PATH, f".{name}.tmp.xlsx")
+    excel_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        import xlsxwriter
+    except ImportError:
+        xlsxwriter = None
+
+    if xlsxwriter is not None:
+        # Strings are written as text, also if they start with "=" (no formulas from scraped names)
+        workbook = xlsxwriter.Workbook(temp_path, {"constant_memory": True, "default_date_format": "yyyy-mm-dd", "strings_to_formulas": False})
+        for sheet_name, data in sheets.items():
+            worksheet = workbook.add_worksheet(sheet_name)
+            for r, row in enumerate(_excel_rows(data)):
+                worksheet.write_row(r, 0, row)
+        workbook.close()
+    else:
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+
+        workbook = Workbook(write_only=True)
+        for sheet_name, data in sheets.items():
+            worksheet = workbook.create_sheet(sheet_name)
+            for row in _excel_rows(data):
+                worksheet.append([_text_cell(worksheet, value, WriteOnlyCell) for value in row])
+        workbook.save(temp_path)
+    os.replace(temp_path, excel_path)
+
+    for sheet_name, data in sheets.items():
+        record_refresh(name=name, sheet=sheet_name, rows=len(data))
+    logger.info("Workbook is exported to: %s (%s)", excel_path, ", ".join(sheets))
+    return excel_path
+
 # Function: Load excel / sheet
 def load_excel(name: str, sheet_name: str | None = None) -> pd.DataFrame:
+    import pandas as pd
+
     excel_path = Path(DATA_PATH, f"{name}.xlsx")
 
     try:
@@ -87,24 +155,146 @@ def load_excel(name: str, sheet_name: str | None = None) -> pd.DataFrame:
 
 # Function: Store data as a parquet 
 def store_parquet(data: pd.DataFrame, name: str):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
     parquet_path = Path(DATA_PATH, f"{name}.parquet")
     with open(parquet_path, "wb") as f:
         table = pa.Table.from_pandas(data)
         pq.write_table(table, f)
-    logger.info("DataFrame is uploaded to:", parquet_path)
+    logger.info("DataFrame is uploaded to: %s", parquet_path)
 
 # Function: Loada data from a parquet 
 def load_parquet(name: str) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+
     parquet_path = Path(DATA_PATH, f"{name}.parquet")
     table = pq.read_table(parquet_path)
     data = table.to_pandas()
-    logger.info("DataFrame is loaded from:", parquet_path)
+    logger.info("DataFrame is loaded from: %s", parquet_path)
 
     return data
 
+# Versions of a feature matrix kept on disk (readers of the previous one keep working)
+MATRIX_VERSIONS = 2
+
+# Function: Store the numeric features as a contiguous float32 matrix (memory-mappable)
+def store_feature_matrix(data: pd.DataFrame, name: str, features: list, keys: list = PLAYER_KEYS, root: Path = MATRIX_PATH):
+    """
+    Writes a new version directory <name>/<version>/ with matrix.npy (C-contiguous
+    float32), keys.parquet (player keys per row) and meta.json (column names and shape),
+    then publishes it by replacing the pointer file <name>.json in one rename. A reader
+    follows the pointer once, so matrix, keys and columns always belong to the same write.
+    """
+    import shutil
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    matrix = np.ascontiguousarray(data[features].to_numpy(dtype=np.float32, na_value=np.nan))
+    version = f"{time.time_ns()}-{os.getpid()}"
+    folder = Path(root, name, version)
+    folder.mkdir(parents=True)
+    with open(Path(folder, "matrix.npy"), "wb") as f:
+        np.save(f, matrix)
+    pq.write_table(pa.Table.from_pandas(data[[k for k in keys if k in data.columns]], preserve_index=False), Path(folder, "keys.parquet"))
+    with open(Path(folder, "meta.json"), "w") as f:
+        json.dump({"columns": list(features), "shape": list(matrix.shape), "dtype": "float32"}, f)
+
+    # Publish: the pointer is the only file that is replaced
+    pointer = Path(root, f"{name}.json")
+    temp = pointer.with_name(f".{pointer.name}.{os.getpid()}.tmp")
+    with open(temp, "w") as f:
+        json.dump({"version": version}, f)
+    os.replace(temp, pointer)
+
+    # Old versions beyond MATRIX_VERSIONS are removed (open memory maps stay valid)
+    versions = sorted((p for p in Path(root, name).iterdir() if p.is_dir()), key=lambda p: int(p.name.split("-")[0]))
+    for old in versions[:-MATRIX_VERSIONS]:
+        shutil.rmtree(old, ignore_errors=True)
+    logger.info("Feature matrix is stored to: %s %s", folder, matrix.shape)
+
+# Function: Check if a feature matrix was published
+def feature_matrix_exists(name: str, root: Path = MATRIX_PATH) -> bool:
+    return Path(root, f"{name}.json").exists()
+
+# Function: Load the feature matrix (memory-mapped by default, zero copy)
+def load_feature_matrix(name: str, mmap: bool = True, root: Path = MATRIX_PATH, arrow_keys: bool = False) -> tuple[np.ndarray, pd.DataFrame, list]:
+    """arrow_keys: keys as a pyarrow Table (no pandas import, e.g. for the query command)."""
+    import numpy as np
+    import pyarrow.parquet as pq
+
+    for attempt in range(3):
+        with open(Path(root, f"{name}.json")) as f:
+            folder = Path(root, name, json.load(f)["version"])
+        try:
+            with open(Path(folder, "meta.json")) as f:
+                columns = json.load(f)["columns"]
+            matrix = np.load(Path(folder, "matrix.npy"), mmap_mode="r" if mmap else None)
+            keys = pq.ParquetFile(Path(folder, "keys.parquet")).read()
+            keys = keys if arrow_keys else keys.to_pandas()
+        except FileNotFoundError:
+            # The version was removed by later writes meanwhile: follow the new pointer
+            if attempt == 2:
+                raise
+            continue
+        return matrix, keys, columns
+
+
+# Function: Path of a stored partition (e.g. name="fbref/Bundesliga", partition="stats_shooting")
+def partition_path(name: str, partition: str) -> Path:
+    return Path(DATA_PATH, name, f"{partition}.parquet")
+
+# Loaded partitions of a long running process (path -> (file version, frame)), None: disabled
+_partition_cache = None
+
+# Function: Keep loaded partitions in memory (daemon), re-read only files changed on disk
+def enable_partition_cache() -> None:
+    global _partition_cache
+    if _partition_cache is None:
+        _partition_cache = {}
+
+# Function: Version of a stored file (changes on every rewrite)
+def _file_version(path: Path) -> tuple:
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+# Function: Store one partition and note its refresh date
+def store_partition(data: pd.DataFrame, name: str, partition: str, signal: dict | None = None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = partition_path(name=name, partition=partition)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write atomically, other processes may read the partition meanwhile
+    temp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    pq.write_table(pa.Table.from_pandas(data, preserve_index=False), temp)
+    os.replace(temp, path)
+    if _partition_cache is not None:
+        _partition_cache[path] = (_file_version(path), data.copy(deep=False))
+    record_refresh(name=name, sheet=partition, rows=len(data), signal=signal)
+
+# Function: Load one partition (None if it was never stored)
+def load_partition(name: str, partition: str) -> pd.DataFrame | None:
+    import pyarrow.parquet as pq
+
+    path = partition_path(name=name, partition=partition)
+    if not path.exists():
+        return None
+    if _partition_cache is None:
+        return pq.read_table(path).to_pandas()
+    version = _file_version(path)
+    cached = _partition_cache.get(path)
+    if cached is None or cached[0] != version:
+        cached = (version, pq.read_table(path).to_pandas())
+        _partition_cache[path] = cached
+    # Shallow copy: callers may add or replace columns without touching the cache (copy on write)
+    return cached[1].copy(deep=False)
 
 # Function: Check if an update is necessary
 def date_update_check(date: pd.Timestamp, offset_days: int = 30) -> bool:
+    import pandas as pd
+
     current_date = pd.Timestamp.now().normalize()
     offset_date = current_date - timedelta(days=offset_days)
     if date < offset_date:
@@ -114,6 +304,8 @@ def date_update_check(date: pd.Timestamp, offset_days: int = 30) -> bool:
 
 # Function: Determine which sheets needs to be updated:
 def update_sheets(offset_date: int) -> list:
+    import pandas as pd
+
     # Check if the data already exists
     data_path = Path(DATA_PATH, f"{STATS_NAME}.xlsx")
     update_sheets = SHEETS.copy()
@@ -134,19 +326,48 @@ def update_sheets(offset_date: int) -> list:
             if not date_update_check(date=temp_date, offset_days=offset_date):
                 update_sheets.remove(sheet)
     if len(update_sheets) > 0:
-        logger.info("Following sheets need to be updated:", update_sheets)
+        logger.info("Following sheets need to be updated: %s", update_sheets)
     else:
         logger.info("All sheets are up to date")
     return update_sheets
 
+# Matches per choice set, keyed by the choices (equal choices built anew share the entry), the last MATCH_CHOICE_SETS sets are kept
+_choice_sets = OrderedDict()
+_choice_lock = threading.Lock()
+
+# Class: Choices prepared for fuzzy matching once, with the matches found so far
+class _ChoiceSet:
+
+    def __init__(self, choices: tuple) -> None:
+        from rapidfuzz import utils
+
+        self.choices = choices
+        self.processed = [utils.default_process(choice) for choice in choices]
+        self.matches = {}
+
+    def best_match(self, name: str) -> str | None:
+        if name not in self.matches:
+            from rapidfuzz import process, utils
+
+            # Find the best match with a similarity score
+            match = process.extractOne(utils.default_process(name), self.processed, processor=None)
+            # Only return if the match is very likely (score > 70/100)
+            self.matches[name] = self.choices[match[2]] if match and match[1] > 70 else None
+        return self.matches[name]
+
 # Function: Find the closest name
-def get_best_match(name: str, choices: list) -> str | None:
-    # Find the best match with a similarity score
-    match = process.extractOne(name, choices, processor=utils.default_process)
-    # Only return if the match is very likely (score > 70/100)
-    if match and match[1] > 70:
-        return match[0]
-    return None
+def get_best_match(name: str, choices: list | tuple) -> str | None:
+    # Earlier matches against the same choices are reused
+    choices = tuple(choices)
+    with _choice_lock:
+        choice_set = _choice_sets.get(choices)
+        if choice_set is None:
+            choice_set = _choice_sets[choices] = _ChoiceSet(choices)
+            while len(_choice_sets) > MATCH_CHOICE_SETS:
+                _choice_sets.popitem(last=False)
+        else:
+            _choice_sets.move_to_end(choices)
+    return choice_set.best_match(name)
 
 # Function: Filter Data by certain columns and entries
 def filter_data_set(data: pd.DataFrame, columns: list, filter_entries: list) -> pd.DataFrame:
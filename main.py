@@ -1,15 +1,265 @@
 ### Runner for the app ###
+"""
+Command line entry point.
+    python main.py            -> scrape what is stale and score (as before)
+    python main.py scrape --league Bundesliga --table stats_shooting
+    python main.py scrape --club "Bayern Munich"
+    python main.py scrape --mode record / replay (with python main.py replay running)
+    python main.py scrape --distributed --local-workers 4 (plus python main.py worker on the same host)
+    python main.py backfill --start 2026-08-01 --end 2026-10-01
+    python main.py status     -> freshness of the stored sheets
+    python main.py profiles   -> contract, foot, height, agent and value history of changed players
+    python main.py daemon     -> warm process refreshing every dataset on its TTL
+    python main.py ctl status / ctl refresh fbref/Bundesliga / ctl stop
+    python main.py score --engine sql --source "data/backfill/*/leagues/*.parquet" --by Date
+    python main.py changes --since 2026-10-01 -> transfers, value / rating / stats changes
+    python main.py query NAME -> features of a player
+Every subcommand imports only what it needs, heavy modules are loaded inside the handlers.
+"""
 # Imports
-import os
+import argparse
+import sys
+
 # Local imports
-from backend.combine_data import data_table
-from backend.metric_analyzation.scoring import run_scoring
 from environment.variable import DATA_PATH
 
-# Make the data directory if not existing
-if not DATA_PATH.exists():
-    os.mkdir(DATA_PATH)
-    
-# Just run what is present now
-data = data_table()
-score = run_scoring()
\ No newline at end of file
+# Function: Scrape the stale sheets (fbref + transfermarkt)
+def command_scrape(args: argparse.Namespace) -> None:
+    import os
+    if getattr(args, "mode", None):
+        os.environ["SCRAPER_MODE"] = args.mode
+    if getattr(args, "distributed", False):
+        from backend.distributed import distributed_crawl
+        distributed_crawl(
+            leagues=args.league, tables=args.table, clubs=args.club, local_workers=args.local_workers,
+        )
+        return
+    from backend.combine_data import data_table
+    data_table(leagues=getattr(args, "league", None), tables=getattr(args, "table", None), clubs=getattr(args, "club", None))
+
+# Function: Run crawl jobs of the queue
+def command_worker(args: argparse.Namespace) -> None:
+    from backend.distributed import run_worker
+    run_worker(idle_exit=args.idle_exit, poll=args.poll)
+
+# Function: Run the refresh daemon (until ctl stop, SIGTERM or Ctrl-C)
+def command_daemon(args: argparse.Namespace) -> None:
+    import signal
+    from backend.daemon import Daemon
+
+    daemon = Daemon(tick=args.tick)
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.stop()
+
+# Function: Send a command to the running daemon
+def command_ctl(args: argparse.Namespace) -> None:
+    import json
+    from environment.variable import DAEMON_SOCKET
+    from functions.control import send_command
+
+    request = {"command": args.action}
+    if args.action == "refresh":
+        request.update(datasets=args.dataset or ["all"], tables=args.table)
+    try:
+        answer = send_command(request, path=DAEMON_SOCKET)
+    except OSError as e:
+        raise SystemExit(f"No daemon on {DAEMON_SOCKET}: {e}")
+    print(json.dumps(answer, indent=2))
+    if answer.get("error"):
+        raise SystemExit(1)
+
+# Function: Crawl the player profiles (changed players only)
+def command_profiles(args: argparse.Namespace) -> None:
+    from backend.profiles import enrich_profiles
+    enrich_profiles(workers=args.workers, limit=args.limit)
+
+# Function: Rebuild the combined sheet from the stored league partitions
+def command_combine(args: argparse.Namespace) -> None:
+    from backend.combine_data import export_stats_workbook
+    export_stats_workbook()
+
+# Function: Run the scoring
+def command_score(args: argparse.Namespace) -> None:
+    if getattr(args, "engine", "pandas") == "sql":
+        from backend.metric_analyzation.sql_scoring import sql_scoring
+        sql_scoring(source=args.source, normalize=args.normalize, by=args.by)
+        return
+    from backend.metric_analyzation.scoring import run_scoring
+    run_scoring()
+
+# Function: Show how fresh the stored data is
+def command_status(args: argparse.Namespace) -> None:
+    from functions.manifest import load_manifest, is_stale
+
+    manifest = load_manifest()
+    if not manifest:
+        print("No data stored yet")
+        return
+    for name, sheets in manifest.items():
+        print(name)
+        for sheet, entry in sheets.items():
+            state = "stale" if is_stale(entry, offset_days=args.offset) else "fresh"
+            print(f"  {sheet:<32} {entry['date']:<20} rows={entry['rows']!s:<8} {state}")
+
+# Function: Show the change feed
+def command_changes(args: argparse.Namespace) -> None:
+    from datetime import datetime
+    from backend.changes import read_changes
+
+    changes = read_changes(since=datetime.fromisoformat(args.since) if args.since else None, source=args.source)
+    if changes.empty:
+        print("No changes")
+        return
+    print(changes.drop(columns=[c for c in changes.columns if c.endswith("Stats_Hash")]).to_string(index=False))
+
+# Function: Show the features of a player
+def command_query(args: argparse.Namespace) -> None:
+    from environment.variable import FEATURES_SCHEMA
+    from functions.utils import load_feature_matrix, feature_matrix_exists
+
+    groups = [args.group] if args.group else list(FEATURES_SCHEMA)
+    needle = args.player.lower()
+    found = 0
+    for group in groups:
+        if not feature_matrix_exists(name=group):
+            continue
+        # Keys as an Arrow table: the query does not need pandas
+        matrix, keys, columns = load_feature_matrix(name=group, arrow_keys=True)
+        records = keys.to_pylist()
+        rows = [i for i, record in enumerate(records) if needle in str(record.get("Player")).lower()]
+        for row in rows:
+            found += 1
+            print(f"[{group}] " + ", ".join(f"{k}={v}" for k, v in records[row].items()))
+            for column, value in zip(columns, matrix[row]):
+                print(f"  {column:<60} {value: .3f}")
+    if found == 0:
+        print(f"No player matching {args.player!r}")
+
+# Function: Serve recorded pages on the local stand-in server
+def command_replay(args: argparse.Namespace) -> None:
+    from classes.replay_server import FaultProfile, ReplayServer
+
+    faults = FaultProfile(
+        latency_s=args.latency,
+        latency_jitter_s=args.jitter,
+        burst_every=args.burst_every,
+        burst_length=args.burst_length,
+        retry_after_s=args.retry_after,
+        forbidden_rate=args.forbidden_rate,
+        seed=args.seed,
+    )
+    server = ReplayServer(port=args.port, faults=faults)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+# Function: Re-process archived pages without scraping
+def command_backfill(args: argparse.Namespace) -> None:
+    from datetime import date
+    from backend.backfill import backfill
+
+    start = date.fromisoformat(args.start) if args.start else None
+    end = date.fromisoformat(args.end) if args.end else None
+    results = backfill(start=start, end=end, workers=args.workers)
+    failed = [str(snapshot) for snapshot, code in results.items() if code != 0]
+    if failed:
+        raise SystemExit(f"Backfill failed for: {', '.join(failed)}")
+
+# Function: Default run (everything that is stale)
+def command_run(args: argparse.Namespace) -> None:
+    command_scrape(args)
+    command_score(args)
+
+# Function: Parser
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="main.py", description="Football player valuation")
+    parser.set_defaults(handler=command_run)
+    parser.add_argument("--trace-memory", action="store_true", help="Log the peak memory of every stage (slower)")
+    commands = parser.add_subparsers(dest="command")
+
+    scrape = commands.add_parser("scrape", help="Scrape stale tables or a selection")
+    scrape.add_argument("--league", action="append", help="League to refresh, e.g. Bundesliga (repeatable)")
+    scrape.add_argument("--table", action="append", help="fbref table to refresh, e.g. stats_shooting (repeatable)")
+    scrape.add_argument("--club", action="append", help="Transfermarkt club to refresh, e.g. \"Bayern Munich\" (repeatable)")
+    scrape.add_argument("--mode", choices=["live", "record", "replay", "archive"], help="Crawl live, record responses, replay them or read the page archive")
+    scrape.add_argument("--distributed", action="store_true", help="Put the crawl jobs on the queue and wait for the workers")
+    scrape.add_argument("--local-workers", type=int, default=0, help="Worker processes started by --distributed")
+    scrape.set_defaults(handler=command_scrape)
+
+    worker = commands.add_parser("worker", help="Run crawl jobs of the queue (shared data folder)")
+    worker.add_argument("--idle-exit", type=float, default=None, help="Exit after this many idle seconds (default: run forever)")
+    worker.add_argument("--poll", type=float, default=2.0, help="Seconds between polls of an empty queue")
+    worker.set_defaults(handler=command_worker)
+    profiles = commands.add_parser("profiles", help="Crawl the Transfermarkt profiles of changed players")
+    profiles.add_argument("--workers", type=int, default=2, help="Parallel fetches")
+    profiles.add_argument("--limit", type=int, default=None, help="Fetch at most this many profiles")
+    profiles.set_defaults(handler=command_profiles)
+
+    daemon = commands.add_parser("daemon", help="Warm process refreshing every dataset when its TTL is over")
+    daemon.add_argument("--tick", type=float, default=300, help="Longest sleep between schedule checks in seconds")
+    daemon.set_defaults(handler=command_daemon)
+
+    ctl = commands.add_parser("ctl", help="Control the running daemon")
+    ctl.add_argument("action", choices=["status", "refresh", "stop"])
+    ctl.add_argument("dataset", nargs="*", help="refresh: transfermarkt, fbref/<league> or all (default)")
+    ctl.add_argument("--table", action="append", help="refresh: only these fbref tables (repeatable)")
+    ctl.set_defaults(handler=command_ctl)
+
+    commands.add_parser("combine", help="Rebuild the combined sheet").set_defaults(handler=command_combine)
+    score = commands.add_parser("score", help="Run the scoring")
+    score.add_argument("--engine", choices=["pandas", "sql"], default="pandas", help="sql: DuckDB over the parquet partitions (out of core, parquet output)")
+    score.add_argument("--source", default=None, help="sql: parquet file(s) or glob (default: the league partitions)")
+    score.add_argument("--by", action="append", help="sql: extra group key, e.g. Date for several seasons (repeatable)")
+    score.add_argument("--normalize", action="store_true", help="sql: the source is not per-90 normalized yet")
+    score.set_defaults(handler=command_score)
+
+    status = commands.add_parser("status", help="Freshness of the stored data")
+    status.add_argument("--offset", type=int, default=0, help="Allowed age in days")
+    status.set_defaults(handler=command_status)
+
+    changes = commands.add_parser("changes", help="Players that moved in the refreshes (change feed)")
+    changes.add_argument("--since", default=None, help="Only refreshes after this time (YYYY-MM-DD[THH:MM:SS])")
+    changes.add_argument("--source", choices=["market", "ratings"], default=None)
+    changes.set_defaults(handler=command_changes)
+
+    backfill = commands.add_parser("backfill", help="Rebuild archived snapshots without network requests")
+    backfill.add_argument("--start", help="First snapshot date (YYYY-MM-DD)")
+    backfill.add_argument("--end", help="Last snapshot date (YYYY-MM-DD)")
+    backfill.add_argument("--workers", type=int, default=None, help="Parallel processes (default: all cores)")
+    backfill.set_defaults(handler=command_backfill)
+
+    replay = commands.add_parser("replay", help="Serve recorded pages locally (with fault injection)")
+    replay.add_argument("--port", type=int, default=8765)
+    replay.add_argument("--latency", type=float, default=0.0, help="Seconds per response")
+    replay.add_argument("--jitter", type=float, default=0.0, help="Extra uniform latency in seconds")
+    replay.add_argument("--burst-every", type=int, default=0, help="Every n-th request starts a 429 burst")
+    replay.add_argument("--burst-length", type=int, default=1, help="429 answers per burst")
+    replay.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of a 429 in seconds")
+    replay.add_argument("--forbidden-rate", type=float, default=0.0, help="Probability of a 403")
+    replay.add_argument("--seed", type=int, default=0)
+    replay.set_defaults(handler=command_replay)
+
+    query = commands.add_parser("query", help="Show the features of a player")
+    query.add_argument("player", help="(Part of the) player name")
+    query.add_argument("--group", default=None, help="Position group, e.g. GK")
+    query.set_defaults(handler=command_query)
+
+    return parser
+
+# Function: Entry point
+def main(argv: list | None = None) -> None:
+    args = build_parser().parse_args(argv)
+    if args.trace_memory:
+        import os
+        os.environ["TRACE_MEMORY"] = "1"
+    # Make the data directory if not existing
+    DATA_PATH.mkdir(exist_ok=True)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
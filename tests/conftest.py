@@ -0,0 +1,11 @@
+### Shared test setup ###
+# Imports
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Data of the tests never touches the working tree (set before environment.variable is imported)
+os.environ.setdefault("DATA_PATH", tempfile.mkdtemp(prefix="fpv-tests-"))
+os.environ.setdefault("LOG_FORMAT", "text")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,51 @@
+### Page archive and backfill ###
+# Imports
+import subprocess
+from datetime import date, datetime
+from pathlib import Path
+
+# Local imports
+import backend.backfill as backfill
+from classes.page_archive import PageArchive
+
+URL = "https://fbref.com/en/comps/20/stats/Bundesliga-Stats"
+
+def test_pages_are_read_back_per_snapshot(tmp_path):
+    archive = PageArchive(path=tmp_path)
+    archive.put(URL, body="<table>old</table>", fetched=datetime(2025, 3, 1, 12))
+    archive.put(URL, body="<table>new</table>", fetched=datetime(2025, 3, 8, 12))
+    archive.put("https://www.transfermarkt.com/", body="clubs", status=200, fetched=datetime(2025, 3, 8, 13))
+    assert archive.get(URL) == "<table>new</table>"
+    assert archive.get(URL, at=date(2025, 3, 7)) == "<table>old</table>"
+    assert archive.get(URL, at=date(2025, 2, 28)) is None
+    assert archive.get("https://fbref.com/missing") is None
+    assert archive.snapshots() == [date(2025, 3, 1), date(2025, 3, 8)]
+    assert archive.snapshots(start=date(2025, 3, 2)) == [date(2025, 3, 8)]
+
+def test_pages_of_other_writers_are_picked_up(tmp_path):
+    reader = PageArchive(path=tmp_path)
+    assert reader.get(URL) is None
+    PageArchive(path=tmp_path).put(URL, body="ü" * 1000, fetched=datetime(2025, 3, 1))
+    assert reader.get(URL) == "ü" * 1000
+    assert [entry["status"] for entry in reader.entries(URL)] == [200]
+
+def test_rebuild_starts_from_an_empty_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(backfill, "BACKFILL_PATH", tmp_path / "backfill")
+    snapshot = date(2025, 3, 8)
+    target = backfill.snapshot_path(snapshot)
+    # Output of an earlier rebuild, fresh by its manifest
+    target.mkdir(parents=True)
+    Path(target, "Refresh_Manifest.json").write_text("{}")
+    runs = []
+
+    def run(command, env, **kwargs):
+        runs.append((sorted(path.name for path in target.iterdir()), env))
+        return subprocess.CompletedProcess(command, returncode=0)
+
+    monkeypatch.setattr(backfill.subprocess, "run", run)
+    assert backfill.rebuild_snapshot(snapshot, archive_path=tmp_path / "archive") == 0
+    (files, env), = runs
+    assert files == ["backfill.log"]
+    assert (env["SCRAPER_MODE"], env["ARCHIVE_DATE"]) == ("archive", "2025-03-08")
+    assert env["DATA_PATH"] == str(target.resolve())
+    assert env["ARCHIVE_PATH"] == str((tmp_path / "archive").resolve())
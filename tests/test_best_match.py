@@ -0,0 +1,44 @@
+### Fuzzy name matching ###
+# Imports
+import pandas as pd
+
+# Local imports
+import functions.utils as utils
+from functions.data_related import mapping_two_columns
+from functions.utils import get_best_match
+
+CLUBS = ("Bayern Munich", "Borussia Dortmund", "Bayer 04 Leverkusen")
+
+def test_best_match():
+    assert get_best_match("bayern münchen", CLUBS) == "Bayern Munich"
+    assert get_best_match("Dortmund", list(CLUBS)) == "Borussia Dortmund"
+    assert get_best_match("Real Madrid", CLUBS) is None
+
+def test_matches_are_cached_per_choice_set():
+    get_best_match("Player 7", tuple(f"Player {i}" for i in range(50)))
+    # Equal choices built anew (tuple or list) hit the same entry
+    choice_set = utils._choice_sets[tuple(f"Player {i}" for i in range(50))]
+    get_best_match("Player 7", [f"Player {i}" for i in range(50)])
+    get_best_match("Player 8", tuple(f"Player {i}" for i in range(50)))
+    assert utils._choice_sets[tuple(f"Player {i}" for i in range(50))] is choice_set
+    assert set(choice_set.matches) == {"Player 7", "Player 8"}
+
+def test_repeated_mappings_hit_the_cache(monkeypatch):
+    from rapidfuzz import process
+
+    utils._choice_sets.clear()
+    reference = pd.DataFrame({"Player": [f"Player {i}" for i in range(200)], "Position": ["CB"] * 200})
+    stats = lambda: pd.DataFrame({"Player": [f"player {i}" for i in range(200)]})
+    mapping_two_columns(stats(), reference, column="Player", target="Position")
+    # The second mapping builds new choices, all matches come from the cache
+    calls = []
+    monkeypatch.setattr(process, "extractOne", lambda *args, **kwargs: calls.append(args))
+    mapped = mapping_two_columns(stats(), reference, column="Player", target="Position")
+    assert len(utils._choice_sets) == 1
+    assert calls == []
+    assert mapped["Position"].eq("CB").all()
+
+def test_old_choice_sets_are_dropped():
+    for i in range(3 * utils.MATCH_CHOICE_SETS):
+        get_best_match("Player 1", tuple(f"Player {j}" for j in range(i, i + 5)))
+    assert len(utils._choice_sets) == utils.MATCH_CHOICE_SETS
@@ -0,0 +1,60 @@
+### Change feed ###
+# Imports
+import numpy as np
+import pandas as pd
+
+# Local imports
+from backend.changes import MARKET_FEED, RATING_FEED, detect_changes, moved
+
+def market(values: dict, clubs: dict | None = None) -> pd.DataFrame:
+    clubs = clubs or {}
+    return pd.DataFrame({
+        "Player_ID": list(values),
+        "Player": [f"Player {i}" for i in values],
+        "Club": [clubs.get(i, "Club A") for i in values],
+        "Market_Value_EUR": list(values.values()),
+    })
+
+def ratings(rows: list) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=["Player", "Born", "Squad", "League", "Pos_group", "Rating", "Stats_Hash"])
+
+def test_moved_needs_a_change_and_a_floor_from_zero():
+    old = pd.Series([0.0, 0.0, 1e6, 1e6, 5.0, np.nan])
+    new = pd.Series([0.0, 10_000.0, 1.05e6, 1.2e6, 5.0, 1.0])
+    assert moved(old, new, 0.1, relative=True, floor=25_000).tolist() == [False, False, False, True, False, True]
+    assert moved(old, new, 0.1, relative=True, floor=0.0)[:2].tolist() == [False, True]
+
+def test_first_refresh_is_the_baseline():
+    changes, snapshot = detect_changes(data=market({"1": 1e6}), snapshot=None, spec=MARKET_FEED)
+    assert changes.empty and len(snapshot) == 1
+
+def test_market_changes():
+    _, snapshot = detect_changes(data=market({"1": 1e6, "2": 2e6, "3": 0.0, "4": 5e6}), snapshot=None, spec=MARKET_FEED)
+    data = market({"1": 1.05e6, "2": 3e6, "3": 0.0, "5": 1e6}, clubs={"1": "Club B"})
+    changes, snapshot = detect_changes(data=data, snapshot=snapshot, spec=MARKET_FEED)
+    kinds = dict(zip(changes["Player_ID"], changes["Change"]))
+    assert kinds == {"1": "transfer", "2": "market_value", "4": "removed", "5": "new"}
+    # The value change of player 1 was below the threshold: the snapshot keeps the reported value
+    assert snapshot.set_index("Player_ID").loc["1", "Market_Value_EUR"] == 1e6
+
+    # Slow drifts are reported once they add up
+    data = market({"1": 1.1e6, "2": 3e6, "3": 0.0, "5": 1e6}, clubs={"1": "Club B"})
+    changes, _ = detect_changes(data=data, snapshot=snapshot, spec=MARKET_FEED)
+    assert changes[["Player_ID", "Change", "Old.Market_Value_EUR", "New.Market_Value_EUR"]].values.tolist() == [["1", "market_value", 1e6, 1.1e6]]
+
+def test_namesakes_are_told_apart_by_their_club():
+    rows = [("John Smith", 1995, "Club A", "L", "CB", 70, 1), ("John Smith", 1995, "Club B", "L", "ST", 80, 2)]
+    _, snapshot = detect_changes(data=ratings(rows), snapshot=None, spec=RATING_FEED)
+    # Another row order is no change
+    changes, _ = detect_changes(data=ratings(rows[::-1]), snapshot=snapshot, spec=RATING_FEED)
+    assert changes.empty
+
+def test_club_change_in_the_identity_is_a_transfer():
+    rows = [("Ann", 1999, "Club A", "L", "CB", 70, 1), ("Bob", 2000, "Club A", "L", "CB", 60, 2)]
+    _, snapshot = detect_changes(data=ratings(rows), snapshot=None, spec=RATING_FEED)
+    rows = [("Ann", 1999, "Club C", "L", "CB", 75, 1), ("Bob", 2000, "Club A", "L", "CB", 61, 2)]
+    changes, snapshot = detect_changes(data=ratings(rows), snapshot=snapshot, spec=RATING_FEED)
+    assert changes[["Player", "Change", "Old.Squad", "New.Squad", "Old.Rating", "New.Rating"]].values.tolist() == [
+        ["Ann", "transfer;rating", "Club A", "Club C", 70, 75],
+    ]
+    assert sorted(snapshot["Squad"]) == ["Club A", "Club C"]
@@ -0,0 +1,52 @@
+### Startup cost of the light CLI commands (python -X importtime) ###
+# Imports
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# Local imports
+from functions.utils import store_feature_matrix
+
+MAIN = Path(__file__).resolve().parents[1] / "main.py"
+STATUS_BUDGET_US = 150_000
+HEAVY = {"pandas", "numpy", "pyarrow", "pycountry", "rapidfuzz", "bs4", "lxml", "curl_cffi"}
+
+# Function: Run a command under -X importtime, returns {module: cumulative us} and the output
+def import_times(args: list, data_path: Path) -> tuple[dict, str]:
+    env = {**os.environ, "DATA_PATH": str(data_path)}
+    result = subprocess.run([sys.executable, "-X", "importtime", str(MAIN), *args], capture_output=True, text=True, env=env, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Only the top-level imports (nested ones are part of their cumulative time)
+        if name.startswith(" ") and not name.startswith("  "):
+            times[name.strip()] = int(cumulative)
+    return times, result.stdout
+
+# Function: Modules imported at any depth
+def imported(args: list, data_path: Path) -> set:
+    env = {**os.environ, "DATA_PATH": str(data_path)}
+    result = subprocess.run([sys.executable, "-X", "importtime", str(MAIN), *args], capture_output=True, text=True, env=env, check=True)
+    return {line.split("|")[2].strip().split(".")[0] for line in result.stderr.splitlines() if line.startswith("import time:") and "cumulative" not in line}
+
+def test_status_startup_budget(tmp_path):
+    # Best of three runs (a cold disk cache is not the budget)
+    totals = []
+    for _ in range(3):
+        times, _ = import_times(["status"], tmp_path)
+        totals.append(sum(times.values()))
+    assert min(totals) < STATUS_BUDGET_US, f"status imports take {min(totals) / 1000:.0f} ms"
+    assert not HEAVY & imported(["status"], tmp_path)
+
+def test_query_does_not_import_pandas(tmp_path):
+    data = pd.DataFrame({"Player": ["Alan Smith", "Bob"], "Born": [1990, 1991], "f": [1.0, 2.0]})
+    store_feature_matrix(data=data, name="ST", features=["f"], keys=["Player", "Born"], root=tmp_path / "matrix")
+    modules = imported(["query", "smith", "--group", "ST"], tmp_path)
+    assert "pandas" not in modules
+    _, output = import_times(["query", "smith", "--group", "ST"], tmp_path)
+    assert "Player=Alan Smith" in output and "Bob" not in output
@@ -0,0 +1,38 @@
+### Workbook export ###
+# Imports
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+# Local imports
+from functions.utils import _excel_rows, export_workbook
+
+def frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "Player": ["=HYPERLINK(\"http://x\")", "Bob", None],
+        "Goals": [1.0, np.nan, 3.0],
+        "Date": pd.to_datetime(["2026-01-01", None, "2026-01-03"]),
+    })
+
+def test_rows_are_converted_in_chunks():
+    data = frame()
+    rows = list(_excel_rows(data, chunk=2))
+    assert rows[0] == ["Player", "Goals", "Date"]
+    assert rows[1:] == list(_excel_rows(data, chunk=100))[1:]
+    assert rows[2] == ("Bob", None, None)
+
+@pytest.mark.parametrize("writer", ["xlsxwriter", "openpyxl"])
+def test_strings_are_not_written_as_formulas(monkeypatch, writer):
+    if writer == "openpyxl":
+        # The import of xlsxwriter fails: the openpyxl fallback writes the workbook
+        monkeypatch.setitem(sys.modules, "xlsxwriter", None)
+    path = export_workbook(sheets={"All": frame()}, name=f"Export_{writer}")
+    worksheet = load_workbook(path)["All"]
+    cell = worksheet["A2"]
+    assert (cell.value, cell.data_type) == ("=HYPERLINK(\"http://x\")", "s")
+    assert worksheet["B3"].value is None
+    assert worksheet["A4"].value is None
+    assert worksheet["B4"].value == 3
@@ -0,0 +1,60 @@
+### Tests of the feature matrix store ###
+# Imports
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Local imports
+from functions.utils import store_feature_matrix, load_feature_matrix, feature_matrix_exists
+
+def frame(rows: int, columns: int, value: float) -> pd.DataFrame:
+    data = pd.DataFrame(np.full((rows, columns), value), columns=[f"f{value:g}_{j}" for j in range(columns)])
+    data["Player"] = [f"P{value:g}_{i}" for i in range(rows)]
+    return data
+
+def store(data: pd.DataFrame, root) -> None:
+    store_feature_matrix(data=data, name="ST", features=[c for c in data.columns if c != "Player"], keys=["Player"], root=root)
+
+def test_round_trip(tmp_path):
+    assert not feature_matrix_exists(name="ST", root=tmp_path)
+    store(frame(5, 3, 1.0), tmp_path)
+    matrix, keys, columns = load_feature_matrix(name="ST", root=tmp_path)
+    assert matrix.dtype == np.float32 and matrix.flags["C_CONTIGUOUS"]
+    assert matrix.shape == (5, 3)
+    assert columns == ["f1_0", "f1_1", "f1_2"]
+    assert keys["Player"].tolist() == [f"P1_{i}" for i in range(5)]
+
+def test_reader_during_writes_sees_one_version(tmp_path):
+    store(frame(2, 2, 0.0), tmp_path)
+    stop, errors = threading.Event(), []
+
+    def write():
+        # Every write changes rows, columns and values together
+        for i in range(1, 60):
+            store(frame(2 + i % 7, 2 + i % 5, float(i)), tmp_path)
+        stop.set()
+
+    def read():
+        while not stop.is_set():
+            matrix, keys, columns = load_feature_matrix(name="ST", root=tmp_path)
+            value = float(matrix[0, 0])
+            if matrix.shape != (len(keys), len(columns)) or columns[0] != f"f{value:g}_0" or keys["Player"].iloc[0] != f"P{value:g}_0":
+                errors.append((matrix.shape, len(keys), columns[0], keys["Player"].iloc[0]))
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    # Only the last versions are kept
+    assert len([p for p in (tmp_path / "ST").iterdir()]) == 2
+
+def test_open_map_survives_new_writes(tmp_path):
+    store(frame(3, 2, 1.0), tmp_path)
+    matrix, _, _ = load_feature_matrix(name="ST", root=tmp_path)
+    for i in range(2, 6):
+        store(frame(3, 2, float(i)), tmp_path)
+    assert float(matrix[0, 0]) == 1.0
+    assert float(load_feature_matrix(name="ST", root=tmp_path)[0][0, 0]) == 5.0
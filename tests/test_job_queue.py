@@ -0,0 +1,105 @@
+### Durable crawl job queue ###
+# Imports
+import sqlite3
+import time
+
+import pytest
+
+# Local imports
+import backend.distributed as distributed
+import classes.job_queue as job_queue
+from classes.job_queue import JobQueue
+from classes.rate_control import CircuitOpenError, set_rate_controller
+
+HOST = "fbref.com"
+
+@pytest.fixture
+def queue(tmp_path) -> JobQueue:
+    queue = JobQueue(path=tmp_path / "queue.sqlite")
+    queue.enqueue(run_id="run", kind="fbref_table", payload={"league": "Bundesliga", "table": "stats_misc"}, host=HOST)
+    return queue
+
+def test_rollback_journal(queue):
+    db = sqlite3.connect(queue.path)
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    db.close()
+    assert not queue.path.with_name(queue.path.name + "-shm").exists()
+
+def test_lease_and_complete(queue):
+    job = queue.lease(worker="a", egress="e")
+    assert job["payload"] == {"league": "Bundesliga", "table": "stats_misc"} and job["attempts"] == 1
+    # Leased jobs are not handed out twice
+    assert queue.lease(worker="b", egress="e") is None
+    assert queue.complete(job_id=job["id"], worker="a")
+    assert queue.counts(run_id="run") == {"done": 1}
+
+def test_expired_lease_is_taken_over(queue):
+    job = queue.lease(worker="a", egress="e", lease_s=0.0)
+    time.sleep(0.01)
+    taken = queue.lease(worker="b", egress="e")
+    assert taken["id"] == job["id"] and taken["attempts"] == 2
+    # The first worker lost its lease: its result is dropped
+    assert not queue.complete(job_id=job["id"], worker="a")
+    assert not queue.fail(job_id=job["id"], worker="a", error="late")
+    assert queue.complete(job_id=job["id"], worker="b")
+
+def test_fail_until_max_attempts(queue):
+    for attempt in range(1, 3):
+        job = queue.lease(worker="a", egress="e")
+        queue.fail(job_id=job["id"], worker="a", error="boom", max_attempts=2)
+        assert queue.counts(run_id="run") == ({"pending": 1} if attempt < 2 else {"failed": 1})
+    assert queue.failed(run_id="run") == [{"kind": "fbref_table", "payload": '{"league": "Bundesliga", "table": "stats_misc"}', "error": "boom"}]
+
+def test_requeue_waits_and_keeps_the_attempts(queue):
+    job = queue.lease(worker="a", egress="e")
+    assert queue.requeue(job_id=job["id"], worker="a", not_before=time.time() + 0.2, error="paused")
+    assert queue.lease(worker="a", egress="e") is None
+    time.sleep(0.25)
+    assert queue.lease(worker="a", egress="e")["attempts"] == 1
+
+def test_worker_requeues_on_open_circuit(queue, monkeypatch):
+    until = time.time() + 3600
+
+    def run_job(queue, job):
+        raise CircuitOpenError(HOST, until)
+
+    monkeypatch.setattr(distributed, "JobQueue", lambda: queue)
+    monkeypatch.setattr(distributed, "run_job", run_job)
+    try:
+        assert distributed.run_worker(idle_exit=0.0, poll=0.0) == 0
+    finally:
+        set_rate_controller(None)
+    db = sqlite3.connect(queue.path)
+    state, attempts, not_before = db.execute("SELECT state, attempts, lease_until FROM jobs").fetchone()
+    db.close()
+    assert (state, attempts) == ("pending", 0)
+    assert not_before == pytest.approx(until)
+
+def test_network_filesystem_is_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "filesystem_type", lambda path: "nfs4")
+    with pytest.raises(RuntimeError, match="nfs4"):
+        JobQueue(path=tmp_path / "queue.sqlite")
+
+def test_crashing_job_fails_after_max_attempts(queue):
+    for _ in range(2):
+        assert queue.lease(worker="a", egress="e", lease_s=0.0, max_attempts=2) is not None
+        time.sleep(0.01)
+    # Both leases expired without a result: the job is not handed out a third time
+    assert queue.lease(worker="b", egress="e", max_attempts=2) is None
+    assert queue.counts(run_id="run") == {"failed": 1}
+    assert "Lease expired after 2 attempts" in queue.failed(run_id="run")[0]["error"]
+
+def test_run_without_leagues_merges_no_leagues(queue, monkeypatch):
+    merged = []
+    monkeypatch.setattr(distributed, "JobQueue", lambda: queue)
+    monkeypatch.setattr(distributed, "enqueue_crawl", lambda **kwargs: 0)
+    monkeypatch.setattr(distributed, "wait_for_run", lambda **kwargs: {})
+    monkeypatch.setattr(distributed.combine_data, "fbref_refresh", lambda **kwargs: {})
+    monkeypatch.setattr(distributed.combine_data, "market_values_data", lambda clubs: merged.append("market"))
+    monkeypatch.setattr(distributed.combine_data, "player_stats_data", lambda refresh: merged.append("leagues"))
+    monkeypatch.setattr(distributed.combine_data, "export_stats_workbook", lambda: merged.append("export"))
+    distributed.distributed_crawl(clubs=["Club B"])
+    assert merged == ["market", "export"]
+    # Nothing stored at all: an empty frame, no concat error
+    monkeypatch.setattr(distributed.combine_data, "load_partition", lambda name, partition: None)
+    assert distributed.combine_data.combine_leagues().empty
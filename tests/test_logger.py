@@ -0,0 +1,83 @@
+### Structured logging ###
+# Imports
+import json
+import logging
+import sys
+from unittest import mock
+
+import pytest
+
+# Local imports
+import functions.logger as logger_module
+from functions.logger import JsonFormatter, RateLimitFilter, TracebackQueueHandler, get_logger, shutdown_logging
+
+# Function: Record of a logger call
+def make_record(msg: str = "Fetched %s", args: tuple = ("page",), **extra) -> logging.LogRecord:
+    record = logging.LogRecord("scraper", logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+@pytest.fixture
+def json_lines(monkeypatch, capsys):
+    """Logs of the test as parsed JSON lines, written through a fresh listener."""
+    monkeypatch.setattr(logger_module, "LOG_FORMAT", "json")
+    shutdown_logging()
+
+    def read() -> list:
+        shutdown_logging()
+        return [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+
+    yield read
+    shutdown_logging()
+
+def test_structured_fields():
+    entry = json.loads(JsonFormatter().format(make_record(stage="fetch", url="https://fbref.com/", duration=1.25)))
+    assert entry["message"] == "Fetched page"
+    assert (entry["level"], entry["logger"]) == ("INFO", "scraper")
+    assert (entry["stage"], entry["url"], entry["duration"]) == ("fetch", "https://fbref.com/", 1.25)
+    assert "exception" not in entry
+
+def test_rate_limit_counts_suppressed_records():
+    limit = RateLimitFilter()
+    records = [make_record(rate_limit=10) for _ in range(4)]
+    with mock.patch("functions.logger.time.monotonic", side_effect=[0.0, 1.0, 2.0, 11.0]):
+        passed = [limit.filter(record) for record in records]
+    # Two records within 10s are dropped, the next one carries their count
+    assert passed == [True, False, False, True]
+    assert not hasattr(records[0], "suppressed")
+    assert records[3].suppressed == 2
+    # Other templates are limited on their own
+    assert limit.filter(make_record(msg="Parsed %s", rate_limit=10))
+
+def test_sampling():
+    limit = RateLimitFilter()
+    with mock.patch("functions.logger.random.random", side_effect=[0.05, 0.5]):
+        assert limit.filter(make_record(sample=0.1))
+        assert not limit.filter(make_record(sample=0.1))
+
+def test_traceback_is_kept_apart_from_the_message(json_lines):
+    log = get_logger("tests.logger.exception")
+    try:
+        raise ValueError("bad table")
+    except ValueError:
+        log.exception("Job %s failed", 7, extra={"stage": "queue"})
+    (entry,) = json_lines()
+    assert entry["message"] == "Job 7 failed"
+    assert entry["stage"] == "queue"
+    assert "ValueError: bad table" in entry["exception"]
+
+def test_logging_restarts_after_shutdown(json_lines):
+    get_logger("tests.logger.restart").info("before")
+    assert [entry["message"] for entry in json_lines()] == ["before"]
+    # shutdown_logging ran in json_lines, the next logger starts a new listener
+    get_logger("tests.logger.restart").warning("after", extra={"rate_limit": 60})
+    assert [entry["message"] for entry in json_lines()] == ["after"]
+
+def test_prepared_record_has_no_traceback_objects():
+    try:
+        raise KeyError("x")
+    except KeyError:
+        record = logging.LogRecord("scraper", logging.ERROR, __file__, 1, "Failed %s", ("job",), sys.exc_info())
+    prepared = TracebackQueueHandler(None).prepare(record)
+    assert (prepared.msg, prepared.args, prepared.exc_info) == ("Failed job", None, None)
+    assert "KeyError" in prepared.exc_text
@@ -0,0 +1,59 @@
+### Streaming fetch -> parse pipeline ###
+# Imports
+import threading
+import time
+
+import pytest
+
+# Local imports
+from classes.rate_control import pause
+from functions.pipeline import stream_pipeline
+
+def test_results_in_input_order():
+    # Later items parse faster: the order still follows the input
+    def parse(item, payload):
+        time.sleep(0.01 * (5 - item))
+        return payload * 10
+
+    results = list(stream_pipeline(items=range(5), fetch=lambda item: item, parse=parse, workers=3))
+    assert results == [(item, item * 10) for item in range(5)]
+
+def test_parsed_page_does_not_wait_for_the_next_fetch():
+    def fetch(item):
+        if item == 1:
+            pause(2.0)
+        return item
+
+    started = time.perf_counter()
+    pages = stream_pipeline(items=range(2), fetch=fetch, parse=lambda item, payload: payload)
+    assert next(pages) == (0, 0)
+    assert time.perf_counter() - started < 1.0
+    pages.close()
+
+def test_close_interrupts_a_throttle_wait():
+    waiting = threading.Event()
+
+    def fetch(item):
+        if item == 1:
+            waiting.set()
+            pause(30.0)
+        return item
+
+    pages = stream_pipeline(items=range(3), fetch=fetch, parse=lambda item, payload: payload)
+    assert next(pages) == (0, 0)
+    waiting.wait(timeout=5.0)
+    started = time.perf_counter()
+    pages.close()
+    assert time.perf_counter() - started < 1.0
+    assert not any(thread.name == "fetch-stage" for thread in threading.enumerate())
+
+def test_errors_reach_the_caller():
+    def fetch(item):
+        if item == 2:
+            raise ConnectionError("offline")
+        return item
+
+    with pytest.raises(ConnectionError):
+        list(stream_pipeline(items=range(4), fetch=fetch, parse=lambda item, payload: payload))
+    with pytest.raises(ZeroDivisionError):
+        list(stream_pipeline(items=range(4), fetch=lambda item: item, parse=lambda item, payload: 1 / payload))
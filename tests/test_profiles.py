@@ -0,0 +1,127 @@
+### Player profile enrichment ###
+# Imports
+import json
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+# Local imports
+import backend.profiles as profiles
+import functions.utils as utils
+from backend.data_scraping.transfermarkt import parse_profile, parse_value_history
+from functions.utils import load_partition, store_partition
+
+PROFILE_HTML = """
+<div class="info-table">
+  <span class="info-table__content info-table__content--regular">Height:</span>
+  <span class="info-table__content info-table__content--bold">1,86&nbsp;m</span>
+  <span class="info-table__content info-table__content--regular">Foot:</span>
+  <span class="info-table__content info-table__content--bold">right</span>
+  <span class="info-table__content info-table__content--regular">Player agent:</span>
+  <span class="info-table__content info-table__content--bold"><a href="/agent">Stellar Group</a></span>
+  <span class="info-table__content info-table__content--regular">Joined:</span>
+  <span class="info-table__content info-table__content--bold">Jul 1, 2022</span>
+  <span class="info-table__content info-table__content--regular">Contract expires:</span>
+  <span class="info-table__content info-table__content--bold">-</span>
+  <span class="info-table__content info-table__content--regular">Citizenship:</span>
+  <span class="info-table__content info-table__content--bold">Germany</span>
+</div>
+"""
+
+HISTORY_JSON = json.dumps({"list": [
+    {"x": 1656633600000, "y": 25_000_000, "verein": "Bayern Munich"},
+    {"x": 1688169600000, "y": 40_000_000, "verein": "Bayern Munich"},
+]})
+
+@pytest.fixture
+def data_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "DATA_PATH", tmp_path)
+    monkeypatch.setattr(profiles, "DATA_PATH", tmp_path)
+    return tmp_path
+
+# Function: Names of the partitions the profile module writes
+def count_writes(monkeypatch) -> list:
+    writes = []
+
+    def store(**kwargs):
+        writes.append(kwargs["name"])
+        store_partition(**kwargs)
+
+    monkeypatch.setattr(profiles, "store_partition", store)
+    return writes
+
+def test_parse_profile():
+    profile = parse_profile(PROFILE_HTML)
+    assert profile["Height_m"] == 1.86
+    assert (profile["Foot"], profile["Agent"]) == ("right", "Stellar Group")
+    assert profile["Joined"] == pd.Timestamp(2022, 7, 1)
+    # "-" is no value, unknown labels are ignored
+    assert pd.isna(profile["Contract_Expires"])
+    assert "Citizenship" not in profile
+
+def test_parse_value_history():
+    history = parse_value_history(HISTORY_JSON, player_id="42")
+    assert history["Player_ID"].tolist() == ["42", "42"]
+    assert history["Date"].tolist() == [pd.Timestamp(2022, 7, 1), pd.Timestamp(2023, 7, 1)]
+    assert history["Value_EUR"].tolist() == [25_000_000, 40_000_000]
+    assert parse_value_history(json.dumps({"list": None}), player_id="42").empty
+
+def test_profiles_to_refresh():
+    players = pd.DataFrame({
+        "Player_ID": ["1", "2", "3", "4", "5"],
+        "Market_Value_EUR": [10.0, 20.0, 30.0, None, 50.0],
+        "Club": ["A", "B", "C", "D", "E"],
+    })
+    fresh, old = pd.Timestamp.now().floor("s"), pd.Timestamp(datetime.now() - timedelta(days=60))
+    stored = pd.DataFrame({
+        "Player_ID": ["1", "2", "3", "4"],
+        "List_Value_EUR": [10.0, 25.0, 30.0, None],
+        "List_Club": ["A", "B", "X", "D"],
+        "Fetched": [fresh, fresh, fresh, old],
+    })
+    # 1 unchanged, 2 value changed, 3 club changed, 4 too old, 5 never fetched
+    assert profiles.profiles_to_refresh(players, stored, max_age=30)["Player_ID"].tolist() == ["2", "3", "4", "5"]
+    assert len(profiles.profiles_to_refresh(players, None)) == 5
+
+def test_chunks_are_merged_in_one_write(data_path, monkeypatch):
+    store_partition(data=pd.DataFrame({"Player_ID": ["1"], "Foot": ["left"]}), name="transfermarkt/profiles", partition="All")
+    writes = count_writes(monkeypatch)
+    profiles.store_chunk(pd.DataFrame({"Player_ID": ["1", "2"], "Foot": ["right", "left"]}), name="transfermarkt/profiles")
+    profiles.store_chunk(pd.DataFrame({"Player_ID": ["2", "3"], "Foot": ["both", "right"]}), name="transfermarkt/profiles")
+    merged = profiles.merge_chunks(name="transfermarkt/profiles").sort_values("Player_ID")
+    assert writes == ["transfermarkt/profiles"]
+    # Latest chunk wins per player
+    assert merged["Foot"].tolist() == ["right", "both", "right"]
+    assert list(profiles.chunk_folder("transfermarkt/profiles").iterdir()) == []
+
+def test_history_keeps_all_rows_of_the_latest_chunk(data_path):
+    profiles.store_chunk(parse_value_history(HISTORY_JSON, player_id="1"), name="transfermarkt/value_history")
+    profiles.store_chunk(parse_value_history(HISTORY_JSON, player_id="2"), name="transfermarkt/value_history")
+    profiles.store_chunk(parse_value_history(json.dumps({"list": [{"x": 0, "y": 1, "verein": "A"}]}), player_id="1"), name="transfermarkt/value_history")
+    history = profiles.merge_chunks(name="transfermarkt/value_history")
+    assert history.groupby("Player_ID").size().to_dict() == {"1": 1, "2": 2}
+
+def test_enrich_profiles_writes_each_partition_once(data_path, monkeypatch):
+    players = pd.DataFrame({
+        "Player_ID": [str(i) for i in range(7)],
+        "TM_URL": [f"https://www.transfermarkt.com/profil/spieler/{i}" for i in range(7)],
+        "Market_Value_EUR": [1_000_000.0] * 7,
+        "Club": ["A"] * 7,
+    })
+    store_partition(data=players, name="transfermarkt", partition="All")
+
+    def fetch_profile(player: dict) -> tuple:
+        profile = {"Player_ID": player["Player_ID"], **parse_profile(PROFILE_HTML), "List_Value_EUR": player["Market_Value_EUR"], "List_Club": player["Club"], "Fetched": pd.Timestamp.now().floor("s")}
+        return profile, parse_value_history(HISTORY_JSON, player_id=player["Player_ID"])
+
+    monkeypatch.setattr(profiles, "fetch_profile", fetch_profile)
+    monkeypatch.setattr(profiles, "PROFILE_FLUSH", 3)
+    writes = count_writes(monkeypatch)
+    stored = profiles.enrich_profiles(workers=2)
+    assert sorted(writes) == ["transfermarkt/profiles", "transfermarkt/value_history"]
+    assert sorted(stored["Player_ID"]) == [str(i) for i in range(7)]
+    assert len(load_partition(name="transfermarkt/value_history", partition="All")) == 14
+    # Nothing changed since: no fetch on the next run
+    monkeypatch.setattr(profiles, "fetch_profile", lambda player: pytest.fail("unchanged profile fetched"))
+    profiles.enrich_profiles(workers=2)
@@ -0,0 +1,108 @@
+### Adaptive rate controller ###
+# Imports
+import json
+import threading
+import time
+
+import pytest
+
+# Local imports
+from classes.rate_control import CircuitOpenError, RateController, parse_retry_after
+
+HOST = "fbref.com"
+
+def controller(tmp_path=None, **kwargs) -> RateController:
+    settings = {"initial_delay": 1.0, "min_delay": 0.5, "max_delay": 8.0, "increase": 0.5, "backoff": 2.0, "jitter": 0.0, "breaker_limit": 2, "breaker_pause": 60.0}
+    return RateController(path=tmp_path / "rates.json" if tmp_path else None, **{**settings, **kwargs})
+
+def test_slots_are_spaced_by_the_delay():
+    rates = controller()
+    waits = [rates.reserve(HOST) for _ in range(3)]
+    assert waits[0] == pytest.approx(0.0, abs=0.01)
+    assert waits[1] == pytest.approx(1.0, abs=0.01)
+    assert waits[2] == pytest.approx(2.0, abs=0.01)
+    # Hosts are throttled independently
+    assert rates.reserve("www.transfermarkt.com") == pytest.approx(0.0, abs=0.01)
+
+def test_additive_increase_down_to_the_minimum():
+    rates = controller()
+    rates.on_success(HOST)
+    # 1 request/s + 0.5 -> delay 1 / 1.5
+    assert rates.hosts[HOST]["delay"] == pytest.approx(1 / 1.5)
+    for _ in range(10):
+        rates.on_success(HOST)
+    assert rates.hosts[HOST]["delay"] == pytest.approx(0.5)
+
+def test_throttle_backs_off_and_honors_retry_after():
+    rates = controller()
+    assert rates.on_throttle(HOST, retry_after=5.0) == 5.0
+    assert rates.hosts[HOST]["delay"] == pytest.approx(2.0)
+    assert rates.reserve(HOST) == pytest.approx(5.0, abs=0.05)
+    # Without Retry-After the new delay is the wait, capped at max_delay
+    for _ in range(5):
+        rates.on_throttle(HOST)
+    assert rates.hosts[HOST]["delay"] == pytest.approx(8.0)
+
+def test_repeated_forbidden_opens_the_breaker():
+    rates = controller()
+    rates.on_forbidden(HOST)
+    rates.on_success(HOST)
+    # A success in between resets the count
+    rates.on_forbidden(HOST)
+    with pytest.raises(CircuitOpenError) as opened:
+        rates.on_forbidden(HOST)
+    assert opened.value.until == pytest.approx(time.time() + 60.0, abs=1.0)
+    with pytest.raises(CircuitOpenError):
+        rates.reserve(HOST)
+
+def test_state_is_persisted(tmp_path):
+    rates = controller(tmp_path)
+    rates.on_throttle(HOST)
+    with pytest.raises(CircuitOpenError):
+        for _ in range(2):
+            rates.on_forbidden(HOST)
+    stored = json.loads((tmp_path / "rates.json").read_text())
+    assert stored[HOST]["open_until"] > time.time()
+    restored = controller(tmp_path)
+    assert restored.hosts[HOST]["delay"] == pytest.approx(stored[HOST]["delay"])
+    with pytest.raises(CircuitOpenError):
+        restored.reserve(HOST)
+
+def test_concurrent_updates_write_the_state_safely(tmp_path):
+    rates = controller(tmp_path, save_interval=0.0)
+    errors = []
+
+    def succeed():
+        try:
+            for _ in range(200):
+                rates.on_success(HOST)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=succeed) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert json.loads((tmp_path / "rates.json").read_text())[HOST]["delay"] == 0.5
+    assert list(tmp_path.glob("*.tmp")) == []
+
+def test_state_is_saved_on_a_schedule(tmp_path):
+    rates = controller(tmp_path, save_interval=3600.0)
+    path = tmp_path / "rates.json"
+    rates.on_success(HOST)
+    first = json.loads(path.read_text())[HOST]["delay"]
+    # Within the interval the changes stay in memory until the flush
+    rates.on_success(HOST)
+    assert json.loads(path.read_text())[HOST]["delay"] == first
+    rates.flush()
+    assert json.loads(path.read_text())[HOST]["delay"] == pytest.approx(rates.hosts[HOST]["delay"], abs=0.001)
+    assert json.loads(path.read_text())[HOST]["delay"] < first
+
+def test_parse_retry_after():
+    assert parse_retry_after("12") == 12.0
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
@@ -0,0 +1,58 @@
+### Tests of the rating engine ###
+# Imports
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local imports
+from backend.metric_analyzation.rating import compile_schema, category_scores, rate_group, rate_players
+
+SCHEMA = {
+    "ST": {
+        "finishing": ["goals", "shots"],
+        "discipline": ["fouls"],
+    },
+}
+
+def test_compile_schema_weights():
+    matrix = compile_schema(schema=SCHEMA, lower_is_better=["fouls"])["ST"]
+    assert matrix.features == ["goals", "shots", "fouls"]
+    assert matrix.categories == ["finishing", "discipline"]
+    np.testing.assert_allclose(matrix.weights, [[0.5, 0.0], [0.5, 0.0], [0.0, -1.0]])
+
+def test_compile_schema_shared_feature_listed_once():
+    schema = {"CM": {"a": ["x", "y"], "b": ["y"]}}
+    matrix = compile_schema(schema=schema, lower_is_better=[])["CM"]
+    assert matrix.features == ["x", "y"]
+    np.testing.assert_allclose(matrix.weights, [[0.5, 0.0], [0.5, 1.0]])
+
+def test_category_scores_skip_missing_features():
+    matrix = compile_schema(schema=SCHEMA, lower_is_better=[])["ST"]
+    values = np.array([[1.0, 3.0, 2.0], [np.nan, 3.0, np.nan]])
+    scores = category_scores(values=values, matrix=matrix)
+    # A missing feature is left out of the mean, a category without features is NaN
+    np.testing.assert_allclose(scores[0], [2.0, 2.0])
+    assert scores[1, 0] == pytest.approx(3.0)
+    assert np.isnan(scores[1, 1])
+
+def test_rate_group_matches_pandas_reference():
+    matrix = compile_schema(schema=SCHEMA, lower_is_better=["fouls"])["ST"]
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.normal(size=(50, 3)), columns=["Pos_group.goals", "Pos_group.shots", "Pos_group.fouls"])
+    data["Player"] = [f"P{i}" for i in range(50)]
+    data["Pos_group"] = "ST"
+    rated = rate_group(data=data, matrix=matrix)
+
+    finishing = data[["Pos_group.goals", "Pos_group.shots"]].mean(axis=1)
+    discipline = -data["Pos_group.fouls"]
+    overall = (finishing + discipline) / 2
+    np.testing.assert_allclose(rated["Score.finishing"], finishing)
+    np.testing.assert_allclose(rated["Score.Overall"], overall)
+    np.testing.assert_allclose(rated["Percentile.Overall"], overall.rank(pct=True))
+    assert rated["Rating"].between(40, 99).all()
+    assert rated.loc[overall.idxmax(), "Rating"] == 99
+
+def test_rate_players_only_schema_groups():
+    data = pd.DataFrame({"Pos_group": ["ST", "GK"], "Pos_group.goals": [1.0, 2.0]})
+    rated = rate_players(data=data, schema=SCHEMA)
+    assert rated["Pos_group"].tolist() == ["ST"]
@@ -0,0 +1,52 @@
+### Scraper against the replay stand-in server ###
+# Imports
+import time
+
+import pytest
+
+# Local imports
+from classes.rate_control import CircuitOpenError, RateController
+from classes.replay_server import FaultProfile, ReplayServer, record_response
+from classes.scraping import Scraper
+
+URL = "https://fbref.com/en/comps/20/stats/Bundesliga-Stats"
+
+@pytest.fixture
+def recordings(tmp_path):
+    record_response(url=URL, status=200, headers={"Content-Type": "text/html", "Content-Length": "1"}, body="<table>stats</table>", path=tmp_path)
+    return tmp_path
+
+def replay_scraper(server: ReplayServer, monkeypatch, **kwargs) -> Scraper:
+    monkeypatch.setenv("REPLAY_HOST", server.host)
+    monkeypatch.setenv("REPLAY_PORT", str(server.port))
+    rates = RateController(path=None, initial_delay=0.0, min_delay=0.0, jitter=0.0, backoff=1.0, breaker_limit=2)
+    return Scraper(mode="replay", rates=rates, base_backoff_s=0.0, **kwargs)
+
+def test_bursts_are_retried_after_retry_after(recordings, monkeypatch):
+    # Requests 1-3 pass, request 4 starts a burst of two 429s
+    faults = FaultProfile(latency_s=0.02, burst_every=4, burst_length=2, retry_after_s=0.3)
+    with ReplayServer(path=recordings, port=0, faults=faults) as server:
+        scraper = replay_scraper(server, monkeypatch)
+        for _ in range(3):
+            assert scraper.fetch_html(URL) == "<table>stats</table>"
+        started = time.monotonic()
+        assert scraper.fetch_html(URL) == "<table>stats</table>"
+        elapsed = time.monotonic() - started
+    assert server.stats == {200: 4, 429: 2}
+    # Both retries waited for Retry-After
+    assert elapsed >= 2 * 0.3
+    assert scraper.rates.hosts["fbref.com"]["delay"] > 0.0
+
+def test_forbidden_trips_the_breaker(recordings, monkeypatch):
+    with ReplayServer(path=recordings, port=0, faults=FaultProfile(forbidden_rate=1.0)) as server:
+        scraper = replay_scraper(server, monkeypatch)
+        with pytest.raises(CircuitOpenError):
+            scraper.fetch_html(URL)
+    assert server.stats == {403: 2}
+
+def test_unrecorded_page_is_not_found(recordings, monkeypatch):
+    with ReplayServer(path=recordings, port=0) as server:
+        scraper = replay_scraper(server, monkeypatch, max_tries_429=2)
+        with pytest.raises(Exception, match="404"):
+            scraper.fetch_html("https://fbref.com/missing")
+    assert server.stats == {404: 2}
@@ -0,0 +1,98 @@
+### Retry loop of the scrapers ###
+# Imports
+import asyncio
+
+import pytest
+
+# Local imports
+import classes.scraping as scraping
+from classes.rate_control import RateController
+from classes.replay_server import load_recording, record_response
+from classes.scraping import Scraper
+from classes.async_scraping import AsyncScraper
+
+URL = "https://fbref.com/en/comps/20/stats/Bundesliga-Stats"
+
+# Class: Response of the fake session
+class FakeResponse:
+
+    def __init__(self, status: int, text: str = "") -> None:
+        self.status_code = status
+        self.text = text
+        self.headers = {"Retry-After": "0"} if status == 429 else {}
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+# Class: Session answering with a fixed sequence of responses
+class FakeSession:
+
+    def __init__(self, responses: list) -> None:
+        self.responses = list(responses)
+
+    def get(self, url, **kwargs):
+        return self.responses.pop(0)
+
+# Class: Async session answering with a fixed sequence of responses
+class FakeAsyncSession(FakeSession):
+
+    async def get(self, url, **kwargs):
+        return self.responses.pop(0)
+
+    async def close(self) -> None:
+        pass
+
+def rates() -> RateController:
+    return RateController(path=None, initial_delay=0.0, min_delay=0.0, jitter=0.0, backoff=1.0, breaker_limit=10)
+
+def scraper(monkeypatch, responses: list) -> Scraper:
+    session = FakeSession(responses)
+    monkeypatch.setattr(scraping, "_session", lambda: session)
+    return Scraper(mode="record", rates=rates(), max_tries_429=3, base_backoff_s=0.0)
+
+def fetch_async(responses: list) -> str:
+    client = AsyncScraper(mode="record", rates=rates(), max_tries_429=3, base_backoff_s=0.0)
+    client._session = FakeAsyncSession(responses)
+    return asyncio.run(client.fetch_html(URL))
+
+def test_throttled_retries_keep_the_recording(monkeypatch):
+    record_response(url=URL, status=200, headers={}, body="good")
+    with pytest.raises(RuntimeError):
+        scraper(monkeypatch, [FakeResponse(429), FakeResponse(403), FakeResponse(429)]).fetch_html(URL)
+    assert load_recording(URL)["body"] == "good"
+
+def test_returned_response_is_recorded(monkeypatch):
+    html = scraper(monkeypatch, [FakeResponse(429), FakeResponse(200, "fresh")]).fetch_html(URL)
+    recording = load_recording(URL)
+    assert html == "fresh"
+    assert (recording["status"], recording["body"]) == (200, "fresh")
+
+def test_async_throttled_retries_keep_the_recording():
+    record_response(url=URL, status=200, headers={}, body="good")
+    with pytest.raises(RuntimeError):
+        fetch_async([FakeResponse(429), FakeResponse(403), FakeResponse(429)])
+    assert load_recording(URL)["body"] == "good"
+
+def test_async_returned_response_is_recorded():
+    html = fetch_async([FakeResponse(429), FakeResponse(200, "fresh")])
+    recording = load_recording(URL)
+    assert html == "fresh"
+    assert (recording["status"], recording["body"]) == (200, "fresh")
+
+def test_default_client_is_closed_with_its_loop(monkeypatch):
+    from backend.data_scraping import async_api
+
+    closed = []
+
+    async def close(self) -> None:
+        closed.append(self)
+
+    monkeypatch.setattr(AsyncScraper, "close", close)
+
+    async def main():
+        client = async_api.default_client()
+        await asyncio.sleep(0)
+        return client
+
+    assert closed == [asyncio.run(main())]
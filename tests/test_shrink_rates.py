@@ -0,0 +1,64 @@
+### Per-90 normalization and empirical-Bayes shrinkage ###
+# Imports
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local imports
+from functions.data_related import is_count_feature, normalize_data, playing_time_cutoff, shrink_rates
+from environment.variable import PLAYING_TIME_CUTOFF, SHRUNK_PLAYING_TIME_CUTOFF
+
+def test_count_features():
+    assert is_count_feature("stats_defense__Tackles.Tkl")
+    for feature in ["Playing_Time.90s", "stats_playing_time__Playing_Time.Min", "Per_90_Minutes.Gls", "stats_passing__Total.Cmp%", "stats_keeper_adv__Passes.AvgLen"]:
+        assert not is_count_feature(feature)
+
+def test_cutoff_follows_the_shrinkage():
+    assert playing_time_cutoff(shrink=False) == PLAYING_TIME_CUTOFF
+    assert playing_time_cutoff(shrink=True) == SHRUNK_PLAYING_TIME_CUTOFF < PLAYING_TIME_CUTOFF
+
+def test_normalize_divides_only_counts():
+    data = pd.DataFrame({"Playing_Time.90s": [2.0, 10.0], "Tkl": [4.0, 30.0], "Cmp%": [80.0, 70.0], "League": "L", "Pos_group": "CB"})
+    normalized = normalize_data(data=data.copy(), features=["Tkl", "Cmp%", "Playing_Time.90s"], shrink=False)
+    assert normalized["Tkl"].tolist() == [2.0, 3.0]
+    assert normalized["Cmp%"].tolist() == [80.0, 70.0]
+    assert normalized["Playing_Time.90s"].tolist() == [2.0, 10.0]
+
+def test_low_minutes_are_pulled_harder():
+    played = np.array([1.0, 30.0, 15.0, 15.0, 0.0])
+    counts = np.array([[5.0], [60.0], [20.0], [40.0], [3.0]])
+    with np.errstate(divide="ignore"):
+        rates = counts[:, 0] / played
+    shrunk = shrink_rates(counts=counts, played=played, codes=np.zeros(5, dtype=int))[:, 0]
+    prior = counts[:4, 0].sum() / played[:4].sum()
+    # Toward the pooled rate, the 1 x 90s player much more than the 30 x 90s one
+    pull = np.abs(shrunk[:2] - rates[:2]) / np.abs(prior - rates[:2])
+    assert pull[0] > 0.5 > pull[1]
+    assert np.all(np.abs(shrunk[:4] - prior) <= np.abs(rates[:4] - prior))
+    # No minutes: the plain rate is kept
+    assert np.isinf(shrunk[4])
+
+def test_groups_are_shrunk_separately():
+    played = np.full(4, 10.0)
+    counts = np.array([[10.0], [30.0], [100.0], [300.0]])
+    shrunk = shrink_rates(counts=counts, played=played, codes=np.array([0, 0, 1, 1]))[:, 0]
+    assert shrunk[:2].mean() == pytest.approx(2.0)
+    assert shrunk[2:].mean() == pytest.approx(20.0)
+
+def test_shrinkage_halves_the_squared_error_of_low_minutes():
+    rng = np.random.default_rng(7)
+    n = 4000
+    true_rates = rng.gamma(shape=4.0, scale=0.5, size=(n, 3))
+    played = rng.uniform(0.5, 35.0, n)
+    counts = rng.poisson(true_rates * played[:, None]).astype(float)
+    codes = rng.integers(0, 4, n)
+    rates = counts / played[:, None]
+    shrunk = shrink_rates(counts=counts, played=played, codes=codes)
+    low = played < 5
+    # Mean squared error against the true rates of the players under 5 x 90s
+    error_raw = np.mean((rates[low] - true_rates[low]) ** 2)
+    error_shrunk = np.mean((shrunk[low] - true_rates[low]) ** 2)
+    assert error_shrunk <= 0.5 * error_raw
+    # High-minute players barely move
+    high = played > 30
+    assert np.mean((shrunk[high] - rates[high]) ** 2) < 0.1 * np.mean((rates[high] - true_rates[high]) ** 2)
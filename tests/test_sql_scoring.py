@@ -0,0 +1,103 @@
+### SQL scoring engine vs the pandas scoring ###
+# Imports
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local imports
+from backend.metric_analyzation.rating import rate_players
+from functions.data_related import age_band, normalize_data, standardize_data
+from environment.variable import FEATURES_SCHEMA, NON_FEATURES, NON_COUNT_TOTALS, SHRINK_PRIOR
+
+duckdb = pytest.importorskip("duckdb")
+from backend.metric_analyzation.sql_scoring import normalize_sql, sql_scoring  # noqa: E402
+
+GROUPS = ["CB", "ST"]
+
+def raw_stats(n: int = 120, seed: int = 0, date: str = "2026-09-01") -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    features = list(dict.fromkeys(f for group in GROUPS for v in FEATURES_SCHEMA[group].values() for f in v))
+    data = pd.DataFrame(rng.poisson(20, (n, len(features))).astype(float), columns=features)
+    # Some features are missing for some players
+    data = data.mask(rng.random(data.shape) < 0.05)
+    meta = pd.DataFrame({
+        "Player": [f"Player {i} ({date[:4]})" for i in range(n)],
+        "Born": rng.integers(1990, 2006, n),
+        "Nation": "GER",
+        "Date": date,
+        "Table": "stats_standard",
+        "Matches": "Matches",
+        "Squad": rng.choice(["Club A", "Club B", "Club C"], n),
+        "Pos": "DF",
+        "Age": [f"{age}-100" for age in rng.integers(17, 36, n)],
+        "Pos_group": rng.choice(GROUPS, n),
+        "League": rng.choice(["Bundesliga", "La_Liga"], n),
+    })
+    return pd.concat([meta, data], axis=1).assign(**{"Playing_Time.90s": rng.uniform(2, 34, n).round(1)})
+
+# Function: Standardized features and ratings as prepare_scoring computes them
+def pandas_scoring(stats: pd.DataFrame, shrink: bool = False) -> tuple[dict, pd.DataFrame]:
+    schema = {group: FEATURES_SCHEMA[group] for group in GROUPS}
+    features = [c for c in stats.columns if c not in NON_FEATURES]
+    stats = normalize_data(data=stats.copy(), features=features, shrink=shrink)
+    keys = {"League": stats["League"], "Age": age_band(stats["Age"]), "Pos_group": stats["Pos_group"]}
+    sheets = {}
+    for group, categories in schema.items():
+        mask = stats["Pos_group"] == group
+        group_features = list(dict.fromkeys(f for v in categories.values() for f in v))
+        parts = [stats[mask][NON_FEATURES]] + [
+            standardize_data(data=stats[mask], columns_interest=group_features, column=column, groups=key[mask])
+            for column, key in keys.items()
+        ]
+        sheets[group] = pd.concat(parts, axis=1).reset_index(drop=True)
+    ratings = rate_players(data=pd.concat(list(sheets.values()), ignore_index=True), schema=schema)
+    return sheets, ratings
+
+@pytest.mark.parametrize("shrink", [False, True])
+def test_sql_matches_pandas(tmp_path, shrink):
+    stats = raw_stats()
+    source = tmp_path / "leagues.parquet"
+    stats.to_parquet(source, index=False)
+    schema = {group: FEATURES_SCHEMA[group] for group in GROUPS}
+    written = sql_scoring(source=str(source), normalize=True, output=tmp_path / "scoring", schema=schema, shrink=shrink)
+    sheets, ratings = pandas_scoring(stats, shrink=shrink)
+
+    for group, expected in sheets.items():
+        assert written[group] == len(expected)
+        actual = pd.read_parquet(tmp_path / "scoring" / f"{group}.parquet").set_index("Player").loc[expected["Player"]]
+        columns = [c for c in expected.columns if c not in NON_FEATURES]
+        np.testing.assert_allclose(actual[columns].to_numpy(dtype=float), expected[columns].to_numpy(dtype=float), rtol=1e-9, atol=1e-9)
+
+    actual = pd.read_parquet(tmp_path / "scoring" / "Ratings.parquet").set_index("Player").loc[ratings["Player"]]
+    columns = [c for c in ratings.columns if c.startswith(("Score.", "Percentile.")) or c == "Rating"]
+    np.testing.assert_allclose(actual[columns].to_numpy(dtype=float), ratings[columns].to_numpy(dtype=float), rtol=1e-9, atol=1e-9)
+
+@pytest.mark.parametrize("shrink", [False, True])
+def test_seasons_are_scored_apart(tmp_path, shrink):
+    seasons = [raw_stats(seed=1, date="2025-09-01"), raw_stats(n=80, seed=2, date="2026-09-01")]
+    source = tmp_path / "seasons.parquet"
+    pd.concat(seasons, ignore_index=True).to_parquet(source, index=False)
+    schema = {group: FEATURES_SCHEMA[group] for group in GROUPS}
+    sql_scoring(source=str(source), normalize=True, by=["Date"], output=tmp_path / "scoring", schema=schema, shrink=shrink)
+    # Each season on its own through the pandas scoring
+    ratings = pd.concat([pandas_scoring(stats, shrink=shrink)[1] for stats in seasons], ignore_index=True)
+
+    actual = pd.read_parquet(tmp_path / "scoring" / "Ratings.parquet").set_index("Player").loc[ratings["Player"]]
+    columns = [c for c in ratings.columns if c.startswith(("Score.", "Percentile.")) or c == "Rating"]
+    np.testing.assert_allclose(actual[columns].to_numpy(dtype=float), ratings[columns].to_numpy(dtype=float), rtol=1e-9, atol=1e-9)
+
+def test_totals_are_not_shrunk():
+    stats = raw_stats()
+    features = [c for c in stats.columns if c not in NON_FEATURES]
+    totals = [feature for feature in NON_COUNT_TOTALS if feature in features]
+    assert totals
+    expected = normalize_data(data=stats.copy(), features=features, shrink=True)
+    con = duckdb.connect()
+    con.register("stats", stats)
+    actual = con.execute(normalize_sql(source="stats", names=list(stats.columns), features=features, shrink=True, prior=SHRINK_PRIOR)).df()
+    con.close()
+    actual = actual.set_index("Player").loc[expected["Player"]]
+    # Totals are plain per-90 values in both engines, the event counts are shrunk alike
+    per_90 = stats[totals].div(stats["Playing_Time.90s"], axis=0)
+    np.testing.assert_allclose(expected[totals].to_numpy(dtype=float), per_90.to_numpy(dtype=float), rtol=1e-12)
+    np.testing.assert_allclose(actual[features].to_numpy(dtype=float), expected[features].to_numpy(dtype=float), rtol=1e-9, atol=1e-9)
@@ -0,0 +1,44 @@
+### Bootstrap confidence intervals ###
+# Imports
+import numpy as np
+import pandas as pd
+
+# Local imports
+from backend.metric_analyzation.uncertainty import bootstrap_intervals, noisy_features
+from environment.variable import FEATURES_SCHEMA, RATIO_FEATURES, NON_COUNT_TOTALS
+
+SCHEMA_FEATURES = {feature for group in FEATURES_SCHEMA.values() for features in group.values() for feature in features}
+
+def test_explicit_lists_name_schema_features():
+    assert set(RATIO_FEATURES) <= SCHEMA_FEATURES
+    assert set(NON_COUNT_TOTALS) <= SCHEMA_FEATURES
+
+def test_only_counted_events_are_resampled():
+    features = [
+        "stats_defense__Tackles.Tkl",
+        "stats_keeper_adv__Passes.Att_(GK)",
+        "stats_keeper_adv__Passes.AvgLen",
+        "stats_shooting__Standard.G/Sh",
+        "stats_keeper__Performance.GA90",
+        "stats_keeper__Performance.Save%",
+        "stats_passing__Total.PrgDist",
+        "Playing_Time.90s",
+    ]
+    assert noisy_features(features).tolist() == [True, True, False, False, False, False, False, False]
+
+def test_ratios_stay_fixed_and_counts_get_wider_with_fewer_minutes():
+    rng = np.random.default_rng(0)
+    n = 40
+    features = [f for features in FEATURES_SCHEMA["GK"].values() for f in features]
+    data = pd.DataFrame(rng.uniform(0.5, 5.0, (n, len(features))), columns=features)
+    data["Player"] = [f"P{i}" for i in range(n)]
+    data["Pos_group"] = "GK"
+    data["Playing_Time.90s"] = np.where(np.arange(n) % 2, 30.0, 3.0)
+    intervals = bootstrap_intervals(data=data, resamples=400, seed=1, schema={"GK": FEATURES_SCHEMA["GK"]})
+
+    ratio = "Pos_group.stats_keeper_adv__Passes.AvgLen"
+    assert np.allclose(intervals[f"CI_low.{ratio}"], intervals[f"CI_high.{ratio}"])
+    count = "Pos_group.stats_keeper_adv__Passes.Att_(GK)"
+    width = intervals[f"CI_high.{count}"] - intervals[f"CI_low.{count}"]
+    assert (width > 0).all()
+    assert width[data["Playing_Time.90s"] == 3.0].mean() > 2 * width[data["Playing_Time.90s"] == 30.0].mean()